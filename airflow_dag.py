@@ -1,11 +1,26 @@
 import os
+import shutil
 import logging
+import tempfile
+import numpy as np
+import pandas as pd
 from airflow import DAG
 from airflow.operators.python_operator import PythonOperator
 from airflow.operators.dummy_operator import DummyOperator
 from airflow.operators.email_operator import EmailOperator
 from datetime import datetime, timedelta
-from recommendation_model import load_data, build_interaction_matrix, train_nmf_model
+from recommendation_model import (load_data, build_interaction_matrix, build_interaction_matrix_on_disk,
+                                  train_nmf_model, export_model_artifact, remap_factors, train_nmf_grid,
+                                  precompute_top_n)
+from model_artifact import (load_model_artifact, save_model_artifact, add_artifact_arrays, publish_version,
+                            publish_lock, resolve_latest_version, blocklist_arrays, StalePublishError, LATEST_POINTER)
+from fold_in import fold_in_log, fold_in_log_arrays, apply_fold_in_log, fold_in_interactions
+from ann_index import build_ivf_index
+from minibatch_nmf import train_minibatch_nmf, save_interaction_matrix, open_interaction_matrix
+from evaluation import holdout_split, split_matrices, evaluate_ranking, metric_regressions
+from artifact_store import (get_artifact_store, store_artifact_version, replicate_version, apply_retention,
+                            prune_artifact_dir, ensure_local_version, load_version_manifest, has_version,
+                            S3ArtifactStore)
 import boto3
 
 # Initialize logging for the Airflow DAG
@@ -31,67 +46,338 @@ dag = DAG(
 )
 
 
-# Function to update the recommendation model
+# Warm-start factors from the given model version, remapped to the current ids (None if unusable)
+def previous_factors(artifact_dir, n_components, user_ids, item_ids, version):
+    try:
+        previous = load_model_artifact(artifact_dir, version)
+    except FileNotFoundError:
+        logging.info("No previous model artifact found; training from scratch.")
+        return None
+    if previous.item_features.shape[0] != n_components:
+        logging.info(f"Previous model has {previous.item_features.shape[0]} components; training from scratch.")
+        return None
+    logging.info(f"Warm-starting from model version {previous.version}.")
+    return remap_factors(previous.user_features, previous.item_features, previous.user_ids, previous.item_ids,
+                         user_ids, item_ids)
+
+
+# Grid of (n_components, alpha_W) settings from NMF_GRID_COMPONENTS / NMF_GRID_ALPHAS, e.g. "10,15,20"
+def grid_configs():
+    components = [int(c) for c in os.getenv('NMF_GRID_COMPONENTS', '').split(',') if c.strip()]
+    alphas = [float(a) for a in os.getenv('NMF_GRID_ALPHAS', '0.0').split(',') if a.strip()]
+    return [{'n_components': c, 'alpha_W': a} for c in components for a in alphas]
+
+
+# For the minibatch trainer, spill the interaction matrix to matrix_dir and return a memory-mapped copy.
+# Callers rebind their variable to the result, so no in-memory copy stays referenced during training.
+def spill_interaction_matrix(interaction_matrix, matrix_dir):
+    if os.getenv('NMF_TRAINER', 'sklearn') != 'minibatch':
+        return interaction_matrix
+    return open_interaction_matrix(save_interaction_matrix(interaction_matrix, matrix_dir))
+
+
+# Train with the configured trainer: sklearn NMF in memory, or the out-of-core minibatch trainer, which reads the
+# spilled matrix and writes the user factors to a memory-mapped file in matrix_dir
+def train_model(interaction_matrix, n_components, init_factors, max_iter, matrix_dir):
+    if os.getenv('NMF_TRAINER', 'sklearn') == 'minibatch':
+        return train_minibatch_nmf(interaction_matrix, n_components, init_factors=init_factors,
+                                   user_features_path=os.path.join(matrix_dir, 'user_features.npy'))
+    return train_nmf_model(interaction_matrix, n_components, init_factors=init_factors, max_iter=max_iter)
+
+
+# Train the way the daily run does: the configured trainer, warm-started from previous_version (if any) when
+# enabled, with warm-started runs capped at NMF_WARM_START_MAX_ITER. Returns (model, user_features, item_features,
+# warm_start).
+def train_production_model(interaction_matrix, user_ids, item_ids, n_components, artifact_dir, matrix_dir,
+                           previous_version):
+    init_factors = None
+    max_iter = 200
+    if previous_version is not None and os.getenv('NMF_WARM_START', 'True') == 'True':
+        init_factors = previous_factors(artifact_dir, n_components, user_ids, item_ids, previous_version)
+    if init_factors is not None:
+        # sklearn's stopping rule is relative to the initial error, so cap warm-started runs explicitly
+        max_iter = int(os.getenv('NMF_WARM_START_MAX_ITER', 20))
+    logging.info(f"Training NMF model with {n_components} components...")
+    model, user_features, item_features = train_model(interaction_matrix, n_components, init_factors, max_iter,
+                                                      matrix_dir)
+    return model, user_features, item_features, init_factors is not None
+
+
+# Manifest of the version the earlier tasks stored; only this small dict travels through XCom
+def pulled_manifest(kwargs, task_id):
+    manifest = kwargs['ti'].xcom_pull(task_ids=task_id)
+    if not manifest or 'version' not in manifest:
+        raise ValueError(f"No artifact manifest received from {task_id}.")
+    return manifest
+
+
+# Open the version a previous task stored; tasks may run on other workers, so it is restored from the artifact store
+# when this worker's MODEL_ARTIFACT_DIR does not hold an identical copy
+def local_artifact(artifact_dir, manifest):
+    ensure_local_version(get_artifact_store(), manifest, artifact_dir)
+    return load_model_artifact(artifact_dir, manifest['version'])
+
+
+# Make an earlier version (warm start, evaluation baseline) available locally when the store has it
+def restore_stored_version(artifact_dir, version):
+    store = get_artifact_store()
+    if version is not None and has_version(store, version):
+        ensure_local_version(store, load_version_manifest(store, version), artifact_dir)
+
+
+# Interactions folded into the given version since its last full retrain (empty without a version)
+def previous_fold_ins(artifact_dir, version):
+    if version is None:
+        return None
+    return fold_in_log(load_model_artifact(artifact_dir, version))
+
+
+# Read a blocklist file (one raw item id per line) as ids of the same type as the model's item ids
+def read_blocklist(path, item_ids):
+    with open(path) as f:
+        lines = [line.strip() for line in f if line.strip()]
+    return np.asarray(lines).astype(item_ids.dtype)
+
+
+# Function to update the recommendation model; returns the stored artifact manifest (hashes, paths, shapes)
 def update_model():
+    matrix_dir = tempfile.mkdtemp(prefix='nmf-matrix-')
     try:
-        # Load behavior data from environment variable or default path
         data_path = os.getenv('BEHAVIOR_DATA_PATH', 'path_to_your_data.csv')
-        logging.info(f"Loading behavior data from {data_path}...")
-        behavior_data = load_data(data_path)
+        metadata = {'data_path': data_path}
+        artifact_dir = os.getenv('MODEL_ARTIFACT_DIR', 'model_artifacts')
+        if os.path.exists(os.path.join(artifact_dir, LATEST_POINTER)):
+            metadata['previous_version'] = resolve_latest_version(artifact_dir)
 
-        # Build interaction matrix
-        interaction_matrix = build_interaction_matrix(behavior_data)
+        # Interactions folded in since the last retrain are not in the source data; merge them in so the new
+        # version keeps them, and carry the rows the source data does not contain yet into its fold-in log
+        fold_ins = previous_fold_ins(artifact_dir, metadata.get('previous_version'))
+        if os.getenv('NMF_TRAINER', 'sklearn') == 'minibatch':
+            # Out of core: chunked CSV reads go straight into a memory-mapped matrix, so neither the raw rows nor
+            # the full matrix are ever held in memory
+            interaction_matrix, user_ids, item_ids, redundant = build_interaction_matrix_on_disk(
+                data_path, matrix_dir, fold_ins)
+            if fold_ins is not None:
+                fold_ins = fold_ins[~redundant]
+        else:
+            # Load behavior data and build the interaction matrix; the raw rows are not needed afterwards
+            logging.info(f"Loading behavior data from {data_path}...")
+            behavior_data = load_data(data_path)
+            interaction_matrix, user_ids, item_ids = build_interaction_matrix(behavior_data)
+            del behavior_data
+            if fold_ins is not None and not fold_ins.empty:
+                interaction_matrix, user_ids, item_ids, fold_ins = apply_fold_in_log(interaction_matrix, user_ids,
+                                                                                     item_ids, fold_ins)
+        extra_arrays = {}
+        if fold_ins is not None and not fold_ins.empty:
+            extra_arrays.update(fold_in_log_arrays(fold_ins))
 
-        # Train NMF model with configurable components
+        # Optionally compare a grid of ranks/regularization settings before the main training run
+        configs = grid_configs()
+        if configs:
+            metadata['grid_report'] = train_nmf_grid(interaction_matrix, configs)
+
+        # Train NMF model with configurable components, warm-started from yesterday's factors when possible
         n_components = int(os.getenv('NMF_COMPONENTS', 15))  # Default to 15 components
-        logging.info(f"Training NMF model with {n_components} components...")
-        model, user_features, item_features = train_nmf_model(interaction_matrix, n_components)
+        model, user_features, item_features, metadata['warm_start'] = train_production_model(
+            interaction_matrix, user_ids, item_ids, n_components, artifact_dir, matrix_dir,
+            metadata.get('previous_version'))
+        metadata['trainer'] = os.getenv('NMF_TRAINER', 'sklearn')
+
+        # Optionally build an approximate nearest-neighbour index over the item factors
+        ann_lists = int(os.getenv('ANN_INDEX_LISTS', 0))  # 0 disables the index
+        if ann_lists > 0:
+            extra_arrays.update(build_ivf_index(item_features, n_lists=ann_lists))
+
+        # Optionally store a global blocklist (one item id per line) that serving never recommends
+        blocklist_path = os.getenv('BLOCKLIST_PATH')
+        if blocklist_path:
+            blocked_ids = read_blocklist(blocklist_path, item_ids)
+            extra_arrays.update(blocklist_arrays(item_ids, blocked_ids))
+            metadata['blocklisted_items'] = int(np.isin(item_ids, blocked_ids).sum())
+
+        # Write the new version without publishing it: serving workers watch LATEST, so it only moves once
+        # validation and precomputation have succeeded (publish_model_task)
+        version = export_model_artifact(artifact_dir, model, user_features, item_features, user_ids, item_ids,
+                                        metadata=metadata, extra_arrays=extra_arrays,
+                                        interaction_matrix=interaction_matrix, publish=False)
 
+        # Hand the version to the next tasks through the content-addressed store instead of pickled arrays
+        manifest = store_artifact_version(get_artifact_store(), artifact_dir, version)
         logging.info("Model updated successfully.")
-        return model, user_features, item_features
+        return manifest
     except Exception as e:
         logging.error(f"Error occurred while updating the model: {e}")
         raise
+    finally:
+        shutil.rmtree(matrix_dir, ignore_errors=True)
 
 
-# Function to validate the recommendation model
+# Function to validate the recommendation model on held-out interactions; fails the run if ranking metrics regress
 def validate_model(**kwargs):
-    model, user_features, item_features = kwargs['ti'].xcom_pull(task_ids='update_model_task')
-    # Implement validation logic here, e.g., cross-validation or testing with a holdout set
     logging.info("Validating the model...")
-    validation_score = model.reconstruction_err_  # Example: Use reconstruction error as a validation metric
-    logging.info(f"Model validation score: {validation_score}")
+    manifest = pulled_manifest(kwargs, 'update_model_task')
+    artifact_dir = os.getenv('MODEL_ARTIFACT_DIR', 'model_artifacts')
+    artifact = local_artifact(artifact_dir, manifest)
+    previous_version = artifact.manifest['metadata'].get('previous_version')
+    restore_stored_version(artifact_dir, previous_version)
+    behavior_data = load_data(os.getenv('BEHAVIOR_DATA_PATH', 'path_to_your_data.csv'))
+    train_df, test_df = holdout_split(behavior_data, float(os.getenv('EVAL_TEST_FRACTION', 0.2)),
+                                      os.getenv('EVAL_SPLIT', 'random'))
+    train_matrix, test_matrix, train_user_ids, train_item_ids = split_matrices(train_df, test_df)
+    del behavior_data, train_df, test_df
+    # The shipped model also trained on the folded-in interactions; they only ever join the train side
+    fold_ins = previous_fold_ins(artifact_dir, previous_version)
+    if fold_ins is not None and not fold_ins.empty:
+        train_matrix, train_user_ids, train_item_ids, _ = apply_fold_in_log(train_matrix, train_user_ids,
+                                                                            train_item_ids, fold_ins)
+        test_matrix.resize(train_matrix.shape)
 
+    # The new model was trained on the held-out rows too, so scoring it on them would leak. Instead, score a model
+    # trained on the train split with the configured trainer. It starts cold: every earlier version was trained on
+    # data that includes the held-out rows (always with the random split), so warm-starting from one would leak too.
+    matrix_dir = tempfile.mkdtemp(prefix='nmf-eval-matrix-')
+    try:
+        train_matrix = spill_interaction_matrix(train_matrix, matrix_dir)
+        logging.info("Training the evaluation model on the train split from a cold start...")
+        model, user_features, item_features = train_model(train_matrix, artifact.item_features.shape[0], None,
+                                                          int(os.getenv('EVAL_MAX_ITER', 200)), matrix_dir)
+        metrics = evaluate_ranking(user_features, item_features, train_matrix, test_matrix,
+                                   k=int(os.getenv('EVAL_K', 10)),
+                                   sample_users=int(os.getenv('EVAL_SAMPLE_USERS', 0)) or None)
+    finally:
+        shutil.rmtree(matrix_dir, ignore_errors=True)
+    metrics['reconstruction_err'] = float(model.reconstruction_err_)
+    metrics['init'] = 'cold'
+    add_artifact_arrays(artifact_dir, artifact.version, {}, metadata={'evaluation': metrics})
+    logging.info(f"Model validation metrics: {metrics}")
+    check_ranking_regression(artifact_dir, artifact, metrics)
+    return store_artifact_version(get_artifact_store(), artifact_dir, artifact.version, previous=manifest)
 
-# Function to backup model and interaction matrix to S3
-def backup_model_to_s3(**kwargs):
-    s3_client = boto3.client('s3')
-    model, user_features, item_features = kwargs['ti'].xcom_pull(task_ids='update_model_task')
 
+# Fail the run when ranking metrics regressed beyond the threshold; the new version is then never published
+def check_ranking_regression(artifact_dir, artifact, metrics):
+    previous_version = artifact.manifest['metadata'].get('previous_version')
+    if previous_version is None:
+        return
+    baseline = load_model_artifact(artifact_dir, previous_version).manifest['metadata'].get('evaluation')
+    # Baselines from another protocol (e.g. a leaky warm-started evaluation) are not comparable
+    if not baseline or baseline.get('k') != metrics['k'] or baseline.get('init') != metrics['init']:
+        logging.info(f"Version {previous_version} has no comparable evaluation; skipping the regression check.")
+        return
+    regressions = metric_regressions(metrics, baseline, float(os.getenv('EVAL_REGRESSION_THRESHOLD', 0.05)))
+    if regressions:
+        raise ValueError(f"Ranking metrics regressed against version {previous_version}: {regressions}. "
+                         f"Version {artifact.version} is not published.")
+
+
+# Function to precompute every user's top-N items into the validated artifact version
+def precompute_recommendations(**kwargs):
+    try:
+        manifest = pulled_manifest(kwargs, 'validate_model_task')
+        artifact_dir = os.getenv('MODEL_ARTIFACT_DIR', 'model_artifacts')
+        artifact = local_artifact(artifact_dir, manifest)
+        top_n = int(os.getenv('PRECOMPUTE_TOP_N', 100))
+        block_size = int(os.getenv('PRECOMPUTE_BLOCK_SIZE', 1024))
+        # Precomputed lists already skip seen and blocklisted items, like live scoring
+        seen = None
+        if os.getenv('EXCLUDE_SEEN_ITEMS', 'True') == 'True' and artifact.interactions is not None:
+            _, indices, indptr = artifact.interactions
+            seen = (indptr, indices)
+        table = precompute_top_n(artifact.user_features, artifact.item_features, top_n, block_size,
+                                 seen=seen, blocked=artifact.blocked_items)
+        add_artifact_arrays(artifact_dir, artifact.version, table, metadata={'precomputed_top_n': top_n})
+        logging.info(f"Precomputed top-{top_n} table stored with model version {artifact.version}.")
+        # Only the new table files are added to the store; unchanged files keep their hashes
+        return store_artifact_version(get_artifact_store(), artifact_dir, artifact.version, previous=manifest)
+    except Exception as e:
+        logging.error(f"Error occurred while precomputing recommendations: {e}")
+        raise
+
+
+# Fold the interactions published by fold-ins since `base_version` into the new version and store the result.
+# Only a chain of fold-ins on top of the version this run trained from can be merged; any other change to LATEST
+# (another retrain, a rollback) fails the run instead of being overwritten.
+def merge_concurrent_fold_ins(artifact_dir, manifest, base_version, latest_version):
+    version = latest_version
+    while version != base_version:
+        parent = None
+        if version is not None:
+            parent = load_model_artifact(artifact_dir, version).manifest['metadata'].get('parent_version')
+        if parent is None:
+            raise StalePublishError(f"LATEST moved from {base_version} to {latest_version}, which is not a fold-in "
+                                    f"on top of it; version {manifest['version']} was not published.")
+        version = parent
+
+    # Rows logged since the base version, i.e. the ones this run did not train on
+    logged = fold_in_log(load_model_artifact(artifact_dir, latest_version))
+    trained = previous_fold_ins(artifact_dir, base_version)
+    if trained is not None:
+        logged = logged[~pd.MultiIndex.from_frame(logged).isin(pd.MultiIndex.from_frame(trained))]
+    if logged.empty:
+        return manifest
+    logging.info(f"Merging {len(logged)} interactions folded in since version {base_version}...")
+    artifact = load_model_artifact(artifact_dir, manifest['version'])
+    arrays, metadata, _ = fold_in_interactions(artifact, logged)
+    metadata['merged_fold_ins_from'] = latest_version
+    version = save_model_artifact(artifact_dir, arrays, metadata=metadata, publish=False)
+    return store_artifact_version(get_artifact_store(), artifact_dir, version)
+
+
+# Function to publish the validated version with its precomputed table; serving workers pick it up from LATEST
+def publish_model(**kwargs):
+    try:
+        manifest = pulled_manifest(kwargs, 'precompute_recommendations_task')
+        artifact_dir = os.getenv('MODEL_ARTIFACT_DIR', 'model_artifacts')
+        # The serving directory needs the complete version before the pointer moves to it
+        artifact = local_artifact(artifact_dir, manifest)
+        base_version = artifact.manifest['metadata'].get('previous_version')
+        # Fold-ins publish under the same lock, so none can land between the merge and the pointer update
+        with publish_lock(artifact_dir):
+            latest_version = None
+            if os.path.exists(os.path.join(artifact_dir, LATEST_POINTER)):
+                latest_version = resolve_latest_version(artifact_dir)
+            if latest_version != base_version:
+                manifest = merge_concurrent_fold_ins(artifact_dir, manifest, base_version, latest_version)
+            publish_version(artifact_dir, manifest['version'], expected_latest=latest_version)
+        return manifest
+    except Exception as e:
+        logging.error(f"Error occurred while publishing the model: {e}")
+        raise
+
+
+# S3 backup store for the artifact blobs
+def backup_store():
+    bucket_name = os.getenv('S3_BUCKET_NAME', 'your-bucket-name')
+    return S3ArtifactStore(boto3.client('s3'), bucket_name, os.getenv('S3_BACKUP_PREFIX', 'backups'))
+
+
+# Function to backup the model artifact (factors, id mappings, interaction matrix, tables) to S3
+def backup_model_to_s3(**kwargs):
+    manifest = pulled_manifest(kwargs, 'publish_model_task')
     try:
-        # Convert model components to byte format and upload to S3
-        bucket_name = os.getenv('S3_BUCKET_NAME', 'your-bucket-name')
-        model_backup_path = 'backups/model_backup.pkl'
-        interaction_backup_path = 'backups/interaction_matrix_backup.csv'
-
-        # Example backup of model as pkl
-        s3_client.put_object(Bucket=bucket_name, Key=model_backup_path, Body=str(model))
-        logging.info(f"Model backed up to S3: {model_backup_path}")
-
-        # Example backup of user-item interaction matrix as CSV
-        interaction_matrix = kwargs['ti'].xcom_pull(task_ids='update_model_task')[1]  # interaction_matrix
-        interaction_matrix.to_csv(interaction_backup_path)
-        s3_client.upload_file(interaction_backup_path, bucket_name, interaction_backup_path)
-        logging.info(f"Interaction matrix backed up to S3: {interaction_backup_path}")
+        # Blobs are uploaded in parallel; those already in the bucket (same hash) are skipped
+        copied = replicate_version(get_artifact_store(), backup_store(), manifest)
+        logging.info(f"Model version {manifest['version']} backed up to S3 ({copied} new blobs).")
     except Exception as e:
         logging.error(f"Error occurred while backing up to S3: {e}")
         raise
 
 
-# Function to clean up old models
+# Function to clean up old models: keeps the newest versions and the rollback target, drops expired ones
 def cleanup_old_models():
     logging.info("Cleaning up old models...")
-    # Implement logic to remove outdated models or archives from storage
+    try:
+        artifact_dir = os.getenv('MODEL_ARTIFACT_DIR', 'model_artifacts')
+        latest = load_model_artifact(artifact_dir)
+        protected = {latest.version, latest.manifest['metadata'].get('previous_version')} - {None}
+        kept = prune_artifact_dir(artifact_dir, protected=protected)
+        apply_retention(get_artifact_store(), protected=protected)
+        apply_retention(backup_store(), protected=protected)
+        logging.info(f"Retained model versions: {kept}")
+    except Exception as e:
+        logging.error(f"Error occurred while cleaning up old models: {e}")
+        raise
 
 
 # Dummy start task
@@ -116,6 +402,22 @@ validate_model_task = PythonOperator(
     dag=dag,
 )
 
+# Task to precompute the top-N recommendation table served by the API and Lambda
+precompute_recommendations_task = PythonOperator(
+    task_id='precompute_recommendations_task',
+    python_callable=precompute_recommendations,
+    provide_context=True,
+    dag=dag,
+)
+
+# Task to publish the validated version to the serving processes
+publish_model_task = PythonOperator(
+    task_id='publish_model_task',
+    python_callable=publish_model,
+    provide_context=True,
+    dag=dag,
+)
+
 # Task to back up the model and interaction matrix to S3
 backup_model_task = PythonOperator(
     task_id='backup_model_task',
@@ -141,4 +443,4 @@ notify_success_task = EmailOperator(
 )
 
 # Task dependencies
-start_task >> update_model_task >> validate_model_task >> backup_model_task >> cleanup_old_models_task >> notify_success_task
+start_task >> update_model_task >> validate_model_task >> precompute_recommendations_task >> publish_model_task >> backup_model_task >> cleanup_old_models_task >> notify_success_task
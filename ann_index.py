@@ -0,0 +1,125 @@
+import logging
+import numpy as np
+from scoring import EXCLUDED_SCORE, select_top_k
+
+# Initialize logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Array names under which the index is stored inside a model artifact
+IVF_ARRAYS = ('ivf_centroids', 'ivf_offsets', 'ivf_items', 'ivf_vectors')
+
+# Rows per block when assigning points to centroids, to bound the distance matrix size
+ASSIGN_BLOCK_SIZE = 65536
+
+
+# Append sqrt(M^2 - |x|^2) to each item so maximum inner product becomes nearest neighbour search
+def _augment_items(item_vectors):
+    norms_sq = np.einsum('ij,ij->i', item_vectors, item_vectors)
+    extra = np.sqrt(np.maximum(norms_sq.max() - norms_sq, 0.0))
+    return np.hstack([item_vectors, extra[:, None]]).astype(np.float32)
+
+
+# Assign each point to its nearest centroid (squared L2), block by block
+def _assign(points, centroids):
+    centroid_norms = np.einsum('ij,ij->i', centroids, centroids)
+    assignments = np.empty(points.shape[0], dtype=np.int32)
+    for start in range(0, points.shape[0], ASSIGN_BLOCK_SIZE):
+        block = points[start:start + ASSIGN_BLOCK_SIZE]
+        distances = centroid_norms[None, :] - 2.0 * np.dot(block, centroids.T)
+        assignments[start:start + ASSIGN_BLOCK_SIZE] = distances.argmin(axis=1)
+    return assignments
+
+
+# Plain NumPy Lloyd's k-means; empty clusters are re-seeded from random points
+def _kmeans(points, n_clusters, n_iter, rng):
+    centroids = points[rng.choice(points.shape[0], n_clusters, replace=False)].copy()
+    for _ in range(n_iter):
+        assignments = _assign(points, centroids)
+        counts = np.bincount(assignments, minlength=n_clusters)
+        sums = np.empty_like(centroids)
+        for dim in range(points.shape[1]):
+            sums[:, dim] = np.bincount(assignments, weights=points[:, dim], minlength=n_clusters)
+        empty = counts == 0
+        centroids[~empty] = sums[~empty] / counts[~empty, None]
+        if empty.any():
+            centroids[empty] = points[rng.choice(points.shape[0], int(empty.sum()), replace=False)]
+    return centroids
+
+
+# Build an IVF index over the item factors (item_features is components x items, as returned by NMF)
+def build_ivf_index(item_features, n_lists=None, n_iter=20, sample_size=None, seed=42):
+    try:
+        item_vectors = np.ascontiguousarray(np.asarray(item_features).T, dtype=np.float32)
+        n_items = item_vectors.shape[0]
+        n_lists = min(n_lists or max(1, int(np.sqrt(n_items))), n_items)
+        logging.info(f"Building IVF index with {n_lists} lists over {n_items} items...")
+
+        augmented = _augment_items(item_vectors)
+        rng = np.random.default_rng(seed)
+
+        # Train the centroids on a sample, then assign every item to its list
+        sample_size = min(sample_size or 256 * n_lists, n_items)
+        sample = augmented[rng.choice(n_items, sample_size, replace=False)]
+        centroids = _kmeans(sample, n_lists, n_iter, rng)
+        assignments = _assign(augmented, centroids)
+
+        # Store the lists contiguously: items grouped by list, with CSR-style offsets
+        order = np.argsort(assignments, kind='stable')
+        offsets = np.zeros(n_lists + 1, dtype=np.int64)
+        np.cumsum(np.bincount(assignments, minlength=n_lists), out=offsets[1:])
+        logging.info("IVF index build complete.")
+        return {
+            'ivf_centroids': centroids,
+            'ivf_offsets': offsets,
+            'ivf_items': order.astype(np.int32),
+            'ivf_vectors': item_vectors[order],
+        }
+    except Exception as e:
+        logging.error(f"An error occurred while building the IVF index: {e}")
+        raise
+
+
+# Return the IVF index stored in a model artifact, or None if it was built without one
+def ivf_index_from_artifact(artifact):
+    if not all(name in artifact.arrays for name in IVF_ARRAYS):
+        return None
+    return {name: artifact.arrays[name] for name in IVF_ARRAYS}
+
+
+# Approximate top-k items for one user vector; more probes trade latency for recall
+def search_ivf_index(index, user_vector, k=10, n_probe=8, seen_items=None, blocked=None):
+    if k <= 0 or n_probe <= 0:
+        raise ValueError("k and n_probe must be positive integers.")
+    centroids = index['ivf_centroids']
+    offsets = index['ivf_offsets']
+    user_vector = np.asarray(user_vector, dtype=np.float32)
+
+    # The query's augmented coordinate is 0, so only the first d centroid dimensions matter
+    centroid_scores = np.dot(centroids[:, :-1], user_vector)
+    probes = select_top_k(centroid_scores, n_probe)
+
+    candidate_items = []
+    candidate_scores = []
+    for list_id in probes:
+        start, end = offsets[list_id], offsets[list_id + 1]
+        if start == end:
+            continue
+        candidate_items.append(index['ivf_items'][start:end])
+        candidate_scores.append(np.dot(index['ivf_vectors'][start:end], user_vector))
+    if not candidate_items:
+        return np.empty(0, dtype=np.int32)
+
+    candidate_items = np.concatenate(candidate_items)
+    candidate_scores = np.concatenate(candidate_scores)
+    # Seen and blocklisted items are masked among the candidates only
+    if blocked is not None:
+        np.copyto(candidate_scores, EXCLUDED_SCORE, where=blocked[candidate_items])
+    if seen_items is not None and len(seen_items):
+        candidate_scores[np.isin(candidate_items, seen_items)] = EXCLUDED_SCORE
+    top = select_top_k(candidate_scores, k)
+    return candidate_items[top[candidate_scores[top] > EXCLUDED_SCORE]]
+
+
+# Approximate top-k for the given users of a factor matrix
+def search_ivf_index_batch(index, user_features, user_ids, k=10, n_probe=8):
+    return [search_ivf_index(index, user_features[user_id], k, n_probe) for user_id in user_ids]
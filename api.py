@@ -1,58 +1,62 @@
 import os
+import time
 import logging
+import pandas as pd
 from flask import Flask, request, jsonify
-from recommendation_model import get_recommendations, load_data, train_nmf_model
+from model_artifact import load_model_artifact, StalePublishError
+from fold_in import publish_fold_in
+from serving import (MicroBatcher, get_model_artifact, set_model_artifact, parse_recommend_request,
+                     recommend_for_user, cached_recommend, recommendation_cache)
+from model_registry import get_model_registry
+from monitoring import log_latency
+from profiling import stage_timer, traced_request
 
 # Initialize logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
 app = Flask(__name__)
 
-# Global variables for user-item matrix and model components
-interaction_matrix = None
-user_features = None
-item_features = None
-model = None
+# Concurrent requests that need live scoring are batched into one matrix multiply when enabled
+batcher = MicroBatcher() if os.getenv('MICRO_BATCHING', 'False') == 'True' else None
 
+# Watches the published version and hot-swaps it in the background; started at import so that each worker
+# process (and its main thread, for the SIGHUP handler) gets its own
+registry = get_model_registry()
 
-# Load data and train model (Lazy loading on first request)
-def initialize_model():
-    global interaction_matrix, user_features, item_features, model
-    if interaction_matrix is None or user_features is None or item_features is None:
-        try:
-            # Load data from environment variable or default path
-            data_path = os.getenv('BEHAVIOR_DATA_PATH', 'path_to_your_data.csv')
-            logging.info(f"Loading behavior data from {data_path}...")
-            interaction_matrix = load_data(data_path)
 
-            # Train NMF model with configurable components
-            n_components = int(os.getenv('NMF_COMPONENTS', 15))  # Default to 15 components
-            logging.info(f"Training NMF model with {n_components} components...")
-            model, user_features, item_features = train_nmf_model(interaction_matrix, n_components)
-            logging.info("Model training complete.")
-        except Exception as e:
-            logging.error(f"Error initializing model: {e}")
-            raise
+# Open the published model artifact (Lazy loading on first request, exactly once across threads)
+def initialize_model():
+    try:
+        # Memory-map the artifact written by the training pipeline instead of retraining here
+        return get_model_artifact()
+    except Exception as e:
+        logging.error(f"Error initializing model: {e}")
+        raise
 
 
 # Route to get recommendations for a user
 @app.route('/recommend', methods=['POST'])
+@traced_request('recommend')
 def recommend():
+    start = time.perf_counter()
     try:
-        # Initialize the model if not already loaded
-        initialize_model()
+        # Initialize the model if not already loaded; the whole request uses this one model version
+        artifact = initialize_model()
 
         # Validate incoming request
-        if not request.is_json or 'user_id' not in request.json:
-            return jsonify({'error': 'Invalid request format. Must provide user_id in JSON format.'}), 400
-
-        user_id = request.json['user_id']
-        if not isinstance(user_id, int) or user_id < 0:
-            return jsonify({'error': 'Invalid user_id. It must be a non-negative integer.'}), 400
+        try:
+            user_id, k, n_probe = parse_recommend_request(request.get_json(silent=True))
+        except ValueError as e:
+            return jsonify({'error': str(e)}), 400
 
-        # Get recommendations
-        recommendations = get_recommendations(user_features, item_features, user_id)
-        return jsonify({'recommendations': recommendations.tolist()}), 200
+        # Get the top-k recommendations from the cache, the precomputed table or live scoring
+        recommend_uncached = batcher.recommend if batcher is not None else recommend_for_user
+        recommendations = cached_recommend(artifact, user_id, k, n_probe, recommend_uncached)
+        # Buffered and aggregated in process, so recording every request adds no network round trip
+        log_latency(time.perf_counter() - start)
+        with stage_timer('serialize'):
+            response = jsonify({'recommendations': recommendations.tolist()})
+        return response, 200
 
     except IndexError:
         logging.error(f"User ID {user_id} is out of bounds.")
@@ -62,6 +66,64 @@ def recommend():
         return jsonify({'error': 'An internal error occurred while processing your request.'}), 500
 
 
+# Route to fold new interactions into the live model without a restart
+@app.route('/admin/fold_in', methods=['POST'])
+def fold_in():
+    try:
+        initialize_model()
+
+        if not request.is_json or not isinstance(request.json.get('interactions'), list):
+            return jsonify({'error': 'Invalid request format. Must provide a list of interactions in JSON format.'}), 400
+        new_interactions = pd.DataFrame(request.json['interactions'])
+        refresh_passes = request.json.get('refresh_passes', 0)
+        if not isinstance(refresh_passes, int) or isinstance(refresh_passes, bool) or refresh_passes < 0:
+            return jsonify({'error': 'Invalid refresh_passes. It must be a non-negative integer.'}), 400
+
+        # Folds into the published version (not this worker's copy) under a lock shared by all workers
+        artifact_dir = os.getenv('MODEL_ARTIFACT_DIR', 'model_artifacts')
+        version, user_rows = publish_fold_in(artifact_dir, new_interactions, refresh_passes=refresh_passes)
+        # Swap in the new version; requests already running keep the artifact they started with
+        set_model_artifact(load_model_artifact(artifact_dir, version))
+
+        return jsonify({
+            'version': version,
+            'users': [{'user_id': raw_id, 'row': row} for raw_id, row in user_rows.items()],
+        }), 200
+
+    except StalePublishError as e:
+        logging.error(f"Fold-in was not published: {e}")
+        return jsonify({'error': str(e)}), 409
+    except ValueError as e:
+        logging.error(f"Invalid fold-in request: {e}")
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        logging.error(f"An error occurred while folding in interactions: {e}")
+        return jsonify({'error': 'An internal error occurred while processing your request.'}), 500
+
+
+# Route to inspect the served model version and recent hot swaps
+@app.route('/admin/model', methods=['GET'])
+def model_status():
+    return jsonify(registry.status()), 200
+
+
+# Route to reload the published model version now, without waiting for the next poll
+@app.route('/admin/model/reload', methods=['POST'])
+def reload_model():
+    try:
+        swap = registry.reload()
+        return jsonify({'swap': swap, 'status': registry.status()}), 200
+    except Exception as e:
+        logging.error(f"An error occurred while reloading the model: {e}")
+        return jsonify({'error': 'An internal error occurred while reloading the model.'}), 500
+
+
+# Route to inspect the recommendation cache counters
+@app.route('/admin/cache', methods=['GET'])
+def cache_stats():
+    return jsonify(recommendation_cache.stats()), 200
+
+
 if __name__ == '__main__':
     # Get host and port from environment variables
     host = os.getenv('FLASK_RUN_HOST', '0.0.0.0')  # Default to running on all interfaces
@@ -0,0 +1,338 @@
+import os
+import json
+import shutil
+import hashlib
+import logging
+import tempfile
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime, timedelta, timezone
+from botocore.exceptions import ClientError
+from model_artifact import MANIFEST_FILE, list_versions, delete_version, resolve_latest_version, LATEST_POINTER
+
+# Initialize logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Store location: a local directory, or s3://bucket/prefix
+ARTIFACT_STORE_URI = os.getenv('ARTIFACT_STORE_URI', 'artifact_store')
+
+# Parallel hashing and blob transfers
+ARTIFACT_STORE_WORKERS = int(os.getenv('ARTIFACT_STORE_WORKERS', 8))
+
+# Retention: the newest N versions are always kept, older ones only while younger than the age limit
+ARTIFACT_RETENTION_VERSIONS = int(os.getenv('ARTIFACT_RETENTION_VERSIONS', 7))
+ARTIFACT_RETENTION_DAYS = float(os.getenv('ARTIFACT_RETENTION_DAYS', 30))
+
+# Unreferenced blobs younger than this may belong to a version that is still being stored, so they are kept
+BLOB_GRACE_PERIOD = timedelta(hours=6)
+
+# Bytes read per hashing step
+HASH_CHUNK_SIZE = 8 * 1024 * 1024
+
+# Store layout: blobs/<first two hex digits>/<sha256> and versions/<version>.json
+BLOB_PREFIX = 'blobs/'
+VERSION_PREFIX = 'versions/'
+
+
+# Content-addressed store on a local directory
+class LocalArtifactStore:
+    def __init__(self, root):
+        self.root = root
+
+    def path_for(self, key):
+        return os.path.join(self.root, *key.split('/'))
+
+    def exists(self, key):
+        return os.path.exists(self.path_for(key))
+
+    def put_file(self, key, source_path):
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        # Copy next to the target and rename, so a blob is either complete or absent
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        shutil.copyfile(source_path, tmp_path)
+        os.replace(tmp_path, path)
+
+    def get_file(self, key, destination_path):
+        shutil.copyfile(self.path_for(key), destination_path)
+
+    def put_bytes(self, key, data):
+        path = self.path_for(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        tmp_path = f"{path}.tmp-{os.getpid()}"
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+        os.replace(tmp_path, path)
+
+    def get_bytes(self, key):
+        with open(self.path_for(key), 'rb') as f:
+            return f.read()
+
+    # (key, last modified UTC datetime) for every key under the prefix
+    def list_keys(self, prefix):
+        base = self.path_for(prefix)
+        for directory, _, files in os.walk(base):
+            for name in files:
+                if '.tmp-' in name:
+                    continue
+                path = os.path.join(directory, name)
+                key = os.path.relpath(path, self.root).replace(os.sep, '/')
+                yield key, datetime.fromtimestamp(os.path.getmtime(path), timezone.utc)
+
+    def delete(self, key):
+        os.remove(self.path_for(key))
+
+
+# Content-addressed store in an S3 bucket; large blobs use boto3's managed multipart transfers
+class S3ArtifactStore:
+    def __init__(self, client, bucket, prefix=''):
+        self.client = client
+        self.bucket = bucket
+        self.prefix = prefix.strip('/') + '/' if prefix.strip('/') else ''
+
+    def exists(self, key):
+        try:
+            self.client.head_object(Bucket=self.bucket, Key=self.prefix + key)
+            return True
+        except ClientError as e:
+            if e.response.get('Error', {}).get('Code') in ('404', 'NoSuchKey', 'NotFound'):
+                return False
+            raise
+
+    def put_file(self, key, source_path):
+        self.client.upload_file(source_path, self.bucket, self.prefix + key)
+
+    def get_file(self, key, destination_path):
+        self.client.download_file(self.bucket, self.prefix + key, destination_path)
+
+    def put_bytes(self, key, data):
+        self.client.put_object(Bucket=self.bucket, Key=self.prefix + key, Body=data)
+
+    def get_bytes(self, key):
+        return self.client.get_object(Bucket=self.bucket, Key=self.prefix + key)['Body'].read()
+
+    def list_keys(self, prefix):
+        paginator = self.client.get_paginator('list_objects_v2')
+        for page in paginator.paginate(Bucket=self.bucket, Prefix=self.prefix + prefix):
+            for entry in page.get('Contents', []):
+                yield entry['Key'][len(self.prefix):], entry['LastModified']
+
+    def delete(self, key):
+        self.client.delete_object(Bucket=self.bucket, Key=self.prefix + key)
+
+
+# Open the store named by a URI: s3://bucket/prefix or a local directory
+def get_artifact_store(uri=ARTIFACT_STORE_URI, s3_client=None):
+    if uri.startswith('s3://'):
+        bucket, _, prefix = uri[len('s3://'):].partition('/')
+        if s3_client is None:
+            import boto3
+            s3_client = boto3.client('s3')
+        return S3ArtifactStore(s3_client, bucket, prefix)
+    return LocalArtifactStore(uri)
+
+
+def _blob_key(digest):
+    return f"{BLOB_PREFIX}{digest[:2]}/{digest}"
+
+
+def _version_key(version):
+    return f"{VERSION_PREFIX}{version}.json"
+
+
+# SHA-256 of a file, read in chunks (hashlib releases the GIL, so files hash in parallel threads)
+def file_digest(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(HASH_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+# Hash one file of a version, reusing the digest from a previous manifest when the file is unchanged
+def _file_entry(path, previous_entry):
+    stat = os.stat(path)
+    if previous_entry and previous_entry['size'] == stat.st_size and previous_entry.get('mtime_ns') == stat.st_mtime_ns:
+        return previous_entry
+    return {'sha256': file_digest(path), 'size': stat.st_size, 'mtime_ns': stat.st_mtime_ns}
+
+
+# Upload blobs that the store does not have yet; returns how many were uploaded
+def _upload_missing(store, sources, max_workers):
+    def upload(item):
+        digest, path = item
+        key = _blob_key(digest)
+        if store.exists(key):
+            return 0
+        store.put_file(key, path)
+        return 1
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        return sum(executor.map(upload, sources.items()))
+
+
+# Store one version of an artifact directory; returns the small manifest (hashes, paths, shapes) for XCom.
+# Files already in the store (same hash) are not uploaded again; pass the previous manifest of the same
+# version to skip re-hashing files that have not changed.
+def store_artifact_version(store, artifact_dir, version, previous=None, max_workers=ARTIFACT_STORE_WORKERS):
+    try:
+        version_dir = os.path.join(artifact_dir, version)
+        with open(os.path.join(version_dir, MANIFEST_FILE)) as f:
+            artifact_manifest = json.load(f)
+        file_names = [MANIFEST_FILE] + sorted(entry['file'] for entry in artifact_manifest['arrays'].values())
+        previous_files = (previous or {}).get('files', {})
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            entries = list(executor.map(lambda name: _file_entry(os.path.join(version_dir, name),
+                                                                 previous_files.get(name)), file_names))
+        files = dict(zip(file_names, entries))
+        uploaded = _upload_missing(store, {entry['sha256']: os.path.join(version_dir, name)
+                                           for name, entry in files.items()}, max_workers)
+
+        manifest = {
+            'version': version,
+            'created_at': artifact_manifest['created_at'],
+            'artifact_dir': os.path.abspath(artifact_dir),
+            'files': files,
+            'arrays': {name: {'file': entry['file'], 'shape': entry['shape'], 'dtype': entry['dtype']}
+                       for name, entry in artifact_manifest['arrays'].items()},
+        }
+        store.put_bytes(_version_key(version), json.dumps(manifest, indent=2).encode())
+        logging.info(f"Stored model artifact version {version}: {len(files)} files, {uploaded} new blobs.")
+        return manifest
+    except Exception as e:
+        logging.error(f"An error occurred while storing model artifact version {version}: {e}")
+        raise
+
+
+# Read a stored version manifest
+def load_version_manifest(store, version):
+    return json.loads(store.get_bytes(_version_key(version)))
+
+
+# True when the store has a manifest for the version
+def has_version(store, version):
+    return store.exists(_version_key(version))
+
+
+# Copy a stored version's blobs and manifest to another store in parallel, skipping blobs it already has
+def replicate_version(source, destination, manifest, max_workers=ARTIFACT_STORE_WORKERS):
+    def copy(digest):
+        key = _blob_key(digest)
+        if destination.exists(key):
+            return 0
+        if isinstance(source, LocalArtifactStore):
+            destination.put_file(key, source.path_for(key))
+        else:
+            with tempfile.NamedTemporaryFile() as tmp:
+                source.get_file(key, tmp.name)
+                destination.put_file(key, tmp.name)
+        return 1
+
+    try:
+        digests = sorted({entry['sha256'] for entry in manifest['files'].values()})
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            copied = sum(executor.map(copy, digests))
+        destination.put_bytes(_version_key(manifest['version']), json.dumps(manifest, indent=2).encode())
+        logging.info(f"Replicated version {manifest['version']}: {copied} of {len(digests)} blobs copied.")
+        return copied
+    except Exception as e:
+        logging.error(f"An error occurred while replicating version {manifest['version']}: {e}")
+        raise
+
+
+# Rebuild a version directory from the store, verifying every blob's hash
+def restore_artifact_version(store, version, artifact_dir, max_workers=ARTIFACT_STORE_WORKERS):
+    manifest = load_version_manifest(store, version)
+    staging_dir = os.path.join(artifact_dir, f".staging-{version}")
+    os.makedirs(staging_dir, exist_ok=True)
+
+    def fetch(item):
+        name, entry = item
+        path = os.path.join(staging_dir, name)
+        store.get_file(_blob_key(entry['sha256']), path)
+        if file_digest(path) != entry['sha256']:
+            raise ValueError(f"Blob for {name} of version {version} failed hash verification.")
+
+    try:
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(fetch, manifest['files'].items()))
+        # A stale local copy of the version (e.g. written before a later task added arrays) is replaced
+        version_dir = os.path.join(artifact_dir, version)
+        stale_dir = os.path.join(artifact_dir, f".stale-{version}-{os.getpid()}")
+        if os.path.exists(version_dir):
+            os.replace(version_dir, stale_dir)
+        os.replace(staging_dir, version_dir)
+        shutil.rmtree(stale_dir, ignore_errors=True)
+        logging.info(f"Restored model artifact version {version} into {artifact_dir}.")
+        return version
+    except Exception as e:
+        logging.error(f"An error occurred while restoring model artifact version {version}: {e}")
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+
+
+# Make a stored version available in artifact_dir; it is restored from the store unless an identical copy (same
+# manifest.json hash) is already there, so DAG tasks can run on workers that do not share the artifact directory
+def ensure_local_version(store, manifest, artifact_dir, max_workers=ARTIFACT_STORE_WORKERS):
+    version = manifest['version']
+    local_manifest = os.path.join(artifact_dir, version, MANIFEST_FILE)
+    if os.path.exists(local_manifest) and file_digest(local_manifest) == manifest['files'][MANIFEST_FILE]['sha256']:
+        return version
+    logging.info(f"Model artifact version {version} is not available locally; restoring it from the store.")
+    os.makedirs(artifact_dir, exist_ok=True)
+    return restore_artifact_version(store, version, artifact_dir, max_workers)
+
+
+# Versions to keep: the newest keep_versions, anything younger than max_age_days, and the protected ones
+def _retained(versions, created_at, keep_versions, max_age_days, protected, now):
+    cutoff = now - timedelta(days=max_age_days)
+    newest = set(versions[-keep_versions:]) if keep_versions > 0 else set()
+    return {version for version in versions
+            if version in newest or version in protected or created_at[version] >= cutoff}
+
+
+# Apply the retention policy to a store: drop expired version manifests, then garbage-collect blobs that no
+# remaining version references
+def apply_retention(store, keep_versions=ARTIFACT_RETENTION_VERSIONS, max_age_days=ARTIFACT_RETENTION_DAYS,
+                    protected=(), max_workers=ARTIFACT_STORE_WORKERS):
+    try:
+        now = datetime.now(timezone.utc)
+        manifests = {}
+        for key, _ in store.list_keys(VERSION_PREFIX):
+            manifest = json.loads(store.get_bytes(key))
+            manifests[manifest['version']] = manifest
+        versions = sorted(manifests)
+        created_at = {version: datetime.fromisoformat(manifests[version]['created_at']) for version in versions}
+        keep = _retained(versions, created_at, keep_versions, max_age_days, set(protected), now)
+        for version in versions:
+            if version not in keep:
+                store.delete(_version_key(version))
+
+        referenced = {entry['sha256'] for version in keep for entry in manifests[version]['files'].values()}
+        expired_blobs = [key for key, modified in store.list_keys(BLOB_PREFIX)
+                         if key.rsplit('/', 1)[-1] not in referenced and now - modified > BLOB_GRACE_PERIOD]
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(store.delete, expired_blobs))
+        logging.info(f"Retention: kept {len(keep)} of {len(versions)} versions, deleted {len(expired_blobs)} blobs.")
+        return sorted(keep)
+    except Exception as e:
+        logging.error(f"An error occurred while applying the artifact retention policy: {e}")
+        raise
+
+
+# Apply the same retention policy to the version directories of a local artifact directory; the published
+# version and any protected versions (e.g. the rollback target) are always kept
+def prune_artifact_dir(artifact_dir, keep_versions=ARTIFACT_RETENTION_VERSIONS, max_age_days=ARTIFACT_RETENTION_DAYS,
+                       protected=()):
+    protected = set(protected)
+    if os.path.exists(os.path.join(artifact_dir, LATEST_POINTER)):
+        protected.add(resolve_latest_version(artifact_dir))
+    versions = list_versions(artifact_dir)
+    created_at = {}
+    for version in versions:
+        with open(os.path.join(artifact_dir, version, MANIFEST_FILE)) as f:
+            created_at[version] = datetime.fromisoformat(json.load(f)['created_at'])
+    keep = _retained(versions, created_at, keep_versions, max_age_days, protected, datetime.now(timezone.utc))
+    for version in versions:
+        if version not in keep:
+            delete_version(artifact_dir, version)
+    return sorted(keep)
@@ -0,0 +1,109 @@
+import json
+import time
+import asyncio
+import logging
+from serving import (MicroBatcher, get_model_artifact, parse_recommend_request, lookup_top_n, recommend_for_user,
+                     recommendation_cache, request_filters)
+from model_registry import get_model_registry
+from monitoring import log_latency
+
+# Initialize logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# One batcher per worker process; every concurrent /recommend request that needs live scoring goes through it
+batcher = MicroBatcher()
+
+
+# Send a JSON response over the ASGI connection
+async def send_json(send, status, payload):
+    body = json.dumps(payload).encode()
+    await send({'type': 'http.response.start', 'status': status,
+                'headers': [(b'content-type', b'application/json'), (b'content-length', str(len(body)).encode())]})
+    await send({'type': 'http.response.body', 'body': body})
+
+
+# Read the full request body
+async def read_body(receive):
+    chunks = []
+    while True:
+        message = await receive()
+        chunks.append(message.get('body', b''))
+        if not message.get('more_body', False):
+            return b''.join(chunks)
+
+
+# Load the model once at worker start-up so no request pays the cold start, then watch for new versions
+async def handle_lifespan(receive, send):
+    while True:
+        message = await receive()
+        if message['type'] == 'lifespan.startup':
+            try:
+                await asyncio.to_thread(get_model_artifact)
+                get_model_registry()
+                await send({'type': 'lifespan.startup.complete'})
+            except Exception as e:
+                logging.error(f"Error initializing model: {e}")
+                await send({'type': 'lifespan.startup.failed', 'message': str(e)})
+        elif message['type'] == 'lifespan.shutdown':
+            await send({'type': 'lifespan.shutdown.complete'})
+            return
+
+
+# Force a reload of the published model version off the event loop
+async def reload_model(send):
+    try:
+        registry = get_model_registry()
+        swap = await asyncio.to_thread(registry.reload)
+        await send_json(send, 200, {'swap': swap, 'status': registry.status()})
+    except Exception as e:
+        logging.error(f"An error occurred while reloading the model: {e}")
+        await send_json(send, 500, {'error': 'An internal error occurred while reloading the model.'})
+
+
+# Answer one /recommend request without blocking the event loop
+async def recommend(receive, send):
+    start = time.perf_counter()
+    user_id = None
+    try:
+        artifact = get_model_artifact()
+        try:
+            user_id, k, n_probe = parse_recommend_request(json.loads(await read_body(receive) or b'null'))
+        except ValueError as e:
+            await send_json(send, 400, {'error': str(e)})
+            return
+
+        filters = request_filters(n_probe)
+        recommendations = recommendation_cache.get(artifact.version, user_id, k, filters)
+        if recommendations is None:
+            recommendations = lookup_top_n(artifact, user_id, k)
+            if recommendations is None and n_probe > 0:
+                recommendations = await asyncio.to_thread(recommend_for_user, artifact, user_id, k, n_probe)
+            elif recommendations is None:
+                recommendations = await asyncio.wait_for(asyncio.wrap_future(batcher.submit(artifact, user_id, k)),
+                                                         batcher.timeout)
+            recommendation_cache.put(artifact.version, user_id, k, recommendations, filters)
+        log_latency(time.perf_counter() - start)
+        await send_json(send, 200, {'recommendations': recommendations.tolist()})
+
+    except IndexError:
+        logging.error(f"User ID {user_id} is out of bounds.")
+        await send_json(send, 404, {'error': f'User ID {user_id} is out of bounds.'})
+    except Exception as e:
+        logging.error(f"An error occurred while generating recommendations: {e}")
+        await send_json(send, 500, {'error': 'An internal error occurred while processing your request.'})
+
+
+# ASGI entry point, e.g. `uvicorn asgi:app --workers 4`
+async def app(scope, receive, send):
+    if scope['type'] == 'lifespan':
+        await handle_lifespan(receive, send)
+    elif scope['type'] == 'http' and scope['path'] == '/recommend' and scope['method'] == 'POST':
+        await recommend(receive, send)
+    elif scope['type'] == 'http' and scope['path'] == '/admin/cache' and scope['method'] == 'GET':
+        await send_json(send, 200, recommendation_cache.stats())
+    elif scope['type'] == 'http' and scope['path'] == '/admin/model' and scope['method'] == 'GET':
+        await send_json(send, 200, get_model_registry().status())
+    elif scope['type'] == 'http' and scope['path'] == '/admin/model/reload' and scope['method'] == 'POST':
+        await reload_model(send)
+    elif scope['type'] == 'http':
+        await send_json(send, 404, {'error': 'Not found.'})
@@ -0,0 +1,54 @@
+"""Recall@K and per-query latency of the IVF index against exact brute-force scoring.
+
+Usage: python -m benchmarks.ann_recall [--items N] [--components N] [--lists N] [--probes 1,4,16]
+"""
+import json
+import time
+import argparse
+import numpy as np
+from ann_index import build_ivf_index, search_ivf_index
+from scoring import get_top_k
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--items', type=int, default=200000)
+    parser.add_argument('--components', type=int, default=15)
+    parser.add_argument('--lists', type=int, default=0, help='IVF lists (default: sqrt(items))')
+    parser.add_argument('--probes', default='1,2,4,8,16,32')
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--output', help='Optional path for the JSON report')
+    args = parser.parse_args()
+
+    # Non-negative, skewed factors shaped like NMF output
+    rng = np.random.default_rng(42)
+    user_features = rng.gamma(0.5, 1.0, (args.users, args.components)).astype(np.float32)
+    item_features = rng.gamma(0.5, 1.0, (args.components, args.items)).astype(np.float32)
+    queries = rng.choice(args.users, args.queries, replace=False)
+
+    start = time.perf_counter()
+    index = build_ivf_index(item_features, n_lists=args.lists or None)
+    build_seconds = time.perf_counter() - start
+
+    start = time.perf_counter()
+    exact = [get_top_k(user_features, item_features, user_id, args.k) for user_id in queries]
+    exact_ms = 1000 * (time.perf_counter() - start) / len(queries)
+
+    report = {'config': vars(args), 'build_seconds': build_seconds, 'exact_ms_per_query': exact_ms, 'ivf': []}
+    for n_probe in [int(p) for p in args.probes.split(',')]:
+        start = time.perf_counter()
+        approx = [search_ivf_index(index, user_features[user_id], args.k, n_probe) for user_id in queries]
+        ivf_ms = 1000 * (time.perf_counter() - start) / len(queries)
+        recall = np.mean([len(np.intersect1d(a, e)) / len(e) for a, e in zip(approx, exact)])
+        report['ivf'].append({'n_probe': n_probe, f'recall_at_{args.k}': float(recall), 'ms_per_query': ivf_ms})
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,97 @@
+"""Lambda cold-start report: `python -X importtime` breakdown plus first-call vs. warm-call handler timings.
+
+Usage: python -m benchmarks.cold_start [--users N] [--items N] [--warm-calls N] [--top N]
+"""
+import os
+import sys
+import json
+import argparse
+import tempfile
+import subprocess
+import numpy as np
+from model_artifact import save_model_artifact
+from benchmarks.common import REPO_ROOT, run_snippet, summarize
+
+# Fresh process: import the handler module, then time the first and the following invocations
+HANDLER_SNIPPET = """
+import json, sys, time
+start = time.perf_counter()
+import deploy_lambda
+import_seconds = time.perf_counter() - start
+calls = []
+for user_id in range(int(sys.argv[1]) + 1):
+    start = time.perf_counter()
+    response = deploy_lambda.lambda_handler({'user_id': user_id, 'k': 10}, None)
+    calls.append(time.perf_counter() - start)
+    assert response['statusCode'] == 200, response
+print(json.dumps({'import_seconds': import_seconds, 'first_call_seconds': calls[0], 'warm_call_seconds': calls[1:],
+                  'heavy_modules_loaded': [m for m in ('pandas', 'sklearn', 'scipy') if m in sys.modules]}))
+"""
+
+
+# Parse `-X importtime` output: total cost of importing `module` and the cumulative cost of its direct imports
+def import_breakdown(module, env, top):
+    result = subprocess.run([sys.executable, '-X', 'importtime', '-c', f'import {module}'], capture_output=True,
+                            text=True, env=env, cwd=REPO_ROOT, check=True)
+    total = 0
+    direct = {}
+    for line in result.stderr.splitlines():
+        if not line.startswith('import time:') or 'cumulative' in line:
+            continue
+        _, cumulative, name = line[len('import time:'):].split('|')
+        # Nesting depth is encoded as two spaces per level after the first
+        depth = (len(name) - len(name.lstrip()) - 1) // 2
+        if depth == 0 and name.strip() == module:
+            total = int(cumulative)
+        elif depth == 1:
+            direct[name.strip()] = int(cumulative)
+    slowest = sorted(direct.items(), key=lambda item: item[1], reverse=True)[:top]
+    return {'total_ms': total / 1000, 'slowest_direct_imports_ms': {name: us / 1000 for name, us in slowest}}
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--items', type=int, default=50000)
+    parser.add_argument('--components', type=int, default=15)
+    parser.add_argument('--warm-calls', type=int, default=50)
+    parser.add_argument('--top', type=int, default=10, help='Slowest imports to list')
+    parser.add_argument('--output', help='Optional path for the JSON report')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        # A synthetic artifact is enough: the handler only memory-maps and scores it
+        rng = np.random.default_rng(42)
+        artifact_dir = os.path.join(workdir, 'artifacts')
+        save_model_artifact(artifact_dir, {
+            'user_features': rng.random((args.users, args.components), dtype=np.float32),
+            'item_features': rng.random((args.components, args.items), dtype=np.float32),
+            'user_ids': np.arange(args.users),
+            'item_ids': np.arange(args.items),
+        })
+        env = dict(os.environ, MODEL_ARTIFACT_DIR=artifact_dir,
+                   PYTHONPATH=REPO_ROOT + os.pathsep + os.environ.get('PYTHONPATH', ''))
+
+        handler = run_snippet(HANDLER_SNIPPET.replace('sys.argv[1]', str(args.warm_calls)), env)
+        report = {
+            'config': vars(args),
+            'imports': {
+                'deploy_lambda': import_breakdown('deploy_lambda', env, args.top),
+                'recommendation_model': import_breakdown('recommendation_model', env, args.top),
+            },
+            'handler': {
+                'import_seconds': handler['import_seconds'],
+                'first_call_seconds': handler['first_call_seconds'],
+                'warm_call_seconds': summarize(handler['warm_call_seconds']),
+                'heavy_modules_loaded': handler['heavy_modules_loaded'],
+            },
+        }
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,53 @@
+import os
+import sys
+import json
+import subprocess
+import tracemalloc
+import numpy as np
+import pandas as pd
+
+# Repository root, so benchmark subprocesses can import the project modules
+REPO_ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+# Write a synthetic behavior CSV with the same columns as data_ingestion.simulate_behavior_data
+def write_synthetic_csv(path, num_users, num_items, num_interactions, seed=42):
+    rng = np.random.default_rng(seed)
+    data = pd.DataFrame({
+        'user_id': rng.integers(0, num_users, num_interactions),
+        'item_id': rng.integers(0, num_items, num_interactions),
+        'interaction': rng.choice([1, 0], num_interactions, p=[0.05, 0.95]),
+    })
+    data.to_csv(path, index=False)
+    return path
+
+
+# Run a Python snippet in a fresh interpreter and parse the JSON it prints on its last line
+def run_snippet(code, env=None):
+    process_env = dict(os.environ)
+    process_env.update(env or {})
+    process_env['PYTHONPATH'] = REPO_ROOT + os.pathsep + process_env.get('PYTHONPATH', '')
+    result = subprocess.run([sys.executable, '-c', code], capture_output=True, text=True,
+                            env=process_env, cwd=REPO_ROOT, check=True)
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+# Peak memory traced by tracemalloc while func runs (NumPy allocations are traced too), and func's result
+def traced_peak(func):
+    tracemalloc.start()
+    try:
+        result = func()
+        return tracemalloc.get_traced_memory()[1], result
+    finally:
+        tracemalloc.stop()
+
+
+# Summarise a list of timings in seconds
+def summarize(samples):
+    samples = np.asarray(samples, dtype=np.float64)
+    return {
+        'runs': int(samples.size),
+        'median': float(np.median(samples)),
+        'min': float(samples.min()),
+        'max': float(samples.max()),
+    }
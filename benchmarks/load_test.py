@@ -0,0 +1,110 @@
+"""Load test for /recommend: p50/p99 latency and throughput for single vs. micro-batched scoring.
+
+In-process (default): python -m benchmarks.load_test [--users N] [--items N] [--concurrency N] [--duration S]
+Against a server:     python -m benchmarks.load_test --url http://localhost:8000/recommend --max-user-id N
+"""
+import json
+import time
+import argparse
+import threading
+import http.client
+import urllib.parse
+import numpy as np
+from model_artifact import ModelArtifact
+from serving import MicroBatcher, recommend_for_user
+
+
+# Run `request(user_id)` from `concurrency` threads for `duration` seconds and summarise the latencies
+def run_load(request, max_user_id, concurrency, duration):
+    latencies = [[] for _ in range(concurrency)]
+    errors = [0] * concurrency
+    stop_at = time.perf_counter() + duration
+
+    def worker(slot):
+        rng = np.random.default_rng(slot)
+        while time.perf_counter() < stop_at:
+            user_id = int(rng.integers(0, max_user_id))
+            start = time.perf_counter()
+            try:
+                request(user_id)
+            except Exception:
+                errors[slot] += 1
+            latencies[slot].append(time.perf_counter() - start)
+
+    threads = [threading.Thread(target=worker, args=(slot,)) for slot in range(concurrency)]
+    started = time.perf_counter()
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+
+    samples = np.concatenate([np.asarray(slot, dtype=np.float64) for slot in latencies]) * 1000
+    return {
+        'requests': int(samples.size),
+        'errors': int(sum(errors)),
+        'rps': samples.size / elapsed,
+        'p50_ms': float(np.percentile(samples, 50)),
+        'p99_ms': float(np.percentile(samples, 99)),
+    }
+
+
+# One keep-alive HTTP connection per thread
+def http_requester(url, k):
+    parsed = urllib.parse.urlparse(url)
+    local = threading.local()
+
+    def request(user_id):
+        if not hasattr(local, 'connection'):
+            local.connection = http.client.HTTPConnection(parsed.hostname, parsed.port or 80, timeout=30)
+        local.connection.request('POST', parsed.path, body=json.dumps({'user_id': user_id, 'k': k}),
+                                 headers={'Content-Type': 'application/json'})
+        response = local.connection.getresponse()
+        response.read()
+        if response.status != 200:
+            raise RuntimeError(f"HTTP {response.status}")
+
+    return request
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--url', help='Load-test a running server instead of the in-process serving path')
+    parser.add_argument('--max-user-id', type=int, default=1000, help='User ids are drawn from [0, N) with --url')
+    parser.add_argument('--users', type=int, default=100000)
+    parser.add_argument('--items', type=int, default=50000)
+    parser.add_argument('--components', type=int, default=15)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--concurrency', type=int, default=32)
+    parser.add_argument('--duration', type=float, default=10.0)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--wait-ms', type=float, default=2.0)
+    parser.add_argument('--output', help='Optional path for the JSON report')
+    args = parser.parse_args()
+
+    report = {'config': vars(args)}
+    if args.url:
+        report['http'] = run_load(http_requester(args.url, args.k), args.max_user_id, args.concurrency, args.duration)
+    else:
+        # Synthetic in-memory model without a precomputed table, so every request is scored live
+        rng = np.random.default_rng(42)
+        artifact = ModelArtifact(version='load-test', path='', manifest={}, arrays={
+            'user_features': rng.gamma(0.5, 1.0, (args.users, args.components)).astype(np.float32),
+            'item_features': rng.gamma(0.5, 1.0, (args.components, args.items)).astype(np.float32),
+            'user_ids': np.arange(args.users),
+            'item_ids': np.arange(args.items),
+        })
+        batcher = MicroBatcher(max_batch_size=args.batch_size, max_wait_ms=args.wait_ms)
+        report['single'] = run_load(lambda user_id: recommend_for_user(artifact, user_id, args.k),
+                                    args.users, args.concurrency, args.duration)
+        report['batched'] = run_load(lambda user_id: batcher.recommend(artifact, user_id, args.k),
+                                     args.users, args.concurrency, args.duration)
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,92 @@
+"""Memory, throughput and top-K overlap of int8-quantized scoring against exact float32 scoring.
+
+The float32 baseline is what training exports; int8 artifacts store the codes in addition to the float32 factors,
+so they are larger on disk but scan a quarter of the bytes per query.
+
+Usage: python -m benchmarks.quantization [--users N] [--items N] [--components N] [--rerank 1,2,4,8]
+"""
+import json
+import time
+import argparse
+import numpy as np
+from quantization import compact_factor_arrays, quantized_index_from_artifact, quantized_top_k, quantized_top_k_batch
+from scoring import get_top_k, get_top_k_batch
+
+
+# Stand-in for a model artifact holding only the exported arrays
+class _Arrays:
+    def __init__(self, arrays):
+        self.arrays = arrays
+
+
+# Queries per second for single and batched scoring, and the single-query results
+def time_scoring(score_one, score_batch, queries, batch_size):
+    start = time.perf_counter()
+    results = [score_one(user_id) for user_id in queries]
+    single_qps = len(queries) / (time.perf_counter() - start)
+    start = time.perf_counter()
+    for offset in range(0, len(queries), batch_size):
+        score_batch(queries[offset:offset + batch_size])
+    batched_qps = len(queries) / (time.perf_counter() - start)
+    return single_qps, batched_qps, results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=10000)
+    parser.add_argument('--items', type=int, default=200000)
+    parser.add_argument('--components', type=int, default=15)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--queries', type=int, default=500)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--rerank', default='1,2,4,8', help='Candidate multipliers for int8 re-ranking')
+    parser.add_argument('--output', help='Optional path for the JSON report')
+    args = parser.parse_args()
+
+    # Non-negative, skewed float32 factors shaped like NMF output
+    rng = np.random.default_rng(42)
+    user_features = rng.gamma(0.5, 1.0, (args.users, args.components)).astype(np.float32)
+    item_features = rng.gamma(0.5, 1.0, (args.components, args.items)).astype(np.float32)
+    queries = rng.choice(args.users, args.queries, replace=False)
+
+    report = {'config': vars(args), 'results': []}
+    exact = None
+    for precision in ('float32', 'int8'):
+        arrays = compact_factor_arrays(user_features, item_features, precision)
+        users, items = arrays['user_features'], arrays['item_features']
+        if precision == 'int8':
+            index = quantized_index_from_artifact(_Arrays(arrays))
+            scanned_bytes = sum(array.nbytes for array in index.values())
+            variants = [(f'int8_rerank_{factor}',
+                         lambda user_id, factor=factor: quantized_top_k(index, users, items, user_id, args.k,
+                                                                        rerank_factor=factor),
+                         lambda batch, factor=factor: quantized_top_k_batch(index, users, items, batch, args.k,
+                                                                            rerank_factor=factor))
+                        for factor in [int(f) for f in args.rerank.split(',')]]
+        else:
+            scanned_bytes = items.nbytes
+            variants = [(precision, lambda user_id: get_top_k(users, items, user_id, args.k),
+                         lambda batch: get_top_k_batch(users, items, batch, args.k))]
+
+        for name, score_one, score_batch in variants:
+            single_qps, batched_qps, results = time_scoring(score_one, score_batch, queries, args.batch_size)
+            if exact is None:
+                exact = results
+            overlap = np.mean([len(np.intersect1d(r, e)) / len(e) for r, e in zip(results, exact)])
+            report['results'].append({
+                'variant': name,
+                'stored_bytes': int(sum(array.nbytes for array in arrays.values())),
+                'scanned_bytes_per_query': int(scanned_bytes),
+                'single_qps': single_qps,
+                'batched_qps': batched_qps,
+                f'overlap_at_{args.k}': float(overlap),
+            })
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
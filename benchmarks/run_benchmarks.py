@@ -0,0 +1,203 @@
+"""Reproducible benchmarks for the training and serving paths at several dataset scales.
+
+Usage: python -m benchmarks.run_benchmarks [--scales small,medium] [--density D] [--ranks 10,15] [--output FILE]
+                                           [--baseline FILE] [--threshold 0.15]
+       python -m benchmarks.run_benchmarks --compare FILE --baseline FILE
+
+Datasets come from data_ingestion.simulate_behavior_data with a fixed seed. Each benchmark reports timing
+statistics in seconds, plus the peak traced memory of one extra, untimed run. With --baseline, results are
+compared against a stored report and the exit status is 1 if any median time or peak memory regressed by
+more than --threshold.
+"""
+import os
+import sys
+import json
+import time
+import shutil
+import argparse
+import platform
+import tempfile
+import numpy as np
+
+# Every /recommend call must score live and metrics must stay in process, so set these before the API is imported
+os.environ.setdefault('RECOMMENDATION_CACHE_SIZE', '0')
+os.environ.setdefault('METRICS_SINK', 'memory')
+
+from benchmarks.common import summarize, traced_peak
+from data_ingestion import simulate_behavior_data
+from recommendation_model import build_interaction_matrix, train_nmf_model, export_model_artifact
+from scoring import get_top_k, get_top_k_batch
+
+# name -> (users, items, default density); interactions = users * items * density
+SCALES = {
+    'small': (1000, 1000, 1e-2),
+    'medium': (10000, 10000, 1e-3),
+    'large': (100000, 10000, 1e-3),
+    'xlarge': (1000000, 100000, 1e-4),
+}
+
+
+# Time func over several runs and add the peak memory of one extra run
+def measure(func, runs, memory=True):
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    result = summarize(samples)
+    if memory:
+        result['peak_memory_bytes'] = traced_peak(func)[0]
+    return result
+
+
+# Time single-user and batched scoring; results are per query
+def benchmark_scoring(user_features, item_features, queries, k, batch_size, memory):
+    single = measure(lambda: [get_top_k(user_features, item_features, user_id, k) for user_id in queries],
+                     runs=3, memory=memory)
+    batches = [queries[i:i + batch_size] for i in range(0, len(queries), batch_size)]
+    batched = measure(lambda: [get_top_k_batch(user_features, item_features, batch, k) for batch in batches],
+                      runs=3, memory=memory)
+    for result in (single, batched):
+        for key in ('median', 'min', 'max'):
+            result[key] /= len(queries)
+        result['unit'] = 'seconds per query'
+    return single, batched
+
+
+# Time end-to-end /recommend through the Flask test client against an exported artifact
+def benchmark_api(model, user_features, item_features, user_ids, item_ids, queries, k, memory):
+    import api
+    from serving import set_model_artifact, reset_model_artifact
+    from model_artifact import load_model_artifact
+
+    artifact_dir = tempfile.mkdtemp(prefix='benchmark-artifact-')
+    try:
+        export_model_artifact(artifact_dir, model, user_features, item_features, user_ids, item_ids)
+        set_model_artifact(load_model_artifact(artifact_dir))
+        client = api.app.test_client()
+
+        def run():
+            for user_id in queries:
+                response = client.post('/recommend', json={'user_id': int(user_id), 'k': k})
+                if response.status_code != 200:
+                    raise RuntimeError(f"/recommend returned {response.status_code}: {response.get_json()}")
+
+        result = measure(run, runs=3, memory=memory)
+        for key in ('median', 'min', 'max'):
+            result[key] /= len(queries)
+        result['unit'] = 'seconds per request'
+        return result
+    finally:
+        reset_model_artifact()
+        shutil.rmtree(artifact_dir, ignore_errors=True)
+
+
+# Run every benchmark for one dataset scale
+def run_scale(name, num_users, num_items, density, args):
+    num_interactions = max(int(num_users * num_items * density), 1)
+    print(f"[{name}] {num_users} users x {num_items} items, {num_interactions} interactions", file=sys.stderr)
+    memory = not args.skip_memory
+    results = {'users': num_users, 'items': num_items, 'density': density, 'interactions': num_interactions}
+
+    start = time.perf_counter()
+    data = simulate_behavior_data(num_users=num_users, num_items=num_items, num_interactions=num_interactions,
+                                  seed=args.seed)
+    results['generate_seconds'] = time.perf_counter() - start
+
+    results['build_interaction_matrix'] = measure(lambda: build_interaction_matrix(data), runs=3, memory=memory)
+    interaction_matrix, user_ids, item_ids = build_interaction_matrix(data)
+    results['nnz'] = int(interaction_matrix.nnz)
+
+    trained = None
+    for rank in args.ranks:
+        outputs = []
+        results[f'train_nmf_model_rank_{rank}'] = measure(
+            lambda: outputs.append(train_nmf_model(interaction_matrix, rank, max_iter=args.max_iter)),
+            runs=1, memory=memory)
+        trained = outputs[0]
+    model, user_features, item_features = trained
+
+    rng = np.random.default_rng(args.seed)
+    queries = rng.choice(interaction_matrix.shape[0], min(args.queries, interaction_matrix.shape[0]), replace=False)
+    results['score_single'], results['score_batched'] = benchmark_scoring(
+        user_features, item_features, queries, args.k, args.batch_size, memory)
+    results['api_recommend'] = benchmark_api(model, user_features, item_features, user_ids, item_ids,
+                                             queries, args.k, memory)
+    return results
+
+
+# Compare two reports; returns a list of regressions beyond the threshold
+def compare_reports(baseline, current, threshold):
+    regressions = []
+    for scale, results in current['results'].items():
+        baseline_results = baseline['results'].get(scale)
+        if baseline_results is None:
+            continue
+        for bench, result in results.items():
+            previous = baseline_results.get(bench)
+            if not isinstance(result, dict) or not isinstance(previous, dict):
+                continue
+            for key in ('median', 'peak_memory_bytes'):
+                if key in result and previous.get(key):
+                    ratio = result[key] / previous[key]
+                    status = 'REGRESSION' if ratio > 1 + threshold else 'ok'
+                    print(f"{status:10s} {scale}/{bench} {key}: {previous[key]:.6g} -> {result[key]:.6g} "
+                          f"({ratio - 1:+.1%})", file=sys.stderr)
+                    if status == 'REGRESSION':
+                        regressions.append({'scale': scale, 'benchmark': bench, 'metric': key,
+                                            'baseline': previous[key], 'current': result[key], 'ratio': ratio})
+    return regressions
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--scales', default='small,medium', help=f"Comma-separated subset of {', '.join(SCALES)}")
+    parser.add_argument('--users', type=int, help='Custom scale: number of users (with --items)')
+    parser.add_argument('--items', type=int, help='Custom scale: number of items (with --users)')
+    parser.add_argument('--density', type=float, help='Interactions per user-item cell (default: per scale)')
+    parser.add_argument('--ranks', default='10,15', type=lambda s: [int(r) for r in s.split(',')])
+    parser.add_argument('--max-iter', type=int, default=50)
+    parser.add_argument('--k', type=int, default=10)
+    parser.add_argument('--queries', type=int, default=200)
+    parser.add_argument('--batch-size', type=int, default=64)
+    parser.add_argument('--seed', type=int, default=42)
+    parser.add_argument('--skip-memory', action='store_true', help='Skip the extra traced run per benchmark')
+    parser.add_argument('--output', help='Path for the JSON report')
+    parser.add_argument('--compare', help='Compare this stored report against --baseline instead of running')
+    parser.add_argument('--baseline', help='Stored report to compare against')
+    parser.add_argument('--threshold', type=float, default=0.15, help='Allowed slowdown or memory growth')
+    args = parser.parse_args()
+
+    if args.compare:
+        with open(args.compare) as f:
+            report = json.load(f)
+    else:
+        if args.users and args.items:
+            scales = {'custom': (args.users, args.items, args.density or 1e-3)}
+        else:
+            scales = {name: SCALES[name] for name in args.scales.split(',')}
+        report = {
+            'environment': {'python': platform.python_version(), 'numpy': np.__version__,
+                            'platform': platform.platform(), 'cpu_count': os.cpu_count()},
+            'config': {key: value for key, value in vars(args).items() if key not in ('compare', 'baseline')},
+            'results': {},
+        }
+        for name, (num_users, num_items, density) in scales.items():
+            report['results'][name] = run_scale(name, num_users, num_items, args.density or density, args)
+
+        print(json.dumps(report, indent=2))
+        if args.output:
+            with open(args.output, 'w') as f:
+                json.dump(report, f, indent=2)
+
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare_reports(baseline, report, args.threshold)
+        if regressions:
+            print(f"{len(regressions)} regression(s) beyond {args.threshold:.0%}", file=sys.stderr)
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,84 @@
+"""Compare serving cold start: retraining from CSV vs. memory-mapping a model artifact.
+
+Usage: python -m benchmarks.startup [--users N] [--items N] [--interactions N] [--runs N]
+"""
+import os
+import json
+import argparse
+import tempfile
+from benchmarks.common import write_synthetic_csv, run_snippet, summarize
+
+# Each snippet runs in a fresh process and reports time-to-first-recommendation and peak RSS
+RETRAIN_SNIPPET = """
+import os, json, time, resource
+start = time.perf_counter()
+from recommendation_model import load_data, build_interaction_matrix, train_nmf_model, get_top_k
+df = load_data(os.environ['BEHAVIOR_DATA_PATH'], use_cache=False)
+matrix, user_ids, item_ids = build_interaction_matrix(df)
+model, W, H = train_nmf_model(matrix, int(os.environ['NMF_COMPONENTS']))
+get_top_k(W, H, 0, 10)
+print(json.dumps({'seconds': time.perf_counter() - start,
+                  'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}))
+"""
+
+ARTIFACT_SNIPPET = """
+import os, json, time, resource
+start = time.perf_counter()
+from model_artifact import load_model_artifact
+from scoring import get_top_k
+artifact = load_model_artifact(os.environ['MODEL_ARTIFACT_DIR'])
+get_top_k(artifact.user_features, artifact.item_features, 0, 10)
+print(json.dumps({'seconds': time.perf_counter() - start,
+                  'max_rss_kb': resource.getrusage(resource.RUSAGE_SELF).ru_maxrss}))
+"""
+
+
+def measure(snippet, env, runs):
+    results = [run_snippet(snippet, env) for _ in range(runs)]
+    return {
+        'seconds': summarize([r['seconds'] for r in results]),
+        'max_rss_kb': max(r['max_rss_kb'] for r in results),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--users', type=int, default=20000)
+    parser.add_argument('--items', type=int, default=5000)
+    parser.add_argument('--interactions', type=int, default=500000)
+    parser.add_argument('--components', type=int, default=15)
+    parser.add_argument('--runs', type=int, default=3)
+    parser.add_argument('--output', help='Optional path for the JSON report')
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as workdir:
+        data_path = write_synthetic_csv(os.path.join(workdir, 'behavior.csv'),
+                                        args.users, args.items, args.interactions)
+        env = {
+            'BEHAVIOR_DATA_PATH': data_path,
+            'MODEL_ARTIFACT_DIR': os.path.join(workdir, 'artifacts'),
+            'NMF_COMPONENTS': str(args.components),
+        }
+        # Produce the artifact once, the way the training pipeline does
+        run_snippet("""
+import os, json
+from recommendation_model import load_data, build_interaction_matrix, train_nmf_model, export_model_artifact
+matrix, user_ids, item_ids = build_interaction_matrix(load_data(os.environ['BEHAVIOR_DATA_PATH']))
+model, W, H = train_nmf_model(matrix, int(os.environ['NMF_COMPONENTS']))
+print(json.dumps({'version': export_model_artifact(os.environ['MODEL_ARTIFACT_DIR'], model, W, H, user_ids, item_ids)}))
+""", env)
+
+        report = {
+            'config': vars(args),
+            'retrain_from_csv': measure(RETRAIN_SNIPPET, env, args.runs),
+            'memory_mapped_artifact': measure(ARTIFACT_SNIPPET, env, args.runs),
+        }
+
+    print(json.dumps(report, indent=2))
+    if args.output:
+        with open(args.output, 'w') as f:
+            json.dump(report, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -1,8 +1,15 @@
 import os
+import gzip
+import time
+import base64
+import hashlib
+import threading
+from concurrent.futures import ThreadPoolExecutor
 import pandas as pd
 import numpy as np
 import logging
-from azure.storage.blob import BlobServiceClient, ResourceExistsError
+from azure.core.exceptions import ResourceNotFoundError
+from azure.storage.blob import BlobServiceClient, BlobBlock, ResourceExistsError
 import boto3
 from botocore.exceptions import NoCredentialsError, PartialCredentialsError
 
@@ -12,30 +19,116 @@ logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(
 # Constants for large file handling
 MAX_FILE_SIZE_MB = 5  # Set file size limit to 5MB per file for uploading
 
+# Multipart uploads: part size (S3 needs at least 5 MB for every part but the last), upload threads, attempts per part
+UPLOAD_PART_SIZE_MB = int(os.getenv('UPLOAD_PART_SIZE_MB', 16))
+UPLOAD_MAX_WORKERS = int(os.getenv('UPLOAD_MAX_WORKERS', 8))
+UPLOAD_MAX_RETRIES = int(os.getenv('UPLOAD_MAX_RETRIES', 3))
 
-# Function to simulate user behavior data
-def simulate_behavior_data(num_users=1000, num_items=500, num_interactions=10000):
+# Rows serialized at a time when streaming a DataFrame into upload parts
+SERIALIZE_BATCH_ROWS = 100000
+
+# Popularity skew of the simulator: probability of the rank-r user/item is proportional to 1 / r**exponent
+USER_ACTIVITY_EXPONENT = float(os.getenv('USER_ACTIVITY_EXPONENT', 0.8))
+ITEM_POPULARITY_EXPONENT = float(os.getenv('ITEM_POPULARITY_EXPONENT', 1.0))
+
+# Interactions generated and written per chunk when streaming a simulation to disk
+SIMULATION_CHUNK_SIZE = int(os.getenv('SIMULATION_CHUNK_SIZE', 10000000))
+
+
+# Cumulative power-law distribution over n ids; ranks are shuffled so popular ids are spread over the id range
+def _power_law_cdf(n, exponent, rng):
+    weights = 1.0 / np.arange(1, n + 1, dtype=np.float64) ** exponent
+    cdf = np.cumsum(weights[rng.permutation(n)])
+    return cdf / cdf[-1]
+
+
+# Draw one chunk of interactions by inverse-CDF sampling (one searchsorted per column)
+def _simulate_chunk(rng, user_cdf, item_cdf, size):
+    users = np.searchsorted(user_cdf, rng.random(size), side='right')
+    items = np.searchsorted(item_cdf, rng.random(size), side='right')
+    return pd.DataFrame({
+        'user_id': users.astype(np.int32 if len(user_cdf) <= np.iinfo(np.int32).max else np.int64),
+        'item_id': items.astype(np.int32 if len(item_cdf) <= np.iinfo(np.int32).max else np.int64),
+        'interaction': (rng.random(size) < 0.05).astype(np.int8),
+    })
+
+
+# Average the interactions of duplicate (user, item) pairs, as the training pipeline does when loading
+def aggregate_interactions(df):
+    return df.groupby(['user_id', 'item_id'], as_index=False, sort=False)['interaction'].mean()
+
+
+# Function to simulate user behavior data with power-law user activity and item popularity
+def simulate_behavior_data(num_users=1000, num_items=500, num_interactions=10000, seed=None):
     logging.info("Simulating user behavior data...")
-    users = np.random.choice(range(num_users), num_interactions)
-    items = np.random.choice(range(num_items), num_interactions)
-    interactions = np.random.choice([1, 0], num_interactions, p=[0.05, 0.95])
-    data = pd.DataFrame({'user_id': users, 'item_id': items, 'interaction': interactions})
-    logging.info("Behavior data simulation complete.")
+    rng = np.random.default_rng(seed)
+    user_cdf = _power_law_cdf(num_users, USER_ACTIVITY_EXPONENT, rng)
+    item_cdf = _power_law_cdf(num_items, ITEM_POPULARITY_EXPONENT, rng)
+    data = aggregate_interactions(_simulate_chunk(rng, user_cdf, item_cdf, num_interactions))
+    logging.info(f"Behavior data simulation complete: {len(data)} unique (user, item) pairs.")
     return data
 
 
-# Function to anonymize user data by hashing user IDs
-def anonymize_data(df):
+# Stream a simulation of any size to a CSV file chunk by chunk (gzip-compressed when the path ends in .gz)
+def write_simulated_behavior_data(path, num_users, num_items, num_interactions, chunk_size=SIMULATION_CHUNK_SIZE,
+                                  seed=None):
+    try:
+        logging.info(f"Simulating {num_interactions} interactions into {path}...")
+        rng = np.random.default_rng(seed)
+        user_cdf = _power_law_cdf(num_users, USER_ACTIVITY_EXPONENT, rng)
+        item_cdf = _power_law_cdf(num_items, ITEM_POPULARITY_EXPONENT, rng)
+        # Only one chunk is in memory at a time; duplicates across chunks are averaged by load_data when reading
+        opener = gzip.open if path.endswith('.gz') else open
+        with opener(path, 'wt', newline='') as f:
+            for start in range(0, num_interactions, chunk_size):
+                chunk = _simulate_chunk(rng, user_cdf, item_cdf, min(chunk_size, num_interactions - start))
+                chunk.to_csv(f, index=False, header=start == 0)
+        logging.info(f"Simulated behavior data written to {path}.")
+        return path
+    except Exception as e:
+        logging.error(f"Error writing simulated behavior data: {e}")
+        raise
+
+
+# Secret key for anonymization; hashing is keyed so ids cannot be recovered by hashing candidate ids
+def _anonymization_key(key=None):
+    key = key or os.getenv('ANONYMIZATION_KEY')
+    if not key:
+        logging.warning("ANONYMIZATION_KEY is not set; using the default key. Set it in production.")
+        key = 'recommendation-system'
+    # pandas' SipHash takes exactly 16 bytes; derive them from a key of any length
+    return hashlib.blake2b(key.encode(), digest_size=8).hexdigest()
+
+
+# Keyed, deterministic 64-bit hash of every value in an array; each distinct value is hashed once
+def hash_ids(values, key=None):
+    codes, uniques = pd.factorize(np.asarray(values))
+    hashed = pd.util.hash_array(np.asarray(uniques).astype(str).astype(object),
+                                hash_key=_anonymization_key(key), categorize=False)
+    return hashed.view(np.int64)[codes]
+
+
+# Function to anonymize user data by hashing user IDs; the same id maps to the same value in every process
+def anonymize_data(df, key=None):
     logging.info("Anonymizing user data...")
-    df['user_id'] = df['user_id'].apply(lambda x: hash(x))
+    df['user_id'] = hash_ids(df['user_id'].to_numpy(), key)
     logging.info("Data anonymization complete.")
     return df
 
 
-# Function to split large data into chunks for easier upload
+# Estimate the CSV size of a DataFrame from a serialized sample of its rows
+def _estimated_csv_size_mb(df, sample_rows=10000):
+    if df.empty:
+        return 0.0
+    sample = df.iloc[np.linspace(0, len(df) - 1, min(sample_rows, len(df))).astype(np.int64)]
+    bytes_per_row = len(sample.to_csv(index=False, header=False).encode()) / len(sample)
+    return bytes_per_row * len(df) / (1024 * 1024)
+
+
+# Function to split large data into chunks for easier upload, sized by the serialized CSV size
 def split_dataframe(df, max_file_size_mb):
     logging.info("Checking if data splitting is necessary...")
-    csv_size_mb = df.memory_usage(index=True).sum() / (1024 * 1024)
+    csv_size_mb = _estimated_csv_size_mb(df)
     if csv_size_mb > max_file_size_mb:
         logging.info(f"Data size {csv_size_mb:.2f}MB exceeds {max_file_size_mb}MB, splitting into chunks.")
         num_chunks = int(np.ceil(csv_size_mb / max_file_size_mb))
@@ -43,12 +136,197 @@ def split_dataframe(df, max_file_size_mb):
     return [df]
 
 
+# Upload format from the object name: .parquet, .csv.gz (gzip-compressed CSV) or plain CSV
+def _upload_format(name):
+    if name.endswith('.parquet'):
+        return 'parquet'
+    return 'csv.gz' if name.endswith('.gz') else 'csv'
+
+
+# Row slices of a DataFrame, or of every DataFrame in an iterable (e.g. pd.read_csv(..., chunksize=...))
+def _iter_row_batches(data):
+    frames = [data] if isinstance(data, pd.DataFrame) else data
+    for frame in frames:
+        for start in range(0, len(frame), SERIALIZE_BATCH_ROWS):
+            yield frame.iloc[start:start + SERIALIZE_BATCH_ROWS]
+
+
+# Write-only file object that cuts the serialized stream into fixed-size parts and hands each one to emit
+class _PartWriter:
+    def __init__(self, part_size, emit):
+        self.part_size = part_size
+        self.emit = emit
+        self.closed = False
+        self._buffer = bytearray()
+        self._position = 0
+        self._parts = 0
+
+    def write(self, data):
+        self._buffer += data
+        self._position += len(data)
+        while len(self._buffer) >= self.part_size:
+            self._emit(bytes(self._buffer[:self.part_size]))
+            del self._buffer[:self.part_size]
+        return len(data)
+
+    def _emit(self, part):
+        self._parts += 1
+        self.emit(part)
+
+    def writable(self):
+        return True
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    def close(self):
+        # The last part may be short; an empty upload still sends one (empty) part
+        if not self.closed and (self._buffer or not self._parts):
+            self._emit(bytes(self._buffer))
+        self._buffer = bytearray()
+        self.closed = True
+
+
+# Serialize data as CSV, gzip-compressed CSV or Parquet straight into the part writer, one row batch at a time
+def _serialize(data, upload_format, writer):
+    if upload_format == 'parquet':
+        # pyarrow is only needed for Parquet uploads
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+        parquet_writer = None
+        for batch in _iter_row_batches(data):
+            table = pa.Table.from_pandas(batch, preserve_index=False)
+            if parquet_writer is None:
+                parquet_writer = pq.ParquetWriter(writer, table.schema)
+            parquet_writer.write_table(table)
+        if parquet_writer is not None:
+            parquet_writer.close()
+    else:
+        # mtime=0 keeps the header free of the current time, so identical data gives identical parts (and MD5s)
+        # and an interrupted upload can resume from the parts already staged
+        stream = gzip.GzipFile(fileobj=writer, mode='wb', mtime=0) if upload_format == 'csv.gz' else writer
+        header = True
+        for batch in _iter_row_batches(data):
+            stream.write(batch.to_csv(index=False, header=header).encode())
+            header = False
+        if header and isinstance(data, pd.DataFrame):
+            # An empty DataFrame still uploads as a CSV with its header row
+            stream.write(data.head(0).to_csv(index=False).encode())
+        if stream is not writer:
+            stream.close()
+    writer.close()
+
+
+# Call upload_part with exponential backoff between attempts
+def _with_retries(upload_part, part_number, part):
+    for attempt in range(1, UPLOAD_MAX_RETRIES + 1):
+        try:
+            return upload_part(part_number, part)
+        except Exception as e:
+            if attempt == UPLOAD_MAX_RETRIES:
+                raise
+            logging.warning(f"Upload of part {part_number} failed (attempt {attempt}): {e}; retrying...")
+            time.sleep(min(0.5 * 2 ** attempt, 10.0))
+
+
+# Serialize data into parts and upload them concurrently; returns [(part_number, upload_part result)] in order.
+# At most 2 * max_workers parts are buffered, so client memory is bounded by the part size, not the data size.
+def _upload_parts(data, upload_format, part_size, max_workers, upload_part):
+    slots = threading.BoundedSemaphore(2 * max_workers)
+    futures = []
+
+    def submit(part):
+        # Stop serializing as soon as any part has failed for good
+        for future in futures:
+            if future.done() and future.exception() is not None:
+                raise future.exception()
+        slots.acquire()
+        future = executor.submit(_with_retries, upload_part, len(futures) + 1, part)
+        future.add_done_callback(lambda _: slots.release())
+        futures.append(future)
+
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        try:
+            _serialize(data, upload_format, _PartWriter(part_size, submit))
+            return [(number, future.result()) for number, future in enumerate(futures, start=1)]
+        except Exception:
+            for future in futures:
+                future.cancel()
+            raise
+
+
+# Stream data to S3 as a parallel multipart upload; pass the upload_id of a failed upload to resume it
+def stream_upload_to_s3(s3_client, data, bucket_name, key, part_size_mb=UPLOAD_PART_SIZE_MB,
+                        max_workers=UPLOAD_MAX_WORKERS, upload_id=None):
+    uploaded = {}
+    if upload_id is None:
+        upload_id = s3_client.create_multipart_upload(Bucket=bucket_name, Key=key)['UploadId']
+    else:
+        # Parts that are already uploaded with the same content (MD5 ETag) are not sent again
+        marker = 0
+        while True:
+            listing = s3_client.list_parts(Bucket=bucket_name, Key=key, UploadId=upload_id, PartNumberMarker=marker)
+            uploaded.update({part['PartNumber']: part['ETag'] for part in listing.get('Parts', [])})
+            if not listing.get('IsTruncated'):
+                break
+            marker = listing['NextPartNumberMarker']
+        logging.info(f"Resuming upload {upload_id} of s3://{bucket_name}/{key} with {len(uploaded)} parts uploaded.")
+
+    def upload_part(part_number, part):
+        etag = uploaded.get(part_number)
+        if etag is not None and etag.strip('"') == hashlib.md5(part, usedforsecurity=False).hexdigest():
+            return etag
+        return s3_client.upload_part(Bucket=bucket_name, Key=key, UploadId=upload_id, PartNumber=part_number,
+                                     Body=part)['ETag']
+
+    try:
+        parts = _upload_parts(data, _upload_format(key), part_size_mb * 1024 * 1024, max_workers, upload_part)
+        s3_client.complete_multipart_upload(
+            Bucket=bucket_name, Key=key, UploadId=upload_id,
+            MultipartUpload={'Parts': [{'PartNumber': number, 'ETag': etag} for number, etag in parts]})
+        logging.info(f"Data uploaded to s3://{bucket_name}/{key} in {len(parts)} parts.")
+        return upload_id
+    except Exception as e:
+        # The incomplete upload is kept so it can be resumed; a bucket lifecycle rule should expire abandoned ones
+        logging.error(f"Multipart upload of s3://{bucket_name}/{key} failed (resume with upload_id={upload_id}): {e}")
+        raise
+
+
+# Stream data to Azure as a block blob, staging blocks in parallel; blocks already staged by a failed run are reused
+# when their content matches
+def stream_upload_to_azure(blob_service_client, data, container_name, blob_name, part_size_mb=UPLOAD_PART_SIZE_MB,
+                           max_workers=UPLOAD_MAX_WORKERS):
+    blob_client = blob_service_client.get_blob_client(container=container_name, blob=blob_name)
+    try:
+        staged = {block.id: block.size for block in blob_client.get_block_list('uncommitted')[1]}
+    except ResourceNotFoundError:
+        staged = {}
+
+    def upload_part(part_number, part):
+        # Block ids must all have the same length: the zero-padded part number plus the part's MD5, so a staged
+        # block is only reused for identical content (like the ETag check of the S3 path)
+        digest = hashlib.md5(part, usedforsecurity=False).hexdigest()
+        block_id = base64.b64encode(f'{part_number:06d}-{digest}'.encode()).decode()
+        if staged.get(block_id) != len(part):
+            blob_client.stage_block(block_id=block_id, data=part, length=len(part))
+        return block_id
+
+    try:
+        parts = _upload_parts(data, _upload_format(blob_name), part_size_mb * 1024 * 1024, max_workers, upload_part)
+        blob_client.commit_block_list([BlobBlock(block_id=block_id) for _, block_id in parts])
+        logging.info(f"Data uploaded to Azure Blob Storage as {blob_name} in {len(parts)} blocks.")
+    except Exception as e:
+        logging.error(f"Block upload of {blob_name} failed; rerun to reuse the staged blocks: {e}")
+        raise
+
+
 # Function to upload data to Azure Blob Storage
 def upload_to_azure(blob_service_client, data, container_name, blob_name):
     try:
-        blob_client = blob_service_client.get_blob_client(container=container_name, blob=blob_name)
-        blob_client.upload_blob(data.to_csv(index=False), overwrite=True)
-        logging.info(f"Data uploaded to Azure Blob Storage as {blob_name}")
+        stream_upload_to_azure(blob_service_client, data, container_name, blob_name)
     except ResourceExistsError as e:
         logging.error(f"Azure Blob {blob_name} already exists: {e}")
     except Exception as e:
@@ -58,8 +336,7 @@ def upload_to_azure(blob_service_client, data, container_name, blob_name):
 # Function to upload data to AWS S3
 def upload_to_s3(s3_client, data, bucket_name, file_name):
     try:
-        s3_client.put_object(Bucket=bucket_name, Key=file_name, Body=data.to_csv(index=False))
-        logging.info(f"Data uploaded to S3 as {file_name}")
+        stream_upload_to_s3(s3_client, data, bucket_name, file_name)
     except NoCredentialsError:
         logging.error("AWS credentials not found.")
     except PartialCredentialsError:
@@ -79,13 +356,8 @@ if __name__ == "__main__":
         azure_connection_string = os.getenv('AZURE_STORAGE_CONNECTION_STRING')
         blob_service_client = BlobServiceClient.from_connection_string(azure_connection_string)
 
-        # Split data into smaller files if necessary
-        data_chunks = split_dataframe(anonymized_data, MAX_FILE_SIZE_MB)
-
-        # Upload each chunk as a separate blob (if needed)
-        for i, chunk in enumerate(data_chunks):
-            blob_name = f'behavior_data_part_{i + 1}.csv' if len(data_chunks) > 1 else 'behavior_data.csv'
-            upload_to_azure(blob_service_client, chunk, 'your-container', blob_name)
+        # Stream the data as one gzip-compressed blob; blocks are staged in parallel
+        upload_to_azure(blob_service_client, anonymized_data, 'your-container', 'behavior_data.csv.gz')
     except Exception as e:
         logging.error(f"Error uploading to Azure: {e}")
 
@@ -94,12 +366,7 @@ if __name__ == "__main__":
         # Get AWS credentials and set up client
         s3_client = boto3.client('s3')
 
-        # Split data into smaller files if necessary
-        data_chunks = split_dataframe(anonymized_data, MAX_FILE_SIZE_MB)
-
-        # Upload each chunk as a separate file in S3 (if needed)
-        for i, chunk in enumerate(data_chunks):
-            file_name = f'behavior_data_part_{i + 1}.csv' if len(data_chunks) > 1 else 'behavior_data.csv'
-            upload_to_s3(s3_client, chunk, 'your-bucket', file_name)
+        # Stream the data as one gzip-compressed object; parts are uploaded in parallel
+        upload_to_s3(s3_client, anonymized_data, 'your-bucket', 'behavior_data.csv.gz')
     except Exception as e:
         logging.error(f"Error uploading to S3: {e}")
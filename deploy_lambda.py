@@ -1,32 +1,38 @@
 import os
 import json
 import logging
-from recommendation_model import get_recommendations, load_data, train_nmf_model
+from serving import cached_recommend, get_model_artifact
 
 # Initialize logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Number of recommendations returned when the event does not specify k
+DEFAULT_TOP_K = int(os.getenv('TOP_K', 10))
 
-# Function to load data and train the model (lazy loading)
+# IVF lists probed per request when the artifact has an ANN index (0 keeps exact scoring)
+DEFAULT_N_PROBE = int(os.getenv('ANN_N_PROBE', 0))
+
+
+# Function to open the prebuilt model artifact (memory-mapped, no training)
 def load_model():
     try:
-        # Load data from the environment variable or use default path
-        data_path = os.getenv('BEHAVIOR_DATA_PATH', 'path_to_your_data.csv')
-        logging.info(f"Loading behavior data from {data_path}...")
-        interaction_matrix = load_data(data_path)
-
-        # Train the NMF model with configurable number of components
-        n_components = int(os.getenv('NMF_COMPONENTS', 15))  # Default to 15 components
-        logging.info(f"Training NMF model with {n_components} components...")
-        model, user_features, item_features = train_nmf_model(interaction_matrix, n_components)
-
-        logging.info("Model loaded and trained successfully.")
-        return model, user_features, item_features
+        # The artifact directory (MODEL_ARTIFACT_DIR) can live in the deployment package, a layer or an EFS mount.
+        # It is opened once per container and kept in module-level state for every warm invocation.
+        return get_model_artifact()
     except Exception as e:
-        logging.error(f"Error loading data or training model: {e}")
+        logging.error(f"Error loading model artifact: {e}")
         raise
 
 
+# Open the artifact during the container's init phase so the first invocation does not pay for it;
+# if that fails, the handler retries on its first call
+if os.getenv('PRELOAD_MODEL', 'True') == 'True':
+    try:
+        load_model()
+    except Exception:
+        logging.warning("Model preload failed; it will be retried on the first invocation.")
+
+
 # Lambda handler
 def lambda_handler(event, context):
     try:
@@ -44,11 +50,18 @@ def lambda_handler(event, context):
                 'body': json.dumps({'error': 'Invalid user_id. It must be a non-negative integer.'})
             }
 
+        k = event.get('k', DEFAULT_TOP_K)
+        if not isinstance(k, int) or isinstance(k, bool) or k <= 0:
+            return {
+                'statusCode': 400,
+                'body': json.dumps({'error': 'Invalid k. It must be a positive integer.'})
+            }
+
         # Load the model and data dynamically (if not already loaded)
-        model, user_features, item_features = load_model()
+        artifact = load_model()
 
-        # Get recommendations
-        recommendations = get_recommendations(user_features, item_features, user_id)
+        # Get the top-k recommendations; the module-level cache persists across warm invocations
+        recommendations = cached_recommend(artifact, user_id, k, DEFAULT_N_PROBE)
 
         # Return recommendations as JSON response
         return {
@@ -0,0 +1,150 @@
+import os
+import shutil
+import logging
+import tempfile
+from concurrent.futures import ProcessPoolExecutor
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from scoring import select_top_k
+from recommendation_model import build_interaction_matrix
+
+# Initialize logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Users scored per block; each block is one (block x components) @ (components x items) product
+EVAL_BLOCK_SIZE = int(os.getenv('EVAL_BLOCK_SIZE', 1024))
+
+# Metrics reported by evaluate_ranking, in report order
+RANKING_METRICS = ('precision', 'recall', 'map', 'ndcg')
+
+# Factors and matrices shared by evaluation workers, memory-mapped from a temporary directory
+_eval_inputs = None
+
+
+# Split interactions into train and test rows: a random fraction, or everything after a timestamp quantile
+def holdout_split(df, test_fraction=0.2, method='random', time_column='timestamp', seed=42):
+    if method == 'time':
+        if time_column not in df.columns:
+            raise ValueError(f"Time-based split needs a '{time_column}' column.")
+        cutoff = df[time_column].quantile(1 - test_fraction)
+        test_mask = (df[time_column] > cutoff).to_numpy()
+    elif method == 'random':
+        test_mask = np.random.default_rng(seed).random(len(df)) < test_fraction
+    else:
+        raise ValueError(f"Unknown split method '{method}'. Use 'random' or 'time'.")
+    logging.info(f"Holdout split ({method}): {int((~test_mask).sum())} train rows, {int(test_mask.sum())} test rows.")
+    return df[~test_mask], df[test_mask]
+
+
+# Build the train matrix and a binary test matrix with the same rows/columns; test users or items unseen in
+# training cannot be scored and are dropped
+def split_matrices(train_df, test_df):
+    train_matrix, user_ids, item_ids = build_interaction_matrix(train_df)
+    test_df = test_df[test_df['interaction'] > 0]
+    rows = pd.Index(user_ids).get_indexer(test_df['user_id'])
+    columns = pd.Index(item_ids).get_indexer(test_df['item_id'])
+    known = (rows >= 0) & (columns >= 0)
+    test_matrix = sparse.csr_matrix((np.ones(int(known.sum()), dtype=np.float32), (rows[known], columns[known])),
+                                    shape=train_matrix.shape)
+    test_matrix.data[:] = 1.0
+    return train_matrix, test_matrix, user_ids, item_ids
+
+
+# Sums of the per-user metrics over one block of users
+def _block_metrics(user_features, item_features, train_matrix, test_matrix, rows, k):
+    scores = np.asarray(user_features[rows], dtype=np.float32) @ np.asarray(item_features, dtype=np.float32)
+    block_rows = np.arange(len(rows))
+
+    # Training interactions are never recommended, so they are masked out before the top-k selection
+    train_block = train_matrix[rows]
+    scores[np.repeat(block_rows, np.diff(train_block.indptr)), train_block.indices] = -np.inf
+    top = select_top_k(scores, k)
+    k = top.shape[1]
+
+    # Hits: (row, item) keys of the top-k lists that are also held-out interactions
+    n_items = scores.shape[1]
+    test_block = test_matrix[rows]
+    n_relevant = np.diff(test_block.indptr)
+    test_keys = np.repeat(block_rows, n_relevant).astype(np.int64) * n_items + test_block.indices
+    hits = np.isin(block_rows[:, None].astype(np.int64) * n_items + top, test_keys)
+
+    ranks = np.arange(1, k + 1)
+    discounts = 1.0 / np.log2(ranks + 1)
+    n_hits = hits.sum(axis=1)
+    ideal_hits = np.minimum(n_relevant, k)
+    average_precision = (np.cumsum(hits, axis=1) / ranks * hits).sum(axis=1) / ideal_hits
+    ideal_dcg = np.concatenate(([0.0], np.cumsum(discounts)))[ideal_hits]
+    return {
+        'precision': float((n_hits / k).sum()),
+        'recall': float((n_hits / n_relevant).sum()),
+        'map': float(average_precision.sum()),
+        'ndcg': float(((hits * discounts).sum(axis=1) / ideal_dcg).sum()),
+    }
+
+
+# Open the shared inputs once per worker process
+def _init_eval_worker(input_dir, train_shape, k):
+    global _eval_inputs
+    matrices = []
+    for name in ('train', 'test'):
+        parts = [np.load(os.path.join(input_dir, f"{name}_{part}.npy"), mmap_mode='r')
+                 for part in ('data', 'indices', 'indptr')]
+        matrices.append(sparse.csr_matrix(tuple(parts), shape=train_shape, copy=False))
+    _eval_inputs = (np.load(os.path.join(input_dir, 'user_features.npy'), mmap_mode='r'),
+                    np.load(os.path.join(input_dir, 'item_features.npy'), mmap_mode='r'),
+                    matrices[0], matrices[1], k)
+
+
+def _evaluate_block(rows):
+    user_features, item_features, train_matrix, test_matrix, k = _eval_inputs
+    return _block_metrics(user_features, item_features, train_matrix, test_matrix, rows, k)
+
+
+# Precision@K, recall@K, MAP@K and NDCG@K averaged over users with held-out interactions.
+# sample_users evaluates a random subset for quick checks; max_workers=1 stays in this process.
+def evaluate_ranking(user_features, item_features, train_matrix, test_matrix, k=10, block_size=EVAL_BLOCK_SIZE,
+                     sample_users=None, max_workers=None, seed=42):
+    try:
+        n_rows = min(user_features.shape[0], test_matrix.shape[0])
+        rows = np.flatnonzero(np.diff(test_matrix.indptr)[:n_rows])
+        if sample_users is not None and sample_users < len(rows):
+            rows = np.sort(np.random.default_rng(seed).choice(rows, sample_users, replace=False))
+        if len(rows) == 0:
+            raise ValueError("No users with held-out interactions to evaluate.")
+        blocks = [rows[start:start + block_size] for start in range(0, len(rows), block_size)]
+        logging.info(f"Evaluating top-{k} rankings for {len(rows)} users in {len(blocks)} blocks...")
+
+        if max_workers == 1 or len(blocks) == 1:
+            results = [_block_metrics(user_features, item_features, train_matrix, test_matrix, block, k)
+                       for block in blocks]
+        else:
+            input_dir = tempfile.mkdtemp(prefix='evaluation-')
+            try:
+                np.save(os.path.join(input_dir, 'user_features.npy'), np.asarray(user_features))
+                np.save(os.path.join(input_dir, 'item_features.npy'), np.asarray(item_features))
+                for name, matrix in (('train', train_matrix), ('test', test_matrix)):
+                    for part in ('data', 'indices', 'indptr'):
+                        np.save(os.path.join(input_dir, f"{name}_{part}.npy"), getattr(matrix, part))
+                with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_eval_worker,
+                                         initargs=(input_dir, train_matrix.shape, k)) as executor:
+                    results = list(executor.map(_evaluate_block, blocks))
+            finally:
+                shutil.rmtree(input_dir, ignore_errors=True)
+
+        metrics = {name: sum(result[name] for result in results) / len(rows) for name in RANKING_METRICS}
+        metrics.update({'k': k, 'n_users': int(len(rows))})
+        logging.info(f"Ranking evaluation: {metrics}")
+        return metrics
+    except Exception as e:
+        logging.error(f"An error occurred during ranking evaluation: {e}")
+        raise
+
+
+# Metrics that dropped by more than `threshold` (relative) from the baseline; empty when nothing regressed
+def metric_regressions(metrics, baseline, threshold=0.05):
+    regressions = {}
+    for name in RANKING_METRICS:
+        if baseline.get(name) and metrics.get(name, 0.0) < baseline[name] * (1 - threshold):
+            regressions[name] = {'baseline': baseline[name], 'current': metrics.get(name, 0.0)}
+    return regressions
@@ -0,0 +1,260 @@
+import os
+import logging
+import numpy as np
+import pandas as pd
+from scipy import sparse
+from model_artifact import (load_model_artifact, save_model_artifact, interaction_arrays, publish_lock,
+                            publish_version, resolve_latest_version, BLOCKLIST_ARRAY)
+from quantization import quantize_item_factors, quantized_index_from_artifact
+from ann_index import build_ivf_index
+
+# Initialize logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Multiplicative-update iterations used to solve folded-in user vectors
+FOLD_IN_ITERATIONS = int(os.getenv('FOLD_IN_ITERATIONS', 100))
+
+# Guards the multiplicative updates against division by zero
+EPSILON = 1e-10
+
+# Artifact arrays derived from the item factors alone; still valid while item factors are unchanged
+ITEM_DERIVED_PREFIXES = ('ivf_', 'quantized_')
+
+# Raw (user_id, item_id, interaction) rows folded in since the last full retrain, carried by every later version
+# until the retrain's source data contains them
+FOLD_IN_LOG_ARRAYS = ('fold_in_user_ids', 'fold_in_item_ids', 'fold_in_values')
+
+
+# Constant starting value for new user vectors, scaled like sklearn's random NMF init
+def _default_init(interactions, n_components):
+    density_mean = interactions.sum() / max(interactions.shape[0] * interactions.shape[1], 1)
+    return np.full((interactions.shape[0], n_components), np.sqrt(density_mean / n_components))
+
+
+# Solve non-negative user vectors against fixed item factors (NMF multiplicative updates for W)
+def solve_user_factors(interactions, item_features, init=None, n_iter=FOLD_IN_ITERATIONS):
+    item_features = np.asarray(item_features)
+    numerator = np.asarray(interactions @ item_features.T)
+    gram = item_features @ item_features.T
+    if init is None:
+        init = _default_init(interactions, item_features.shape[0])
+    # Multiplicative updates never move a zero entry, so start every component strictly positive
+    user_features = np.maximum(np.asarray(init, dtype=item_features.dtype), 1e-6)
+    for _ in range(n_iter):
+        user_features *= numerator / (user_features @ gram + EPSILON)
+    return user_features
+
+
+# Refresh the factors of the given items against the full interaction matrix and fixed user vectors
+def refresh_item_factors(interaction_matrix, user_features, item_features, item_indices, n_iter=FOLD_IN_ITERATIONS):
+    columns = interaction_matrix.tocsc()[:, item_indices]
+    numerator = np.asarray(columns.T @ user_features).T
+    gram = user_features.T @ user_features
+    refreshed = np.maximum(np.array(item_features[:, item_indices]), 1e-6)
+    for _ in range(n_iter):
+        refreshed *= numerator / (gram @ refreshed + EPSILON)
+    item_features = np.array(item_features)
+    item_features[:, item_indices] = refreshed
+    return item_features
+
+
+# Drop the precomputed top-n rows of the given users (they fall back to live scoring) and pad for new users
+def _invalidate_top_n_rows(items, offsets, user_rows, n_users):
+    lengths = np.diff(offsets)
+    keep_rows = np.ones(len(lengths), dtype=bool)
+    keep_rows[user_rows[user_rows < len(lengths)]] = False
+    kept_items = items[np.repeat(keep_rows, lengths)]
+    new_lengths = np.zeros(n_users, dtype=np.int64)
+    new_lengths[:len(lengths)] = np.where(keep_rows, lengths, 0)
+    new_offsets = np.zeros(n_users + 1, dtype=np.int64)
+    np.cumsum(new_lengths, out=new_offsets[1:])
+    return {'top_n_items': kept_items, 'top_n_offsets': new_offsets}
+
+
+# Map new interaction rows onto artifact rows/columns, appending rows for unseen users
+def _map_new_interactions(artifact, new_interactions):
+    item_columns = pd.Index(artifact.item_ids).get_indexer(new_interactions['item_id'])
+    unknown_items = item_columns < 0
+    if unknown_items.any():
+        logging.warning(f"Skipping {int(unknown_items.sum())} interactions with items unknown to the model; "
+                        "they are kept in the fold-in log and picked up by the next full retrain.")
+        new_interactions = new_interactions[~unknown_items]
+        item_columns = item_columns[~unknown_items]
+
+    user_rows = pd.Index(artifact.user_ids).get_indexer(new_interactions['user_id'])
+    new_user_ids = pd.unique(new_interactions['user_id'][user_rows < 0])
+    if len(new_user_ids):
+        new_rows = pd.Index(new_user_ids).get_indexer(new_interactions['user_id'][user_rows < 0])
+        user_rows[user_rows < 0] = artifact.n_users + new_rows
+    values = new_interactions['interaction'].to_numpy(dtype=np.float32)
+    user_row_map = dict(zip(new_interactions['user_id'].tolist(), user_rows.tolist()))
+    return user_rows, item_columns, values, np.asarray(new_user_ids), user_row_map
+
+
+# The fold-in log of an artifact as a DataFrame (empty when nothing was folded in since the last retrain)
+def fold_in_log(artifact):
+    if not all(name in artifact.arrays for name in FOLD_IN_LOG_ARRAYS):
+        return pd.DataFrame({'user_id': artifact.user_ids[:0], 'item_id': artifact.item_ids[:0],
+                             'interaction': np.zeros(0, dtype=np.float32)})
+    return pd.DataFrame({'user_id': np.asarray(artifact.arrays['fold_in_user_ids']),
+                         'item_id': np.asarray(artifact.arrays['fold_in_item_ids']),
+                         'interaction': np.asarray(artifact.arrays['fold_in_values'])})
+
+
+# Artifact arrays storing a fold-in log
+def fold_in_log_arrays(log):
+    return {'fold_in_user_ids': log['user_id'].to_numpy(), 'fold_in_item_ids': log['item_id'].to_numpy(),
+            'fold_in_values': log['interaction'].to_numpy(dtype=np.float32)}
+
+
+# Append a batch to a fold-in log: duplicates within the batch average out and replace earlier logged values
+def _extend_fold_in_log(log, new_interactions):
+    batch = new_interactions.astype({'user_id': log['user_id'].dtype, 'item_id': log['item_id'].dtype})
+    batch = batch.groupby(['user_id', 'item_id'], sort=False)['interaction'].mean().reset_index()
+    replaced = pd.MultiIndex.from_frame(log[['user_id', 'item_id']]).isin(
+        pd.MultiIndex.from_frame(batch[['user_id', 'item_id']]))
+    batch['interaction'] = batch['interaction'].astype(np.float32)
+    return pd.concat([log[~replaced], batch], ignore_index=True)
+
+
+# Apply a fold-in log to a freshly built interaction matrix, appending users and items it does not know yet.
+# Returns (matrix, user_ids, item_ids, log), where the log keeps only the rows the source data does not already
+# contain with the same value; the rest are consolidated and need not be carried any further.
+def apply_fold_in_log(interaction_matrix, user_ids, item_ids, log):
+    if log.empty:
+        return interaction_matrix, user_ids, item_ids, log
+    new_user_ids = pd.unique(log['user_id'][~np.isin(log['user_id'], user_ids)])
+    new_item_ids = pd.unique(log['item_id'][~np.isin(log['item_id'], item_ids)])
+    user_ids = np.concatenate([user_ids, np.asarray(new_user_ids, dtype=user_ids.dtype)])
+    item_ids = np.concatenate([item_ids, np.asarray(new_item_ids, dtype=item_ids.dtype)])
+    rows = pd.Index(user_ids).get_indexer(log['user_id'])
+    columns = pd.Index(item_ids).get_indexer(log['item_id'])
+    values = log['interaction'].to_numpy(dtype=np.float32)
+
+    stored = sparse.csr_matrix(interaction_matrix)
+    stored.resize((len(user_ids), len(item_ids)))
+    absorbed = np.asarray(stored[rows, columns]).ravel() == values
+    logging.info(f"Applying {len(log)} folded-in interactions ({len(new_user_ids)} new users, "
+                 f"{len(new_item_ids)} new items); {int(absorbed.sum())} are already in the source data.")
+    return _replace_pairs(stored, rows, columns, values), user_ids, item_ids, log[~absorbed].reset_index(drop=True)
+
+
+# Merge new interactions into the stored matrix; a new value for an existing pair replaces the old one
+def _merge_interactions(artifact, user_rows, item_columns, values, n_users):
+    shape = (n_users, artifact.n_items)
+    data, indices, indptr = artifact.interactions
+    padded_indptr = np.concatenate([indptr, np.full(n_users - artifact.n_users, indptr[-1], dtype=indptr.dtype)])
+    stored = sparse.csr_matrix((data, indices, padded_indptr), shape=shape)
+    return _replace_pairs(stored, user_rows, item_columns, values)
+
+
+# Replace the given (row, column) entries of a CSR matrix with new values
+def _replace_pairs(stored, user_rows, item_columns, values):
+    shape = stored.shape
+    # Average duplicates within the update itself, as build_interaction_matrix does
+    updates = sparse.csr_matrix((values, (user_rows, item_columns)), shape=shape)
+    counts = sparse.csr_matrix((np.ones_like(values), (user_rows, item_columns)), shape=shape)
+    updates.data /= counts.data
+    pattern = counts.copy()
+    pattern.data[:] = 1
+
+    merged = (stored - stored.multiply(pattern) + updates).tocsr()
+    merged.eliminate_zeros()
+    return merged.astype(np.float32)
+
+
+# Fold new interactions into a trained model without retraining it; returns the new artifact arrays
+def fold_in_interactions(artifact, new_interactions, n_iter=FOLD_IN_ITERATIONS, refresh_passes=0):
+    if new_interactions.empty or not {'user_id', 'item_id', 'interaction'}.issubset(new_interactions.columns):
+        logging.error("Invalid data format. Dataframe must contain 'user_id', 'item_id', and 'interaction' columns.")
+        raise ValueError("Invalid data format.")
+    if artifact.interactions is None:
+        raise ValueError(f"Model artifact {artifact.version} does not store its training interactions.")
+
+    try:
+        user_rows, item_columns, values, new_user_ids, user_row_map = _map_new_interactions(artifact,
+                                                                                             new_interactions)
+        n_users = artifact.n_users + len(new_user_ids)
+        interaction_matrix = _merge_interactions(artifact, user_rows, item_columns, values, n_users)
+        affected_users = np.unique(user_rows)
+        logging.info(f"Folding in {len(affected_users)} users ({len(new_user_ids)} new)...")
+
+        # Existing users warm-start from their current vectors; new users start from the default init
+        n_components = artifact.user_features.shape[1]
+        user_features = np.empty((n_users, n_components), dtype=artifact.user_features.dtype)
+        user_features[:artifact.n_users] = artifact.user_features
+        affected_rows = interaction_matrix[affected_users]
+        init = _default_init(affected_rows, n_components)
+        existing = affected_users < artifact.n_users
+        init[existing] = artifact.user_features[affected_users[existing]]
+        item_features = artifact.item_features
+        user_features[affected_users] = solve_user_factors(affected_rows, item_features, init, n_iter)
+
+        # Optionally refresh the touched items, then re-solve the affected users against them
+        touched_items = np.unique(item_columns)
+        for _ in range(refresh_passes):
+            item_features = refresh_item_factors(interaction_matrix, user_features, item_features, touched_items, n_iter)
+            user_features[affected_users] = solve_user_factors(affected_rows, item_features,
+                                                               user_features[affected_users], n_iter)
+
+        arrays = {name: array for name, array in artifact.arrays.items()
+                  if refresh_passes == 0 and name.startswith(ITEM_DERIVED_PREFIXES)}
+        # The item columns are unchanged, so the blocklist carries over as is
+        if BLOCKLIST_ARRAY in artifact.arrays:
+            arrays[BLOCKLIST_ARRAY] = artifact.arrays[BLOCKLIST_ARRAY]
+        # Refreshed item factors are re-quantized and re-indexed so int8 and ANN serving stay in sync with them
+        if refresh_passes > 0 and quantized_index_from_artifact(artifact) is not None:
+            arrays.update(quantize_item_factors(item_features))
+        if refresh_passes > 0 and 'ivf_offsets' in artifact.arrays:
+            arrays.update(build_ivf_index(item_features, n_lists=len(artifact.arrays['ivf_offsets']) - 1))
+        # The raw rows go into the log, including those for unknown items, so the next retrain trains on them
+        arrays.update(fold_in_log_arrays(_extend_fold_in_log(fold_in_log(artifact),
+                                                             new_interactions[['user_id', 'item_id', 'interaction']])))
+        arrays.update({
+            'user_features': user_features,
+            'item_features': item_features,
+            'user_ids': np.concatenate([artifact.user_ids, new_user_ids.astype(artifact.user_ids.dtype)]),
+            'item_ids': artifact.item_ids,
+        })
+        arrays.update(interaction_arrays(interaction_matrix))
+        # Unaffected users keep their precomputed lists unless item factors were refreshed
+        if refresh_passes == 0 and 'top_n_items' in artifact.arrays:
+            arrays.update(_invalidate_top_n_rows(artifact.arrays['top_n_items'], artifact.arrays['top_n_offsets'],
+                                                 affected_users, n_users))
+        metadata = dict(artifact.manifest.get('metadata', {}))
+        metadata.update({
+            'parent_version': artifact.version,
+            'folded_in_users': int(len(affected_users)),
+            'new_users': int(len(new_user_ids)),
+            'refresh_passes': int(refresh_passes),
+        })
+        logging.info("Fold-in complete.")
+        return arrays, metadata, user_row_map
+    except Exception as e:
+        logging.error(f"An error occurred while folding in new interactions: {e}")
+        raise
+
+
+# Fold new interactions into the published version and publish the result as a new version. The parent is read
+# from LATEST under the cross-process publish lock, so a fold-in in another worker or a nightly publish is never
+# overwritten, and the returned user rows belong to the version that is actually published.
+def publish_fold_in(root_dir, new_interactions, n_iter=FOLD_IN_ITERATIONS, refresh_passes=0):
+    with publish_lock(root_dir):
+        parent_version = resolve_latest_version(root_dir)
+        artifact = load_model_artifact(root_dir, parent_version)
+        arrays, metadata, user_row_map = fold_in_interactions(artifact, new_interactions, n_iter, refresh_passes)
+        version = save_model_artifact(root_dir, arrays, metadata=metadata, publish=False)
+        publish_version(root_dir, version, expected_latest=parent_version)
+    return version, user_row_map
+
+
+if __name__ == "__main__":
+    try:
+        # Fold a CSV of new interactions into the published model
+        artifact_dir = os.getenv('MODEL_ARTIFACT_DIR', 'model_artifacts')
+        new_data_path = os.getenv('NEW_INTERACTIONS_PATH', 'path_to_new_interactions.csv')
+        refresh_passes = int(os.getenv('FOLD_IN_REFRESH_PASSES', 0))
+        new_version, _ = publish_fold_in(artifact_dir, pd.read_csv(new_data_path), refresh_passes=refresh_passes)
+        logging.info(f"Published folded-in model version {new_version}.")
+    except Exception as e:
+        logging.error(f"An error occurred in the main execution: {e}")
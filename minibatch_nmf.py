@@ -0,0 +1,139 @@
+import os
+import json
+import logging
+from dataclasses import dataclass
+import numpy as np
+from scipy import sparse
+
+# Initialize logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Users per row block, passes over the data for the item factors, and W updates per block
+MINIBATCH_NMF_BATCH_SIZE = int(os.getenv('MINIBATCH_NMF_BATCH_SIZE', 4096))
+MINIBATCH_NMF_EPOCHS = int(os.getenv('MINIBATCH_NMF_EPOCHS', 5))
+MINIBATCH_NMF_W_ITER = int(os.getenv('MINIBATCH_NMF_W_ITER', 20))
+
+# Weight of past blocks in the item-factor statistics, per full pass over the users
+FORGET_FACTOR = 0.7
+
+# Guards the multiplicative updates against division by zero
+EPSILON = 1e-10
+
+# Files of an interaction matrix saved for memory-mapped training
+CSR_FILES = ('data', 'indices', 'indptr')
+
+
+# The fitted model: the sklearn NMF attributes the DAG, validation and artifact export read
+@dataclass
+class MiniBatchNMFModel:
+    n_components: int
+    components_: np.ndarray
+    reconstruction_err_: float
+    n_iter_: int
+
+
+# Save a CSR interaction matrix as .npy files so training can memory-map it instead of holding it in RAM
+def save_interaction_matrix(interaction_matrix, directory):
+    os.makedirs(directory, exist_ok=True)
+    for name in CSR_FILES:
+        np.save(os.path.join(directory, f"{name}.npy"), getattr(interaction_matrix, name))
+    with open(os.path.join(directory, 'shape.json'), 'w') as f:
+        json.dump(list(interaction_matrix.shape), f)
+    return directory
+
+
+# Open a saved interaction matrix memory-mapped; row slices only read the pages of those rows
+def open_interaction_matrix(directory):
+    with open(os.path.join(directory, 'shape.json')) as f:
+        shape = tuple(json.load(f))
+    parts = [np.load(os.path.join(directory, f"{name}.npy"), mmap_mode='r') for name in CSR_FILES]
+    return sparse.csr_matrix(tuple(parts), shape=shape, copy=False)
+
+
+# Solve a block of user vectors against fixed item factors with multiplicative updates, given the block's
+# numerator X_block H^T and the Gram matrix H H^T
+def _solve_block(numerator, gram, init, n_iter):
+    user_block = np.maximum(init, 1e-6)
+    for _ in range(n_iter):
+        user_block *= numerator / (user_block @ gram + EPSILON)
+    return user_block
+
+
+# Starting values for a block of user vectors: the warm-start rows when given, else a constant
+def _block_init(init_user, start, end, n_components, scale, dtype):
+    if init_user is not None:
+        return np.array(init_user[start:end], dtype=dtype)
+    return np.full((end - start, n_components), scale, dtype=dtype)
+
+
+# Train NMF block by block: only the k x items item factors and their k x items statistics stay resident.
+# interaction_matrix may be a (memory-mapped) CSR matrix or a directory written by save_interaction_matrix;
+# user_features_path writes the user factors to a memory-mapped .npy file instead of RAM.
+def train_minibatch_nmf(interaction_matrix, n_components=15, init_factors=None, batch_size=MINIBATCH_NMF_BATCH_SIZE,
+                        n_epochs=MINIBATCH_NMF_EPOCHS, w_iter=MINIBATCH_NMF_W_ITER, user_features_path=None,
+                        random_state=42):
+    logging.info(f"Training minibatch NMF model with {n_components} components...")
+    try:
+        if isinstance(interaction_matrix, str):
+            interaction_matrix = open_interaction_matrix(interaction_matrix)
+        n_users, n_items = interaction_matrix.shape
+        dtype = np.float32
+        blocks = [(start, min(start + batch_size, n_users)) for start in range(0, n_users, batch_size)]
+
+        # Same scale as sklearn's random init: sqrt(mean / k)
+        scale = np.sqrt(float(np.sum(interaction_matrix.data, dtype=np.float64)) / (n_users * n_items) / n_components)
+        rng = np.random.default_rng(random_state)
+        init_user = None
+        if init_factors is None:
+            item_features = (scale * rng.random((n_components, n_items))).astype(dtype)
+        else:
+            init_user, init_item = init_factors
+            item_features = np.array(init_item, dtype=dtype)
+        item_features = np.maximum(item_features, 1e-6)
+
+        # Online sufficient statistics for the item factors: A ~ W^T X and B ~ W^T W, with older blocks decayed
+        numerator_stats = np.zeros((n_components, n_items), dtype=dtype)
+        gram_stats = np.zeros((n_components, n_components), dtype=dtype)
+        forget = FORGET_FACTOR ** (batch_size / max(n_users, 1))
+        for epoch in range(n_epochs):
+            for block_number in rng.permutation(len(blocks)):
+                start, end = blocks[block_number]
+                block = interaction_matrix[start:end]
+                gram = item_features @ item_features.T
+                user_block = _solve_block(np.asarray(block @ item_features.T), gram,
+                                          _block_init(init_user, start, end, n_components, scale, dtype), w_iter)
+                numerator_stats *= forget
+                numerator_stats += np.asarray(block.T @ user_block).T
+                gram_stats *= forget
+                gram_stats += user_block.T @ user_block
+                item_features *= numerator_stats / (gram_stats @ item_features + EPSILON)
+            logging.info(f"Minibatch NMF epoch {epoch + 1}/{n_epochs} complete.")
+
+        # Second pass: final user factors against the final item factors, block by block, plus the exact error
+        if user_features_path is None:
+            user_features = np.empty((n_users, n_components), dtype=dtype)
+        else:
+            user_features = np.lib.format.open_memmap(user_features_path, mode='w+', dtype=dtype,
+                                                      shape=(n_users, n_components))
+        gram = item_features @ item_features.T
+        squared_error = 0.0
+        for start, end in blocks:
+            block = interaction_matrix[start:end]
+            numerator = np.asarray(block @ item_features.T)
+            user_block = _solve_block(numerator, gram, _block_init(init_user, start, end, n_components, scale, dtype),
+                                      w_iter)
+            user_features[start:end] = user_block
+            # ||X - WH||^2 = ||X||^2 - 2 <W, X H^T> + <W^T W, H H^T>, without materializing WH
+            squared_error += (float(np.dot(block.data, block.data)) - 2.0 * float(np.sum(user_block * numerator))
+                              + float(np.sum((user_block.T @ user_block) * gram)))
+        if user_features_path is not None:
+            user_features.flush()
+
+        model = MiniBatchNMFModel(n_components=n_components, components_=item_features,
+                                  reconstruction_err_=float(np.sqrt(max(squared_error, 0.0))), n_iter_=n_epochs)
+        logging.info(f"Minibatch NMF training complete after {n_epochs} epochs "
+                     f"(reconstruction error {model.reconstruction_err_:.4f}).")
+        return model, user_features, item_features
+    except Exception as e:
+        logging.error(f"An error occurred during minibatch NMF training: {e}")
+        raise
@@ -0,0 +1,243 @@
+import os
+import json
+import fcntl
+import shutil
+import logging
+import threading
+from contextlib import contextmanager
+from dataclasses import dataclass
+from datetime import datetime, timezone
+import numpy as np
+
+# Initialize logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# On-disk layout: <root>/<version>/{manifest.json, <name>.npy, ...} plus a <root>/LATEST pointer file
+ARTIFACT_FORMAT_VERSION = 1
+MANIFEST_FILE = 'manifest.json'
+LATEST_POINTER = 'LATEST'
+PUBLISH_LOCK_FILE = '.publish.lock'
+REQUIRED_ARRAYS = ('user_features', 'item_features', 'user_ids', 'item_ids')
+INTERACTION_ARRAYS = ('interactions_data', 'interactions_indices', 'interactions_indptr')
+
+# Global item blocklist, stored as a packed bitmap over item columns (one bit per item)
+BLOCKLIST_ARRAY = 'blocked_items_bitmap'
+
+
+# Immutable handle on a loaded model version; arrays are read-only memory maps when loaded from disk
+@dataclass(frozen=True)
+class ModelArtifact:
+    version: str
+    path: str
+    manifest: dict
+    arrays: dict
+
+    @property
+    def user_features(self):
+        return self.arrays['user_features']
+
+    @property
+    def item_features(self):
+        return self.arrays['item_features']
+
+    @property
+    def user_ids(self):
+        return self.arrays['user_ids']
+
+    @property
+    def item_ids(self):
+        return self.arrays['item_ids']
+
+    @property
+    def n_users(self):
+        return self.user_features.shape[0]
+
+    @property
+    def n_items(self):
+        return self.item_features.shape[1]
+
+    # CSR parts (data, indices, indptr) of the training interactions, or None if they were not stored
+    @property
+    def interactions(self):
+        if not all(name in self.arrays for name in INTERACTION_ARRAYS):
+            return None
+        return tuple(self.arrays[name] for name in INTERACTION_ARRAYS)
+
+    # Boolean mask of blocklisted item columns (unpacked from the stored bitmap), or None without a blocklist
+    @property
+    def blocked_items(self):
+        if BLOCKLIST_ARRAY not in self.arrays:
+            return None
+        return np.unpackbits(self.arrays[BLOCKLIST_ARRAY], count=self.n_items).astype(bool)
+
+
+# Split a CSR interaction matrix into the raw arrays stored in an artifact
+def interaction_arrays(interaction_matrix):
+    return dict(zip(INTERACTION_ARRAYS, (interaction_matrix.data, interaction_matrix.indices,
+                                         interaction_matrix.indptr)))
+
+
+# Pack the blocklisted raw item ids into the bitmap array stored in an artifact
+def blocklist_arrays(item_ids, blocked_item_ids):
+    return {BLOCKLIST_ARRAY: np.packbits(np.isin(item_ids, blocked_item_ids))}
+
+
+# Build a sortable, unique version name for a new artifact
+def new_version_name():
+    return datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%fZ')
+
+
+# Write a JSON file atomically so readers never observe a partial manifest or pointer
+def _write_json_atomic(path, payload):
+    tmp_path = f"{path}.tmp-{os.getpid()}"
+    with open(tmp_path, 'w') as f:
+        json.dump(payload, f, indent=2, sort_keys=True)
+    os.replace(tmp_path, path)
+
+
+# Write each array as a raw .npy block and return its manifest entries
+def _write_arrays(directory, arrays):
+    entries = {}
+    for name, array in arrays.items():
+        array = np.ascontiguousarray(array)
+        file_name = f"{name}.npy"
+        np.save(os.path.join(directory, file_name), array, allow_pickle=False)
+        entries[name] = {'file': file_name, 'dtype': array.dtype.str, 'shape': list(array.shape)}
+    return entries
+
+
+# Raised when LATEST moved between reading a parent version and publishing a version derived from it
+class StalePublishError(RuntimeError):
+    pass
+
+
+# Directories whose publish lock the current thread holds, so nested publish_lock calls do not deadlock
+_held_publish_locks = threading.local()
+
+
+# Cross-process lock (flock on <root>/.publish.lock) around reading LATEST, deriving a version and publishing it
+@contextmanager
+def publish_lock(root_dir):
+    lock_path = os.path.abspath(os.path.join(root_dir, PUBLISH_LOCK_FILE))
+    held = _held_publish_locks.__dict__.setdefault('paths', set())
+    if lock_path in held:
+        yield
+        return
+    os.makedirs(root_dir, exist_ok=True)
+    with open(lock_path, 'a') as lock_file:
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        held.add(lock_path)
+        try:
+            yield
+        finally:
+            held.discard(lock_path)
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+# Point the LATEST pointer at the given version; with expected_latest, refuse if the pointer no longer refers
+# to the version the new one was derived from
+def publish_version(root_dir, version, expected_latest=None):
+    with publish_lock(root_dir):
+        if expected_latest is not None:
+            latest = resolve_latest_version(root_dir)
+            if latest != expected_latest:
+                raise StalePublishError(f"LATEST moved from {expected_latest} to {latest}; "
+                                        f"version {version} was not published.")
+        tmp_path = os.path.join(root_dir, f"{LATEST_POINTER}.tmp-{os.getpid()}")
+        with open(tmp_path, 'w') as f:
+            f.write(version)
+        os.replace(tmp_path, os.path.join(root_dir, LATEST_POINTER))
+    logging.info(f"Published model artifact version {version} in {root_dir}.")
+
+
+# Resolve the version the LATEST pointer refers to
+def resolve_latest_version(root_dir):
+    pointer_path = os.path.join(root_dir, LATEST_POINTER)
+    try:
+        with open(pointer_path) as f:
+            return f.read().strip()
+    except FileNotFoundError:
+        logging.error(f"No published model artifact found in {root_dir}. Run the training pipeline first.")
+        raise
+
+
+# Save a trained model as a versioned artifact directory
+def save_model_artifact(root_dir, arrays, metadata=None, version=None, publish=True):
+    missing = [name for name in REQUIRED_ARRAYS if name not in arrays]
+    if missing:
+        raise ValueError(f"Model artifact is missing required arrays: {missing}")
+    version = version or new_version_name()
+    os.makedirs(root_dir, exist_ok=True)
+    final_dir = os.path.join(root_dir, version)
+    staging_dir = os.path.join(root_dir, f".staging-{version}")
+    try:
+        # Write into a staging directory first so a crash never leaves a half-written version behind
+        os.makedirs(staging_dir)
+        manifest = {
+            'format_version': ARTIFACT_FORMAT_VERSION,
+            'version': version,
+            'created_at': datetime.now(timezone.utc).isoformat(),
+            'arrays': _write_arrays(staging_dir, arrays),
+            'metadata': metadata or {},
+        }
+        _write_json_atomic(os.path.join(staging_dir, MANIFEST_FILE), manifest)
+        os.replace(staging_dir, final_dir)
+        logging.info(f"Model artifact version {version} written to {final_dir}.")
+    except Exception as e:
+        logging.error(f"An error occurred while saving the model artifact: {e}")
+        shutil.rmtree(staging_dir, ignore_errors=True)
+        raise
+    if publish:
+        publish_version(root_dir, version)
+    return version
+
+
+# Add extra arrays (e.g. indexes or precomputed tables) to an existing artifact version
+def add_artifact_arrays(root_dir, version, arrays, metadata=None):
+    version_dir = os.path.join(root_dir, version)
+    manifest_path = os.path.join(version_dir, MANIFEST_FILE)
+    with open(manifest_path) as f:
+        manifest = json.load(f)
+    manifest['arrays'].update(_write_arrays(version_dir, arrays))
+    if metadata:
+        manifest['metadata'].update(metadata)
+    _write_json_atomic(manifest_path, manifest)
+    logging.info(f"Added arrays {sorted(arrays)} to model artifact version {version}.")
+    return manifest
+
+
+# Published and unpublished versions in an artifact directory, oldest first (version names sort by time)
+def list_versions(root_dir):
+    if not os.path.isdir(root_dir):
+        return []
+    return sorted(name for name in os.listdir(root_dir)
+                  if not name.startswith('.') and os.path.isfile(os.path.join(root_dir, name, MANIFEST_FILE)))
+
+
+# Delete a version directory; the published version is never deleted
+def delete_version(root_dir, version):
+    pointer_path = os.path.join(root_dir, LATEST_POINTER)
+    if os.path.exists(pointer_path) and resolve_latest_version(root_dir) == version:
+        raise ValueError(f"Version {version} is published and cannot be deleted.")
+    shutil.rmtree(os.path.join(root_dir, version))
+    logging.info(f"Deleted model artifact version {version} from {root_dir}.")
+
+
+# Open a model artifact; with mmap_mode='r' the arrays are shared page-cache mappings, not copies
+def load_model_artifact(root_dir, version=None, mmap_mode='r'):
+    try:
+        version = version or resolve_latest_version(root_dir)
+        version_dir = os.path.join(root_dir, version)
+        with open(os.path.join(version_dir, MANIFEST_FILE)) as f:
+            manifest = json.load(f)
+        if manifest.get('format_version') != ARTIFACT_FORMAT_VERSION:
+            raise ValueError(f"Unsupported model artifact format: {manifest.get('format_version')}")
+
+        arrays = {}
+        for name, entry in manifest['arrays'].items():
+            arrays[name] = np.load(os.path.join(version_dir, entry['file']), mmap_mode=mmap_mode, allow_pickle=False)
+        logging.info(f"Model artifact version {version} loaded from {version_dir}.")
+        return ModelArtifact(version=version, path=version_dir, manifest=manifest, arrays=arrays)
+    except Exception as e:
+        logging.error(f"An error occurred while loading the model artifact: {e}")
+        raise
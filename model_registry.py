@@ -0,0 +1,188 @@
+import os
+import time
+import signal
+import logging
+import weakref
+import threading
+from collections import deque
+from datetime import datetime, timezone
+from model_artifact import load_model_artifact, resolve_latest_version, LATEST_POINTER
+from serving import active_model_artifact, set_model_artifact, item_exclusions
+from monitoring import get_metrics_emitter
+
+# Initialize logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Seconds between checks of the LATEST pointer (0 disables polling; reloads then need SIGHUP or the admin endpoint)
+MODEL_RELOAD_INTERVAL = float(os.getenv('MODEL_RELOAD_INTERVAL', 30))
+
+# Reload as soon as a worker process receives SIGHUP (send it to the workers, not the server's master process)
+MODEL_RELOAD_ON_SIGHUP = os.getenv('MODEL_RELOAD_ON_SIGHUP', 'True') == 'True'
+
+# Swap records kept for the admin endpoint
+SWAP_HISTORY_SIZE = 20
+
+
+# Touch every page of the factors so the first requests on the new version do not page them in
+def _warm_up(artifact):
+    for array in (artifact.user_features, artifact.item_features):
+        if array.size:
+            array.sum()
+    item_exclusions(artifact)
+
+
+# Watches a model directory's LATEST pointer and hot-swaps the served artifact in the background.
+# Each worker process runs its own registry; they all follow the same pointer, so threaded and multi-process
+# deployments converge on the published version without a restart.
+class ModelRegistry:
+    def __init__(self, artifact_dir=None, poll_interval=MODEL_RELOAD_INTERVAL, reload_on_sighup=MODEL_RELOAD_ON_SIGHUP):
+        self.artifact_dir = artifact_dir or os.getenv('MODEL_ARTIFACT_DIR', 'model_artifacts')
+        self.poll_interval = poll_interval
+        self.reload_on_sighup = reload_on_sighup
+        self.swaps = deque(maxlen=SWAP_HISTORY_SIZE)
+        self.checks = 0
+        self.errors = 0
+        self.last_error = None
+        self._pointer_mtime = None
+        self._reload_lock = threading.Lock()
+        self._start_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._pid = None
+        self._thread = None
+
+    # Start the polling thread (idempotent); a forked child gets its own from _restart_after_fork, as threads do not
+    # survive a fork
+    def start(self):
+        with self._start_lock:
+            if self._pid == os.getpid():
+                return self
+            self._pid = os.getpid()
+            self._pointer_mtime = None
+            if self.reload_on_sighup and threading.current_thread() is threading.main_thread():
+                # The handler only wakes the watcher; loading never runs inside a signal handler
+                signal.signal(signal.SIGHUP, lambda signum, frame: self._wake.set())
+            if self.poll_interval > 0 or self.reload_on_sighup:
+                self._thread = threading.Thread(target=self._run, name='model-registry', daemon=True)
+                self._thread.start()
+            logging.info(f"Model registry watching {os.path.join(self.artifact_dir, LATEST_POINTER)} "
+                         f"in process {self._pid}.")
+        return self
+
+    def _run(self):
+        while True:
+            woken = self._wake.wait(self.poll_interval if self.poll_interval > 0 else None)
+            self._wake.clear()
+            try:
+                self.check(trigger='signal' if woken else 'poll')
+            except Exception:
+                # Already logged and counted; keep serving the current version and retry on the next check
+                pass
+
+    # Swap in the version LATEST points to if it differs from the served one (or always with force);
+    # returns the swap record, or None when nothing changed
+    def check(self, force=False, trigger='poll'):
+        with self._reload_lock:
+            self.checks += 1
+            pointer_path = os.path.join(self.artifact_dir, LATEST_POINTER)
+            try:
+                mtime = os.stat(pointer_path).st_mtime_ns
+                current = active_model_artifact()
+                # Polls that see an unchanged pointer cost one stat call
+                if not force and current is not None and mtime == self._pointer_mtime:
+                    return None
+                version = resolve_latest_version(self.artifact_dir)
+                self._pointer_mtime = mtime
+                if not force and current is not None and current.version == version:
+                    return None
+                return self._swap(version, current, trigger)
+            except Exception as e:
+                self.errors += 1
+                self.last_error = str(e)
+                logging.error(f"Error reloading the model from {self.artifact_dir}: {e}")
+                raise
+
+    # Force a reload now (admin endpoint), even when the pointer has not changed
+    def reload(self):
+        return self.check(force=True, trigger='admin')
+
+    def _swap(self, version, previous, trigger):
+        logging.info(f"Loading model version {version} in the background...")
+        start = time.perf_counter()
+        artifact = load_model_artifact(self.artifact_dir, version)
+        loaded = time.perf_counter()
+        _warm_up(artifact)
+        warmed = time.perf_counter()
+        # Requests already running keep a reference to the previous artifact and finish on it
+        set_model_artifact(artifact)
+        swapped = time.perf_counter()
+
+        record = {
+            'version': version,
+            'previous_version': previous.version if previous is not None else None,
+            'trigger': trigger,
+            'swapped_at': datetime.now(timezone.utc).isoformat(),
+            'load_seconds': loaded - start,
+            'warm_seconds': warmed - loaded,
+            'swap_seconds': swapped - warmed,
+            'released_after_seconds': None,
+        }
+        self.swaps.append(record)
+        if previous is not None:
+            # The previous version's memory maps are closed once its last in-flight request drops it
+            weakref.finalize(previous, self._released, record, swapped)
+        emitter = get_metrics_emitter()
+        emitter.record('ModelLoadTime', record['load_seconds'] + record['warm_seconds'], 'Seconds')
+        emitter.record('ModelSwaps', 1, 'Count')
+        logging.info(f"Model version {version} is now served (load {record['load_seconds']:.3f}s, "
+                     f"warm-up {record['warm_seconds']:.3f}s).")
+        return record
+
+    @staticmethod
+    def _released(record, swapped):
+        record['released_after_seconds'] = time.perf_counter() - swapped
+        logging.info(f"Buffers of model version {record['previous_version']} released.")
+
+    # Active version and recent swaps, for the admin endpoint
+    def status(self):
+        artifact = active_model_artifact()
+        return {
+            'artifact_dir': self.artifact_dir,
+            'active_version': artifact.version if artifact is not None else None,
+            'pid': os.getpid(),
+            'poll_interval': self.poll_interval,
+            'checks': self.checks,
+            'errors': self.errors,
+            'last_error': self.last_error,
+            'swaps': list(self.swaps),
+        }
+
+
+# Process-wide registry
+_registry = None
+_registry_lock = threading.Lock()
+
+
+# Return the process's model registry, started on first use
+def get_model_registry():
+    global _registry
+    with _registry_lock:
+        if _registry is None:
+            _registry = ModelRegistry()
+    return _registry.start()
+
+
+# Pre-forking servers (e.g. gunicorn --preload) import the app, and so start the registry, in the parent process.
+# Each forked worker restarts the watcher with fresh locks, since locks held at fork time would never be released.
+def _restart_after_fork():
+    global _registry_lock
+    _registry_lock = threading.Lock()
+    registry = _registry
+    if registry is None or registry._pid is None:
+        return
+    registry._reload_lock = threading.Lock()
+    registry._start_lock = threading.Lock()
+    registry._wake = threading.Event()
+    registry.start()
+
+
+os.register_at_fork(after_in_child=_restart_after_fork)
@@ -1,11 +1,30 @@
 import os
-import boto3
+import time
+import queue
+import atexit
 import logging
+import threading
+from collections import Counter
+from datetime import datetime, timezone
+import boto3
 from botocore.exceptions import NoCredentialsError, ClientError
 
 # Initialize logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# PutMetricData accepts up to 1000 metric data entries per call, and up to 150 distinct values per entry
+MAX_METRICS_PER_REQUEST = 1000
+MAX_HISTOGRAM_VALUES = 150
+
+# Buffered emitter settings: flush interval in seconds, raw points that force an early flush, queue bound
+METRICS_FLUSH_INTERVAL = float(os.getenv('METRICS_FLUSH_INTERVAL', 60))
+METRICS_FLUSH_THRESHOLD = int(os.getenv('METRICS_FLUSH_THRESHOLD', 100000))
+METRICS_QUEUE_SIZE = int(os.getenv('METRICS_QUEUE_SIZE', 100000))
+
+# Shared CloudWatch client; boto3 clients are thread-safe, so one per process is enough
+_shared_client = None
+_shared_client_lock = threading.Lock()
+
 
 # Configure AWS CloudWatch Client
 def get_cloudwatch_client():
@@ -22,10 +41,20 @@ def get_cloudwatch_client():
         raise
 
 
+# Return the process-wide CloudWatch client, creating it on first use
+def get_shared_cloudwatch_client():
+    global _shared_client
+    if _shared_client is None:
+        with _shared_client_lock:
+            if _shared_client is None:
+                _shared_client = get_cloudwatch_client()
+    return _shared_client
+
+
 # Log metric to CloudWatch
 def log_metric(metric_name, value, unit='Count'):
     try:
-        cloudwatch = get_cloudwatch_client()
+        cloudwatch = get_shared_cloudwatch_client()
         namespace = os.getenv('CLOUDWATCH_NAMESPACE', 'RecommendationSystem')
 
         response = cloudwatch.put_metric_data(
@@ -48,11 +77,188 @@ def log_metric(metric_name, value, unit='Count'):
         raise
 
 
-# Function to log latency metrics
+# Sink that sends batches of metric data to CloudWatch with one reused client
+class CloudWatchSink:
+    def __init__(self, client=None, namespace=None):
+        self.client = client
+        self.namespace = namespace or os.getenv('CLOUDWATCH_NAMESPACE', 'RecommendationSystem')
+
+    def send(self, metric_data):
+        client = self.client or get_shared_cloudwatch_client()
+        for start in range(0, len(metric_data), MAX_METRICS_PER_REQUEST):
+            client.put_metric_data(Namespace=self.namespace,
+                                   MetricData=metric_data[start:start + MAX_METRICS_PER_REQUEST])
+
+
+# Sink that keeps batches in memory, for tests and local runs
+class InMemorySink:
+    def __init__(self):
+        self.batches = []
+        self._lock = threading.Lock()
+
+    def send(self, metric_data):
+        with self._lock:
+            self.batches.append(list(metric_data))
+
+    # Every metric datum sent so far
+    def metric_data(self):
+        with self._lock:
+            return [datum for batch in self.batches for datum in batch]
+
+
+# Per-metric aggregate: a StatisticSet plus a value histogram while it stays small enough for CloudWatch
+class _MetricAggregate:
+    def __init__(self):
+        self.count = 0
+        self.total = 0.0
+        self.minimum = float('inf')
+        self.maximum = float('-inf')
+        self.histogram = Counter()
+
+    def add(self, value):
+        self.count += 1
+        self.total += value
+        self.minimum = min(self.minimum, value)
+        self.maximum = max(self.maximum, value)
+        if self.histogram is not None:
+            # Three significant digits keep latency histograms within CloudWatch's distinct-value limit
+            self.histogram[float(f'{value:.3g}')] += 1
+            if len(self.histogram) > MAX_HISTOGRAM_VALUES:
+                self.histogram = None
+
+    def to_datum(self, name, unit, dimensions, timestamp):
+        datum = {'MetricName': name, 'Unit': unit, 'Timestamp': timestamp}
+        if dimensions:
+            datum['Dimensions'] = [{'Name': key, 'Value': value} for key, value in dimensions]
+        if self.histogram is not None:
+            datum['Values'] = list(self.histogram.keys())
+            datum['Counts'] = [float(count) for count in self.histogram.values()]
+        else:
+            datum['StatisticValues'] = {'SampleCount': float(self.count), 'Sum': self.total,
+                                        'Minimum': self.minimum, 'Maximum': self.maximum}
+        return datum
+
+
+# Buffered metric emitter: record() is a non-blocking enqueue, a background thread aggregates and flushes
+class MetricsEmitter:
+    def __init__(self, sink=None, flush_interval=METRICS_FLUSH_INTERVAL, flush_threshold=METRICS_FLUSH_THRESHOLD,
+                 queue_size=METRICS_QUEUE_SIZE):
+        self.sink = sink or CloudWatchSink()
+        self.flush_interval = flush_interval
+        self.flush_threshold = flush_threshold
+        self.dropped = 0
+        self.flushes = 0
+        self._queue_size = queue_size
+        self._start()
+
+    # Start the aggregation thread with an empty queue; a forked child calls this again, since it inherits the
+    # parent's buffers and locks but not its thread
+    def _start(self):
+        self._queue = queue.Queue(maxsize=self._queue_size)
+        self._aggregates = {}
+        self._pending = 0
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, name='metrics-emitter', daemon=True)
+        self._thread.start()
+
+    # Record one data point; drops it (and counts the drop) rather than block when the queue is full
+    def record(self, metric_name, value, unit='Count', dimensions=None):
+        key = (metric_name, unit, tuple(sorted(dimensions.items())) if dimensions else ())
+        try:
+            self._queue.put_nowait((key, float(value)))
+        except queue.Full:
+            self.dropped += 1
+
+    # Flush everything recorded so far and wait for the sink call to finish
+    def flush(self, timeout=10.0):
+        done = threading.Event()
+        try:
+            self._queue.put((None, done), timeout=timeout)
+        except queue.Full:
+            return False
+        return done.wait(timeout)
+
+    # Stop the background thread after a final flush
+    def close(self, timeout=10.0):
+        if not self._stop.is_set():
+            self.flush(timeout)
+            self._stop.set()
+            self._thread.join(timeout)
+
+    def _run(self):
+        next_flush = time.monotonic() + self.flush_interval
+        while not self._stop.is_set():
+            try:
+                key, value = self._queue.get(timeout=max(0.0, min(next_flush - time.monotonic(), 1.0)))
+                if key is None:
+                    self._flush_aggregates()
+                    value.set()
+                else:
+                    self._aggregates.setdefault(key, _MetricAggregate()).add(value)
+                    self._pending += 1
+            except queue.Empty:
+                pass
+            if self._pending >= self.flush_threshold or time.monotonic() >= next_flush:
+                self._flush_aggregates()
+                next_flush = time.monotonic() + self.flush_interval
+
+    def _flush_aggregates(self):
+        if not self._aggregates:
+            return
+        timestamp = datetime.now(timezone.utc)
+        metric_data = [aggregate.to_datum(name, unit, dimensions, timestamp)
+                       for (name, unit, dimensions), aggregate in self._aggregates.items()]
+        self._aggregates = {}
+        self._pending = 0
+        try:
+            self.sink.send(metric_data)
+            self.flushes += 1
+        except Exception as e:
+            # Metrics are best-effort: a failed flush is logged and dropped, never retried on the request path
+            logging.error(f"Failed to flush {len(metric_data)} metrics: {e}")
+
+
+# Process-wide emitter, created on first use; METRICS_SINK=memory keeps metrics in process instead of CloudWatch
+_emitter = None
+_emitter_lock = threading.Lock()
+
+
+# Return the process-wide metrics emitter
+def get_metrics_emitter():
+    global _emitter
+    if _emitter is None:
+        with _emitter_lock:
+            if _emitter is None:
+                sink = InMemorySink() if os.getenv('METRICS_SINK', 'cloudwatch') == 'memory' else CloudWatchSink()
+                _emitter = MetricsEmitter(sink)
+                atexit.register(_emitter.close)
+    return _emitter
+
+
+# Pre-forking servers (e.g. gunicorn --preload) may create the emitter in the parent process, e.g. through a model
+# registry swap. Each forked worker gets fresh locks, its own CloudWatch client and a running flush thread; points
+# the parent had buffered stay with the parent.
+def _restart_after_fork():
+    global _emitter_lock, _shared_client, _shared_client_lock
+    _emitter_lock = threading.Lock()
+    _shared_client_lock = threading.Lock()
+    _shared_client = None
+    emitter = _emitter
+    if emitter is None or emitter._stop.is_set():
+        return
+    if isinstance(emitter.sink, InMemorySink):
+        emitter.sink._lock = threading.Lock()
+    emitter._start()
+
+
+os.register_at_fork(after_in_child=_restart_after_fork)
+
+
+# Function to log latency metrics; buffered, so it is safe to call on every request
 def log_latency(latency):
     try:
-        log_metric('ModelPredictionLatency', latency, 'Seconds')
-        logging.info(f"Logged latency: {latency} seconds.")
+        get_metrics_emitter().record('ModelPredictionLatency', latency, 'Seconds')
+        logging.debug(f"Recorded latency: {latency} seconds.")
     except Exception as e:
         logging.error(f"Error logging latency: {e}")
         raise
@@ -76,3 +282,6 @@ if __name__ == "__main__":
     # Example of logging model accuracy
     accuracy = 95.67  # Example accuracy in percentage
     log_model_accuracy(accuracy)
+
+    # Send the buffered latency before exiting
+    get_metrics_emitter().flush()
@@ -0,0 +1,216 @@
+import os
+import time
+import cProfile
+import logging
+import itertools
+import functools
+import threading
+import tracemalloc
+
+# Initialize logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Stage timing is opt-in; when disabled every hook below reduces to a flag check
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', 'False') == 'True'
+
+# Peak memory per stage needs tracemalloc, which slows allocation-heavy code noticeably, so it is a separate switch
+PROFILE_MEMORY = os.getenv('PROFILE_MEMORY', 'False') == 'True'
+
+# Every Nth traced request is run under cProfile and tracemalloc and dumped to PROFILE_DUMP_DIR (0 disables)
+PROFILE_SAMPLE_EVERY = int(os.getenv('PROFILE_SAMPLE_EVERY', 0))
+PROFILE_DUMP_DIR = os.getenv('PROFILE_DUMP_DIR', 'profiles')
+
+# Per-thread stack of open stages and the request trace they report into
+_local = threading.local()
+
+# Process-wide totals per stage: name -> [count, wall seconds, cpu seconds, max peak bytes]
+_totals = {}
+_totals_lock = threading.Lock()
+
+# Counter for request sampling; only one request is profiled at a time
+_request_counter = itertools.count(1)
+_sampling_lock = threading.Lock()
+
+
+# Turn stage timing on or off at runtime (benchmarks and tests); memory=True also starts tracemalloc
+def set_profiling_enabled(enabled, memory=None):
+    global PROFILING_ENABLED, PROFILE_MEMORY
+    PROFILING_ENABLED = enabled
+    if memory is not None:
+        PROFILE_MEMORY = memory
+    if PROFILING_ENABLED and PROFILE_MEMORY and not tracemalloc.is_tracing():
+        tracemalloc.start()
+
+
+# Stand-in returned when profiling is disabled, so `with stage_timer(...)` costs two method calls
+class _NullStage:
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        return False
+
+
+_NULL_STAGE = _NullStage()
+
+
+# Times one stage: wall time, process CPU time and, while tracemalloc is tracing, peak traced memory
+class _Stage:
+    def __init__(self, name):
+        self.name = name
+        self.wall = 0.0
+        self.cpu = 0.0
+        self.peak_memory = None
+        self._child_peak = 0
+
+    def __enter__(self):
+        stack = getattr(_local, 'stack', None)
+        if stack is None:
+            stack = _local.stack = []
+        stack.append(self)
+        self._tracing = tracemalloc.is_tracing()
+        if self._tracing:
+            # reset_peak is process-wide: keep the peak seen so far for the enclosing stage before resetting
+            current, peak = tracemalloc.get_traced_memory()
+            if len(stack) > 1:
+                stack[-2]._child_peak = max(stack[-2]._child_peak, peak)
+            self._start_memory = current
+            tracemalloc.reset_peak()
+        self._start_cpu = time.process_time()
+        self._start_wall = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.wall = time.perf_counter() - self._start_wall
+        self.cpu = time.process_time() - self._start_cpu
+        stack = _local.stack
+        stack.pop()
+        if self._tracing and tracemalloc.is_tracing():
+            peak = max(tracemalloc.get_traced_memory()[1], self._child_peak)
+            self.peak_memory = max(peak - self._start_memory, 0)
+            if stack:
+                stack[-1]._child_peak = max(stack[-1]._child_peak, peak)
+        _record_stage(self)
+        return False
+
+
+# Context manager that times a stage when profiling is enabled
+def stage_timer(name):
+    if not PROFILING_ENABLED:
+        return _NULL_STAGE
+    return _Stage(name)
+
+
+# Decorator form of stage_timer; the stage name defaults to the function name
+def profiled(name=None):
+    def decorator(func):
+        stage_name = name or func.__name__
+
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not PROFILING_ENABLED:
+                return func(*args, **kwargs)
+            with _Stage(stage_name):
+                return func(*args, **kwargs)
+        return wrapper
+    return decorator
+
+
+# Add a finished stage to the totals, the active request trace and the metrics emitter
+def _record_stage(stage):
+    with _totals_lock:
+        totals = _totals.setdefault(stage.name, [0, 0.0, 0.0, 0])
+        totals[0] += 1
+        totals[1] += stage.wall
+        totals[2] += stage.cpu
+        if stage.peak_memory is not None:
+            totals[3] = max(totals[3], stage.peak_memory)
+
+    trace = getattr(_local, 'trace', None)
+    if trace is not None:
+        trace[stage.name] = trace.get(stage.name, 0.0) + stage.wall
+
+    try:
+        # Imported here so the serving path does not load boto3 unless profiling is switched on
+        from monitoring import get_metrics_emitter
+        emitter = get_metrics_emitter()
+        dimensions = {'Stage': stage.name}
+        emitter.record('StageWallTime', stage.wall, 'Seconds', dimensions)
+        emitter.record('StageCpuTime', stage.cpu, 'Seconds', dimensions)
+        if stage.peak_memory is not None:
+            emitter.record('StagePeakMemory', stage.peak_memory, 'Bytes', dimensions)
+    except Exception as e:
+        logging.error(f"Error exporting stage metrics for {stage.name}: {e}")
+
+
+# Totals per stage since start-up (or the last reset): count, wall/cpu seconds and max peak memory
+def profiling_summary():
+    with _totals_lock:
+        return {name: {'count': count, 'wall_seconds': wall, 'cpu_seconds': cpu, 'peak_memory_bytes': peak}
+                for name, (count, wall, cpu, peak) in _totals.items()}
+
+
+# Clear the per-stage totals
+def reset_profiling_summary():
+    with _totals_lock:
+        _totals.clear()
+
+
+# Write the cProfile stats and tracemalloc snapshot of one sampled request
+def _dump_sample(name, number, profiler, snapshot):
+    try:
+        os.makedirs(PROFILE_DUMP_DIR, exist_ok=True)
+        prefix = os.path.join(PROFILE_DUMP_DIR, f"{name}-{os.getpid()}-{number}")
+        profiler.dump_stats(f"{prefix}.prof")
+        if snapshot is not None:
+            snapshot.dump(f"{prefix}.tracemalloc")
+        logging.info(f"Profile of {name} request {number} written to {prefix}.prof")
+    except Exception as e:
+        logging.error(f"Error writing profile dump for {name}: {e}")
+
+
+# Decorator for request handlers: records the per-request stage breakdown and profiles every Nth request
+def traced_request(name):
+    def decorator(func):
+        @functools.wraps(func)
+        def wrapper(*args, **kwargs):
+            if not PROFILING_ENABLED and not PROFILE_SAMPLE_EVERY:
+                return func(*args, **kwargs)
+
+            number = next(_request_counter)
+            # cProfile allows one active profiler per process; a sample due while another runs is skipped
+            sampled = (PROFILE_SAMPLE_EVERY > 0 and number % PROFILE_SAMPLE_EVERY == 0
+                       and _sampling_lock.acquire(blocking=False))
+            profiler = None
+            started_tracemalloc = False
+            _local.trace = {}
+            try:
+                if sampled:
+                    if not tracemalloc.is_tracing():
+                        tracemalloc.start()
+                        started_tracemalloc = True
+                    profiler = cProfile.Profile()
+                    profiler.enable()
+                if PROFILING_ENABLED:
+                    with _Stage(name):
+                        return func(*args, **kwargs)
+                return func(*args, **kwargs)
+            finally:
+                trace, _local.trace = _local.trace, None
+                if trace:
+                    logging.debug(f"{name} request {number} breakdown: "
+                                  + ', '.join(f"{stage}={seconds * 1000:.3f}ms" for stage, seconds in trace.items()))
+                if sampled:
+                    profiler.disable()
+                    snapshot = tracemalloc.take_snapshot()
+                    if started_tracemalloc:
+                        tracemalloc.stop()
+                    _sampling_lock.release()
+                    _dump_sample(name, number, profiler, snapshot)
+        return wrapper
+    return decorator
+
+
+# Start tracemalloc at import when memory profiling is configured through the environment
+if PROFILING_ENABLED and PROFILE_MEMORY:
+    tracemalloc.start()
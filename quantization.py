@@ -0,0 +1,99 @@
+import os
+import logging
+import numpy as np
+from scoring import EXCLUDED_SCORE, mask_excluded_items, select_top_k
+from profiling import stage_timer
+
+# Initialize logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Storage precision of the exported factors: float32 (the training dtype, since the interaction matrix is float32),
+# or float32 plus int8 item codes with per-item scales for the scoring scan
+FACTOR_PRECISIONS = ('float32', 'int8')
+FACTOR_PRECISION = os.getenv('FACTOR_PRECISION', 'float32')
+
+# Array names under which the int8 item codes are stored inside a model artifact
+QUANTIZED_ARRAYS = ('quantized_item_codes', 'quantized_item_scales')
+
+# Candidates re-ranked with the float factors per requested item (k * QUANTIZED_RERANK_FACTOR)
+QUANTIZED_RERANK_FACTOR = int(os.getenv('QUANTIZED_RERANK_FACTOR', 4))
+
+# Items per block when scoring int8 codes, so the float32 copy of a block stays cache-sized
+QUANTIZED_BLOCK_SIZE = 16384
+
+
+# Quantize item factors (components x items) to int8 with one symmetric scale per item
+def quantize_item_factors(item_features):
+    item_features = np.asarray(item_features, dtype=np.float32)
+    scales = np.abs(item_features).max(axis=0) / 127.0
+    # Items with all-zero factors keep code 0 whatever the scale
+    scales[scales == 0] = 1.0
+    codes = np.rint(item_features / scales).astype(np.int8)
+    return {'quantized_item_codes': codes, 'quantized_item_scales': scales.astype(np.float32)}
+
+
+# Factor arrays to export at the given precision; int8 keeps float32 factors for re-ranking and fold-in
+def compact_factor_arrays(user_features, item_features, precision=FACTOR_PRECISION):
+    if precision not in FACTOR_PRECISIONS:
+        raise ValueError(f"Unsupported factor precision {precision!r}; expected one of {FACTOR_PRECISIONS}.")
+    # Trained factors are already float32, so this is a no-op (and a memory-mapped factor matrix is written out
+    # without an in-memory copy); only factors passed in at another dtype are converted
+    arrays = {
+        'user_features': np.asarray(user_features, dtype=np.float32),
+        'item_features': np.asarray(item_features, dtype=np.float32),
+    }
+    if precision == 'int8':
+        arrays.update(quantize_item_factors(item_features))
+    return arrays
+
+
+# Return the int8 item codes stored in a model artifact, or None if it was exported without them
+def quantized_index_from_artifact(artifact):
+    if not all(name in artifact.arrays for name in QUANTIZED_ARRAYS):
+        return None
+    return {name: artifact.arrays[name] for name in QUANTIZED_ARRAYS}
+
+
+# Approximate scores of one user vector (1-D) or several (2-D) against the int8 codes, one item block at a time
+def score_quantized(index, user_vectors):
+    codes, scales = index['quantized_item_codes'], index['quantized_item_scales']
+    user_vectors = np.asarray(user_vectors, dtype=np.float32)
+    scores = np.empty(user_vectors.shape[:-1] + (codes.shape[1],), dtype=np.float32)
+    for start in range(0, codes.shape[1], QUANTIZED_BLOCK_SIZE):
+        block = slice(start, start + QUANTIZED_BLOCK_SIZE)
+        scores[..., block] = np.dot(user_vectors, codes[:, block].astype(np.float32)) * scales[block]
+    return scores
+
+
+# Top-k items for one user: int8 scoring picks k * rerank_factor candidates, float factors rank them exactly
+def quantized_top_k(index, user_features, item_features, user_id, k=10, seen=None, blocked=None,
+                    rerank_factor=QUANTIZED_RERANK_FACTOR):
+    with stage_timer('score'):
+        scores = score_quantized(index, user_features[user_id])
+        mask_excluded_items(scores, user_id, seen, blocked)
+    with stage_timer('sort'):
+        candidates = select_top_k(scores, k * rerank_factor)
+        candidates = candidates[scores[candidates] > EXCLUDED_SCORE]
+    with stage_timer('rerank'):
+        exact = np.dot(user_features[user_id], item_features[:, candidates])
+        return candidates[select_top_k(exact, k)]
+
+
+# Batched quantized_top_k; rows left with fewer than k eligible items are padded with -1
+def quantized_top_k_batch(index, user_features, item_features, user_ids, k=10, seen=None, blocked=None,
+                          rerank_factor=QUANTIZED_RERANK_FACTOR):
+    user_vectors = user_features[user_ids]
+    with stage_timer('score'):
+        scores = score_quantized(index, user_vectors)
+        mask_excluded_items(scores, user_ids, seen, blocked)
+    with stage_timer('sort'):
+        candidates = select_top_k(scores, k * rerank_factor)
+        excluded = np.take_along_axis(scores, candidates, axis=-1) == EXCLUDED_SCORE
+    with stage_timer('rerank'):
+        # Gather the candidates' factors (components x users x candidates) and score each row against its user
+        exact = np.einsum('uc,cun->un', user_vectors, item_features[:, candidates])
+        exact[excluded] = EXCLUDED_SCORE
+        order = select_top_k(exact, k)
+        top = np.take_along_axis(candidates, order, axis=-1)
+        top[np.take_along_axis(exact, order, axis=-1) == EXCLUDED_SCORE] = -1
+        return top
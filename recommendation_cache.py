@@ -0,0 +1,115 @@
+import os
+import time
+import logging
+import threading
+from collections import OrderedDict
+
+# Initialize logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Cache size (0 disables caching) and optional entry lifetime in seconds (0 keeps entries until evicted)
+RECOMMENDATION_CACHE_SIZE = int(os.getenv('RECOMMENDATION_CACHE_SIZE', 10000))
+RECOMMENDATION_CACHE_TTL = float(os.getenv('RECOMMENDATION_CACHE_TTL', 0))
+
+
+# Bounded LRU cache of recommendation lists keyed by (model version, user_id, k, filters)
+class RecommendationCache:
+    def __init__(self, max_entries=RECOMMENDATION_CACHE_SIZE, ttl_seconds=RECOMMENDATION_CACHE_TTL):
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self._version = None
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+        self.invalidations = 0
+
+    # Make `version` the served model version, dropping everything cached for any other one. Called whenever the
+    # served model changes, including a rollback to an older version, so no ordering of version names is assumed.
+    def set_version(self, version):
+        with self._lock:
+            self._set_version(version)
+
+    def _set_version(self, version):
+        if version == self._version:
+            return
+        if self._entries:
+            self.invalidations += 1
+            logging.info(f"Recommendation cache invalidated for model version {version}.")
+        self._entries.clear()
+        self._version = version
+
+    # True for the served version; requests still finishing on a replaced model neither read nor fill the cache.
+    # A cache that was never told the served version adopts the first one it sees.
+    def _observe_version(self, version):
+        if self._version is None:
+            self._set_version(version)
+        return version == self._version
+
+    # Return the cached list for the key, or None on a miss
+    def get(self, version, user_id, k, filters=()):
+        if self.max_entries <= 0:
+            return None
+        key = (version, user_id, k, filters)
+        with self._lock:
+            entry = self._entries.get(key) if self._observe_version(version) else None
+            if entry is None:
+                self.misses += 1
+                return None
+            value, expires_at = entry
+            if expires_at is not None and time.monotonic() >= expires_at:
+                del self._entries[key]
+                self.expirations += 1
+                self.misses += 1
+                return None
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return value
+
+    # Store a list, evicting the least recently used entries beyond max_entries
+    def put(self, version, user_id, k, value, filters=()):
+        if self.max_entries <= 0:
+            return
+        # Cached arrays are shared between requests, so make them read-only
+        value.setflags(write=False)
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds > 0 else None
+        key = (version, user_id, k, filters)
+        with self._lock:
+            if not self._observe_version(version):
+                return
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    # Return the cached list or compute, store and return it
+    def get_or_compute(self, version, user_id, k, compute, filters=()):
+        value = self.get(version, user_id, k, filters)
+        if value is None:
+            value = compute()
+            self.put(version, user_id, k, value, filters)
+        return value
+
+    # Drop every entry, e.g. after publishing a model with the same version name
+    def invalidate(self):
+        with self._lock:
+            if self._entries:
+                self.invalidations += 1
+            self._entries.clear()
+
+    # Counters for monitoring
+    def stats(self):
+        with self._lock:
+            return {
+                'version': self._version,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'hits': self.hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'expirations': self.expirations,
+                'invalidations': self.invalidations,
+            }
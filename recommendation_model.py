@@ -1,18 +1,155 @@
 import os
+import json
+import time
+import shutil
+import tempfile
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 import pandas as pd
 import numpy as np
 import logging
+from scipy import sparse
 from sklearn.decomposition import NMF
 from sklearn.exceptions import NotFittedError
+from model_artifact import save_model_artifact, interaction_arrays
+from scoring import select_top_k, get_top_k, mask_excluded_items, EXCLUDED_SCORE
+# Re-exported so callers that score through this module keep working (scoring.py holds the NumPy-only kernels)
+from scoring import get_top_k_batch  # noqa: F401
+from profiling import profiled
+from quantization import compact_factor_arrays, FACTOR_PRECISION
+from minibatch_nmf import open_interaction_matrix
 
 # Initialize logging
 logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
 
+# Columns and parse dtypes for the behavior CSV; ids are downcast to int32 after loading when they fit
+BEHAVIOR_DTYPES = {'user_id': 'int64', 'item_id': 'int64', 'interaction': 'float32'}
+
+# Optional event-time column; kept per (user, item) pair as its latest value (int64) for time-based evaluation splits
+TIME_COLUMN = 'timestamp'
+
+# How per-pair partial aggregates combine across chunks
+PARTIAL_AGGREGATIONS = {'sum': 'sum', 'count': 'sum', TIME_COLUMN: 'max'}
+
+# Rows parsed per chunk when streaming the CSV, and chunks aggregated before they are merged
+CSV_CHUNK_SIZE = int(os.getenv('CSV_CHUNK_SIZE', 1000000))
+CHUNKS_PER_MERGE = 8
+
+# Bumped whenever the columnar cache layout changes, so stale caches are rebuilt
+CACHE_FORMAT_VERSION = 2
+
+
+# Identify a source file by modification time and size, so the cache is rebuilt when it changes
+def _source_fingerprint(path):
+    stat = os.stat(path)
+    return {'format_version': CACHE_FORMAT_VERSION, 'mtime_ns': stat.st_mtime_ns, 'size': stat.st_size}
+
+
+# Columnar cache directory for a source file (BEHAVIOR_CACHE_DIR overrides the default next to the file)
+def _cache_dir(path):
+    cache_root = os.getenv('BEHAVIOR_CACHE_DIR')
+    if cache_root:
+        return os.path.join(cache_root, os.path.basename(path) + '.cache')
+    return path + '.cache'
+
+
+# Load the cached columns if they were built from the current version of the source file
+def _read_columnar_cache(cache_dir, fingerprint):
+    try:
+        with open(os.path.join(cache_dir, 'source.json')) as f:
+            if json.load(f) != fingerprint:
+                return None
+        columns = {name: np.load(os.path.join(cache_dir, f"{name}.npy")) for name in BEHAVIOR_DTYPES}
+        if os.path.exists(os.path.join(cache_dir, f"{TIME_COLUMN}.npy")):
+            columns[TIME_COLUMN] = np.load(os.path.join(cache_dir, f"{TIME_COLUMN}.npy"))
+        return pd.DataFrame(columns)
+    except (FileNotFoundError, ValueError):
+        return None
+
+
+# Write the aggregated columns as .npy files; a failed write only costs the next load a CSV parse
+def _write_columnar_cache(cache_dir, fingerprint, df):
+    staging_dir = f"{cache_dir}.staging-{os.getpid()}"
+    try:
+        os.makedirs(staging_dir, exist_ok=True)
+        for name in df.columns:
+            np.save(os.path.join(staging_dir, f"{name}.npy"), df[name].to_numpy(), allow_pickle=False)
+        with open(os.path.join(staging_dir, 'source.json'), 'w') as f:
+            json.dump(fingerprint, f)
+        shutil.rmtree(cache_dir, ignore_errors=True)
+        os.replace(staging_dir, cache_dir)
+        logging.info(f"Columnar cache written to {cache_dir}.")
+    except OSError as e:
+        logging.warning(f"Could not write columnar cache to {cache_dir}: {e}")
+        shutil.rmtree(staging_dir, ignore_errors=True)
+
+
+# Sum interactions, count rows and keep the latest timestamp per (user, item) pair
+def _aggregate_pairs(frames):
+    combined = pd.concat(frames)
+    return combined.groupby(level=['user_id', 'item_id'], sort=False).agg(
+        {name: PARTIAL_AGGREGATIONS[name] for name in combined.columns})
+
+
+# Event times as int64: numeric columns are kept, anything else is parsed as datetimes (nanoseconds since epoch)
+def _timestamps(values):
+    if pd.api.types.is_numeric_dtype(values):
+        return values.astype(np.int64)
+    return pd.to_datetime(values).astype(np.int64)
+
+
+# Use int32 ids whenever the values fit
+def _compact_ids(values):
+    info = np.iinfo(np.int32)
+    if len(values) and values.min() >= info.min and values.max() <= info.max:
+        return values.astype(np.int32)
+    return values
+
+
+# Stream the CSV in typed chunks and average duplicate (user, item) pairs on the fly
+def _read_csv_aggregated(path, chunksize):
+    partials = []
+    columns = list(BEHAVIOR_DTYPES)
+    has_time = TIME_COLUMN in pd.read_csv(path, nrows=0).columns
+    if has_time:
+        columns.append(TIME_COLUMN)
+    reader = pd.read_csv(path, usecols=columns, dtype=BEHAVIOR_DTYPES, chunksize=chunksize)
+    for chunk in reader:
+        aggregations = {'sum': ('interaction', 'sum'), 'count': ('interaction', 'count')}
+        if has_time:
+            chunk[TIME_COLUMN] = _timestamps(chunk[TIME_COLUMN])
+            aggregations[TIME_COLUMN] = (TIME_COLUMN, 'max')
+        partials.append(chunk.groupby(['user_id', 'item_id'], sort=False).agg(**aggregations))
+        if len(partials) >= CHUNKS_PER_MERGE:
+            partials = [_aggregate_pairs(partials)]
+    if not partials:
+        raise pd.errors.EmptyDataError("No rows to parse from file")
+
+    totals = _aggregate_pairs(partials)
+    df = pd.DataFrame({
+        'user_id': _compact_ids(totals.index.get_level_values('user_id').to_numpy()),
+        'item_id': _compact_ids(totals.index.get_level_values('item_id').to_numpy()),
+        'interaction': (totals['sum'].to_numpy() / totals['count'].to_numpy()).astype(np.float32),
+    })
+    if has_time:
+        df[TIME_COLUMN] = totals[TIME_COLUMN].to_numpy(dtype=np.int64)
+    return df
+
 
 # Load data function
-def load_data(path):
+@profiled()
+def load_data(path, use_cache=True, chunksize=CSV_CHUNK_SIZE):
     try:
-        df = pd.read_csv(path)
+        fingerprint = _source_fingerprint(path)
+        cache_dir = _cache_dir(path)
+        if use_cache:
+            df = _read_columnar_cache(cache_dir, fingerprint)
+            if df is not None:
+                logging.info(f"Data loaded from columnar cache {cache_dir}.")
+                return df
+
+        df = _read_csv_aggregated(path, chunksize)
+        if use_cache:
+            _write_columnar_cache(cache_dir, fingerprint, df)
         logging.info(f"Data loaded successfully from {path}.")
         return df
     except FileNotFoundError:
@@ -27,43 +164,282 @@ def load_data(path):
 
 
 # Build interaction matrix
+@profiled()
 def build_interaction_matrix(df):
     if df.empty or 'user_id' not in df.columns or 'item_id' not in df.columns or 'interaction' not in df.columns:
         logging.error("Invalid data format. Dataframe must contain 'user_id', 'item_id', and 'interaction' columns.")
         raise ValueError("Invalid data format.")
-    logging.info("Building user-item interaction matrix...")
-    interaction_matrix = df.pivot_table(index='user_id', columns='item_id', values='interaction').fillna(0)
-    logging.info("Interaction matrix successfully built.")
-    return interaction_matrix
+    logging.info("Building sparse user-item interaction matrix...")
+
+    # Map raw ids to contiguous row/column indices; sorted so rows keep the order pivot_table used
+    user_codes, user_ids = pd.factorize(df['user_id'], sort=True)
+    item_codes, item_ids = pd.factorize(df['item_id'], sort=True)
+    user_codes = user_codes.astype(np.int32, copy=False)
+    item_codes = item_codes.astype(np.int32, copy=False)
+    values = df['interaction'].to_numpy(dtype=np.float32)
+    shape = (len(user_ids), len(item_ids))
+
+    # Build CSR straight from the COO triples; duplicate (user, item) pairs are summed here
+    interaction_matrix = sparse.csr_matrix((values, (user_codes, item_codes)), shape=shape)
+    if interaction_matrix.nnz < len(values):
+        # Divide by the per-pair counts so duplicates average out, as pivot_table did
+        counts = sparse.csr_matrix((np.ones_like(values), (user_codes, item_codes)), shape=shape)
+        interaction_matrix.data /= counts.data
+    interaction_matrix.eliminate_zeros()
+
+    logging.info(f"Interaction matrix successfully built: {shape[0]} users x {shape[1]} items, "
+                 f"{interaction_matrix.nnz} non-zero interactions.")
+    return interaction_matrix, np.asarray(user_ids), np.asarray(item_ids)
+
+
+# Append arrays to raw binary files, one file per name
+def _append_raw(directory, prefix, arrays):
+    for name, array in arrays.items():
+        with open(os.path.join(directory, f"{prefix}.{name}"), 'ab') as f:
+            array.tofile(f)
+
+
+# Read back and delete the files written by _append_raw (empty arrays when nothing was written)
+def _pop_raw(directory, prefix, dtypes):
+    arrays = {}
+    for name, dtype in dtypes.items():
+        path = os.path.join(directory, f"{prefix}.{name}")
+        if os.path.exists(path):
+            arrays[name] = np.fromfile(path, dtype=dtype)
+            os.remove(path)
+        else:
+            arrays[name] = np.zeros(0, dtype=dtype)
+    return arrays
+
+
+# Typed chunks of the behavior CSV's id and interaction columns
+def _read_behavior_chunks(path, chunksize):
+    return pd.read_csv(path, usecols=list(BEHAVIOR_DTYPES), dtype=BEHAVIOR_DTYPES, chunksize=chunksize)
+
+
+# Build the interaction matrix straight from the CSV into memory-mapped CSR files in `directory`, without holding
+# the rows or the full matrix in memory. Pass 1 collects the ids and rows per user, pass 2 spills each chunk's
+# (row, column, value) triples into buckets of consecutive users with about `chunksize` rows each, and pass 3
+# averages duplicates bucket by bucket and appends the rows to the CSR files. Optional `overrides` rows
+# (user_id, item_id, interaction), e.g. a fold-in log, replace the CSV's value of their pair. Returns the
+# memory-mapped matrix, user_ids, item_ids and a mask of the overrides the CSV already holds with the same value.
+@profiled()
+def build_interaction_matrix_on_disk(path, directory, overrides=None, chunksize=CSV_CHUNK_SIZE):
+    logging.info(f"Building the interaction matrix from {path} in {directory}...")
+    os.makedirs(directory, exist_ok=True)
+    if overrides is None:
+        overrides = pd.DataFrame({name: pd.Series(dtype=dtype) for name, dtype in BEHAVIOR_DTYPES.items()})
+    try:
+        user_counts = overrides['user_id'].value_counts()
+        item_ids = np.unique(overrides['item_id'].to_numpy(dtype=np.int64))
+        for chunk in _read_behavior_chunks(path, chunksize):
+            user_counts = user_counts.add(chunk['user_id'].value_counts(), fill_value=0)
+            item_ids = np.union1d(item_ids, chunk['item_id'].unique())
+        if user_counts.empty:
+            raise pd.errors.EmptyDataError("No rows to parse from file")
+        user_counts = user_counts.sort_index()
+        user_ids = _compact_ids(user_counts.index.to_numpy(dtype=np.int64))
+        item_ids = _compact_ids(item_ids)
+        counts = user_counts.to_numpy(dtype=np.int64)
+        bucket_of_user = (np.cumsum(counts) - counts) // chunksize
+        bucket_starts = np.searchsorted(bucket_of_user, np.arange(bucket_of_user[-1] + 2))
+
+        # Spill the triples bucket by bucket; only one chunk is in memory at a time
+        triple_dtypes = {'rows': np.int32, 'columns': np.int32, 'values': np.float32}
+        for chunk in _read_behavior_chunks(path, chunksize):
+            rows = np.searchsorted(user_ids, chunk['user_id'].to_numpy()).astype(np.int32)
+            columns = np.searchsorted(item_ids, chunk['item_id'].to_numpy()).astype(np.int32)
+            values = chunk['interaction'].to_numpy(dtype=np.float32)
+            buckets = bucket_of_user[rows]
+            order = np.argsort(buckets, kind='stable')
+            bounds = np.searchsorted(buckets[order], np.unique(buckets), side='right')
+            for bucket, part in zip(np.unique(buckets), np.split(order, bounds[:-1])):
+                _append_raw(directory, f"bucket-{bucket}", {'rows': rows[part], 'columns': columns[part],
+                                                           'values': values[part]})
 
+        override_rows = np.searchsorted(user_ids, overrides['user_id'].to_numpy())
+        override_columns = np.searchsorted(item_ids, overrides['item_id'].to_numpy())
+        override_values = overrides['interaction'].to_numpy(dtype=np.float32)
+        redundant = np.zeros(len(overrides), dtype=bool)
 
-# Train NMF model
-def train_nmf_model(interaction_matrix, n_components=15):
+        # Average duplicates per bucket, apply the overrides and append the bucket's CSR rows
+        n_items = len(item_ids)
+        indptr = [np.zeros(1, dtype=np.int64)]
+        nnz = 0
+        for bucket in range(len(bucket_starts) - 1):
+            start, end = bucket_starts[bucket], bucket_starts[bucket + 1]
+            triples = _pop_raw(directory, f"bucket-{bucket}", triple_dtypes)
+            shape = (end - start, n_items)
+            local_rows = triples['rows'] - start
+            block = sparse.csr_matrix((triples['values'], (local_rows, triples['columns'])), shape=shape)
+            if block.nnz < len(triples['values']):
+                counts = sparse.csr_matrix((np.ones_like(triples['values']), (local_rows, triples['columns'])),
+                                           shape=shape)
+                block.data /= counts.data
+            in_bucket = np.flatnonzero((override_rows >= start) & (override_rows < end))
+            if len(in_bucket):
+                pairs = (override_rows[in_bucket] - start, override_columns[in_bucket])
+                redundant[in_bucket] = np.asarray(block[pairs]).ravel() == override_values[in_bucket]
+                pattern = sparse.csr_matrix((np.ones(len(in_bucket), dtype=np.float32), pairs), shape=shape)
+                updates = sparse.csr_matrix((override_values[in_bucket], pairs), shape=shape)
+                block = (block - block.multiply(pattern) + updates).tocsr()
+            block.eliminate_zeros()
+            block.sort_indices()
+            _append_raw(directory, 'csr', {'data': block.data.astype(np.float32),
+                                           'indices': block.indices.astype(np.int32)})
+            indptr.append(block.indptr[1:].astype(np.int64) + nnz)
+            nnz += block.nnz
+
+        # Convert the raw CSR files to the .npy layout open_interaction_matrix maps
+        for name, dtype in (('data', np.float32), ('indices', np.int32)):
+            raw_path = os.path.join(directory, f"csr.{name}")
+            target = np.lib.format.open_memmap(os.path.join(directory, f"{name}.npy"), mode='w+', dtype=dtype,
+                                               shape=(nnz,))
+            if nnz:
+                target[:] = np.memmap(raw_path, dtype=dtype, mode='r', shape=(nnz,))
+            target.flush()
+            del target
+            if os.path.exists(raw_path):
+                os.remove(raw_path)
+        np.save(os.path.join(directory, 'indptr.npy'), np.concatenate(indptr))
+        with open(os.path.join(directory, 'shape.json'), 'w') as f:
+            json.dump([len(user_ids), n_items], f)
+        interaction_matrix = open_interaction_matrix(directory)
+        logging.info(f"Interaction matrix successfully built: {len(user_ids)} users x {n_items} items, "
+                     f"{nnz} non-zero interactions.")
+        return interaction_matrix, user_ids, item_ids, redundant
+    except FileNotFoundError:
+        logging.error(f"File not found at {path}. Please check the path.")
+        raise
+    except Exception as e:
+        logging.error(f"An error occurred while building the interaction matrix: {e}")
+        raise
+
+
+# Train NMF model; init_factors=(W, H) warm-starts from a previous run instead of a fresh init
+@profiled()
+def train_nmf_model(interaction_matrix, n_components=15, init_factors=None, max_iter=200, alpha_W=0.0, l1_ratio=0.0):
     logging.info(f"Training NMF model with {n_components} components...")
     try:
-        model = NMF(n_components=n_components, random_state=42)
-        user_features = model.fit_transform(interaction_matrix)
+        if init_factors is None:
+            model = NMF(n_components=n_components, random_state=42, max_iter=max_iter,
+                        alpha_W=alpha_W, l1_ratio=l1_ratio)
+            user_features = model.fit_transform(interaction_matrix)
+        else:
+            model = NMF(n_components=n_components, init='custom', random_state=42, max_iter=max_iter,
+                        alpha_W=alpha_W, l1_ratio=l1_ratio)
+            init_user, init_item = (np.array(factors, dtype=interaction_matrix.dtype) for factors in init_factors)
+            user_features = model.fit_transform(interaction_matrix, W=init_user, H=init_item)
         item_features = model.components_
-        logging.info("NMF model training complete.")
+        logging.info(f"NMF model training complete after {model.n_iter_} iterations.")
         return model, user_features, item_features
     except Exception as e:
         logging.error(f"An error occurred during model training: {e}")
         raise
 
 
+# Reorder rows of a previous factor matrix to new ids; unseen ids get the mean factor value
+def _remap_rows(factors, previous_ids, ids):
+    positions = pd.Index(previous_ids).get_indexer(ids)
+    remapped = np.full((len(ids), factors.shape[1]), factors.mean(), dtype=factors.dtype)
+    found = positions >= 0
+    remapped[found] = factors[positions[found]]
+    return remapped
+
+
+# Remap the last run's factors onto the current id mappings so they can seed train_nmf_model
+def remap_factors(previous_user_features, previous_item_features, previous_user_ids, previous_item_ids,
+                  user_ids, item_ids):
+    user_features = _remap_rows(np.asarray(previous_user_features), previous_user_ids, user_ids)
+    item_features = _remap_rows(np.asarray(previous_item_features).T, previous_item_ids, item_ids).T
+    return user_features, np.ascontiguousarray(item_features)
+
+
+# Interaction matrix shared by grid workers, memory-mapped from a temporary directory
+_grid_matrix = None
+
+
+# Open the shared interaction matrix once per worker process
+def _init_grid_worker(matrix_dir, shape):
+    global _grid_matrix
+    parts = [np.load(os.path.join(matrix_dir, f"{name}.npy"), mmap_mode='r') for name in ('data', 'indices', 'indptr')]
+    _grid_matrix = sparse.csr_matrix(tuple(parts), shape=shape, copy=False)
+
+
+# Train one grid configuration and report its cost and fit
+def _train_grid_config(config):
+    start = time.perf_counter()
+    model, _, _ = train_nmf_model(_grid_matrix, **config)
+    return dict(config, seconds=time.perf_counter() - start,
+                reconstruction_err=float(model.reconstruction_err_), n_iter=int(model.n_iter_))
+
+
+# Train a grid of NMF configurations in parallel; workers share one memory-mapped copy of the matrix
+def train_nmf_grid(interaction_matrix, configs, max_workers=None):
+    logging.info(f"Training {len(configs)} NMF configurations in a process pool...")
+    try:
+        with tempfile.TemporaryDirectory(prefix='nmf-grid-') as matrix_dir:
+            for name in ('data', 'indices', 'indptr'):
+                np.save(os.path.join(matrix_dir, f"{name}.npy"), getattr(interaction_matrix, name))
+            with ProcessPoolExecutor(max_workers=max_workers, initializer=_init_grid_worker,
+                                     initargs=(matrix_dir, interaction_matrix.shape)) as executor:
+                results = list(executor.map(_train_grid_config, configs))
+        for result in results:
+            logging.info(f"NMF grid result: {result}")
+        return results
+    except Exception as e:
+        logging.error(f"An error occurred during NMF grid training: {e}")
+        raise
+
+
+# Write the trained factors and id mappings as a versioned, memory-mappable artifact
+def export_model_artifact(root_dir, model, user_features, item_features, user_ids, item_ids, metadata=None,
+                          extra_arrays=None, interaction_matrix=None, factor_precision=FACTOR_PRECISION,
+                          publish=True):
+    # Factors are stored as float32, optionally with int8 item codes for a cheaper scoring scan
+    arrays = compact_factor_arrays(user_features, item_features, factor_precision)
+    arrays.update({
+        'user_ids': user_ids,
+        'item_ids': item_ids,
+    })
+    # The training interactions let incremental updates recompute a user's full row later
+    if interaction_matrix is not None:
+        arrays.update(interaction_arrays(interaction_matrix))
+    arrays.update(extra_arrays or {})
+    artifact_metadata = {
+        'n_components': int(item_features.shape[0]),
+        'reconstruction_err': float(getattr(model, 'reconstruction_err_', float('nan'))),
+        'n_iter': int(getattr(model, 'n_iter_', 0)),
+        'factor_precision': factor_precision,
+        'factor_dtype': str(arrays['item_features'].dtype),
+    }
+    artifact_metadata.update(metadata or {})
+    try:
+        return save_model_artifact(root_dir, arrays, metadata=artifact_metadata, publish=publish)
+    except Exception as e:
+        logging.error(f"An error occurred while exporting the model artifact: {e}")
+        raise
+
+
 # Generate recommendations for a specific user
-def get_recommendations(user_features, item_features, user_id):
+@profiled()
+def get_recommendations(user_features, item_features, user_id, k=None, seen=None, blocked=None):
     try:
         # Ensure the user_id is within the correct range
         if user_id >= user_features.shape[0] or user_id < 0:
             logging.error(f"Invalid user_id: {user_id}. It must be between 0 and {user_features.shape[0] - 1}.")
             raise IndexError(f"User ID {user_id} is out of range.")
 
-        # Compute the recommendation scores
-        recommendations = np.dot(user_features, item_features)
+        # Compute the recommendation scores for this user only, with seen and blocklisted items masked
+        recommendations = np.dot(user_features[user_id], item_features)
+        mask_excluded_items(recommendations, user_id, seen, blocked)
 
-        # Sort items by their predicted interaction scores in descending order
-        recommended_items = recommendations[user_id].argsort()[::-1]
+        # Sort items by their predicted interaction scores in descending order, keeping the top k when given
+        if k is None:
+            recommended_items = recommendations.argsort()[::-1]
+        else:
+            recommended_items = select_top_k(recommendations, k)
+        recommended_items = recommended_items[recommendations[recommended_items] > EXCLUDED_SCORE]
         logging.info(f"Recommendations for user {user_id} generated successfully.")
         return recommended_items
     except IndexError as e:
@@ -77,6 +453,40 @@ def get_recommendations(user_features, item_features, user_id):
         raise
 
 
+# Compute every user's top-n items tile by tile, skipping seen and blocklisted items; returns the compact
+# table stored in the artifact (users with fewer than n eligible items get shorter lists)
+def precompute_top_n(user_features, item_features, n=100, block_size=1024, max_workers=None, seen=None,
+                     blocked=None):
+    n_users = user_features.shape[0]
+    n = min(n, item_features.shape[1])
+    logging.info(f"Precomputing top-{n} recommendations for {n_users} users...")
+    try:
+        table = np.empty((n_users, n), dtype=np.int32)
+
+        # Each tile scores block_size users at once, so peak memory is bounded by tiles in flight
+        def fill_tile(start):
+            scores = np.dot(user_features[start:start + block_size], item_features)
+            mask_excluded_items(scores, np.arange(start, start + len(scores)), seen, blocked)
+            top = select_top_k(scores, n)
+            top[np.take_along_axis(scores, top, axis=-1) == EXCLUDED_SCORE] = -1
+            table[start:start + block_size] = top
+
+        with ThreadPoolExecutor(max_workers=max_workers) as executor:
+            list(executor.map(fill_tile, range(0, n_users, block_size)))
+
+        logging.info("Top-n precomputation complete.")
+        # Excluded slots sort last in each row, so dropping them keeps every list in rank order
+        kept = table >= 0
+        offsets = np.zeros(n_users + 1, dtype=np.int64)
+        np.cumsum(kept.sum(axis=1), out=offsets[1:])
+        return {
+            'top_n_items': table[kept],
+            'top_n_offsets': offsets,
+        }
+    except Exception as e:
+        logging.error(f"An error occurred while precomputing recommendations: {e}")
+        raise
+
 if __name__ == "__main__":
     try:
         # Load behavior data from the provided path
@@ -84,15 +494,29 @@ if __name__ == "__main__":
         behavior_data = load_data(data_path)
 
         # Build the user-item interaction matrix
-        interaction_matrix = build_interaction_matrix(behavior_data)
+        interaction_matrix, user_ids, item_ids = build_interaction_matrix(behavior_data)
 
         # Train NMF model with configurable number of components
         n_components = int(os.getenv('NMF_COMPONENTS', 15))  # Default to 15 components
         model, user_features, item_features = train_nmf_model(interaction_matrix, n_components)
 
+        # Optionally build an approximate nearest-neighbour index over the item factors
+        extra_arrays = {}
+        ann_lists = int(os.getenv('ANN_INDEX_LISTS', 0))  # 0 disables the index
+        if ann_lists > 0:
+            from ann_index import build_ivf_index
+            extra_arrays.update(build_ivf_index(item_features, n_lists=ann_lists))
+
+        # Persist the model so the API and Lambda can memory-map it instead of retraining
+        artifact_dir = os.getenv('MODEL_ARTIFACT_DIR', 'model_artifacts')
+        export_model_artifact(artifact_dir, model, user_features, item_features, user_ids, item_ids,
+                              metadata={'data_path': data_path}, extra_arrays=extra_arrays,
+                              interaction_matrix=interaction_matrix)
+
         # Generate recommendations for a specific user (ID provided via environment variable or default to 0)
         user_id = int(os.getenv('USER_ID', 0))  # Default user ID to 0
-        recommended_items = get_recommendations(user_features, item_features, user_id)
+        top_k = int(os.getenv('TOP_K', 10))  # Default to the top 10 items
+        recommended_items = get_top_k(user_features, item_features, user_id, top_k)
 
         logging.info(f"Top recommended items for user {user_id}: {recommended_items}")
 
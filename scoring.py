@@ -0,0 +1,114 @@
+import logging
+import numpy as np
+from profiling import stage_timer
+
+# Initialize logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Scoring kernels for the serving path. This module only depends on NumPy, so the API and Lambda
+# can score without importing pandas, SciPy or scikit-learn.
+
+
+# Score given to excluded items; they sort last and are dropped from the results
+EXCLUDED_SCORE = -np.inf
+
+
+# Overwrite the scores of excluded items in place before top-k selection, so the score row is never copied.
+# seen=(indptr, indices) holds each user's interacted item columns (CSR of the training interactions);
+# blocked is a boolean mask over item columns. user_ids is one id for a 1-D score row, else one per row.
+def mask_excluded_items(scores, user_ids, seen=None, blocked=None):
+    if blocked is not None:
+        np.copyto(scores, EXCLUDED_SCORE, where=blocked)
+    if seen is None:
+        return scores
+    indptr, indices = seen
+    if scores.ndim == 1:
+        # Users added after the interactions were stored have no seen items
+        if user_ids + 1 < len(indptr):
+            scores[indices[indptr[user_ids]:indptr[user_ids + 1]]] = EXCLUDED_SCORE
+        return scores
+
+    user_ids = np.asarray(user_ids)
+    rows = np.flatnonzero(user_ids + 1 < len(indptr))
+    starts = indptr[user_ids[rows]]
+    lengths = indptr[user_ids[rows] + 1] - starts
+    # Positions of every seen entry of the batch, gathered without a Python loop
+    run_starts = np.repeat(starts - np.cumsum(lengths) + lengths, lengths)
+    positions = run_starts + np.arange(int(lengths.sum()))
+    scores[np.repeat(rows, lengths), indices[positions]] = EXCLUDED_SCORE
+    return scores
+
+
+# Select the indices of the k highest scores along the last axis, best first
+def select_top_k(scores, k):
+    n_items = scores.shape[-1]
+    k = min(k, n_items)
+    if k == n_items:
+        top = np.argsort(-scores, axis=-1)
+    else:
+        # Partial selection is O(items); only the k winners get fully sorted
+        top = np.argpartition(-scores, k - 1, axis=-1)[..., :k]
+        order = np.argsort(-np.take_along_axis(scores, top, axis=-1), axis=-1)
+        top = np.take_along_axis(top, order, axis=-1)
+    return top
+
+
+# Validate a batch of user ids against the user factor matrix
+def _check_user_ids(user_features, user_ids):
+    n_users = user_features.shape[0]
+    invalid = (user_ids < 0) | (user_ids >= n_users)
+    if invalid.any():
+        bad = int(user_ids[invalid][0])
+        logging.error(f"Invalid user_id: {bad}. It must be between 0 and {n_users - 1}.")
+        raise IndexError(f"User ID {bad} is out of range.")
+
+
+# Generate the top-k recommendations for a single user, skipping seen and blocklisted items
+def get_top_k(user_features, item_features, user_id, k=10, seen=None, blocked=None):
+    if k <= 0:
+        raise ValueError("k must be a positive integer.")
+    try:
+        if user_id >= user_features.shape[0] or user_id < 0:
+            logging.error(f"Invalid user_id: {user_id}. It must be between 0 and {user_features.shape[0] - 1}.")
+            raise IndexError(f"User ID {user_id} is out of range.")
+
+        # Score only the requested user's vector against every item
+        with stage_timer('score'):
+            scores = np.dot(user_features[user_id], item_features)
+            mask_excluded_items(scores, user_id, seen, blocked)
+        with stage_timer('sort'):
+            top = select_top_k(scores, k)
+            # Fewer than k items may be left after exclusion
+            return top[scores[top] > EXCLUDED_SCORE]
+    except IndexError as e:
+        logging.error(f"User ID is out of bounds: {e}")
+        raise
+    except Exception as e:
+        logging.error(f"An error occurred while generating top-k recommendations: {e}")
+        raise
+
+
+# Generate the top-k recommendations for several users with one matrix multiply; rows left with fewer than
+# k eligible items are padded with -1
+def get_top_k_batch(user_features, item_features, user_ids, k=10, seen=None, blocked=None):
+    if k <= 0:
+        raise ValueError("k must be a positive integer.")
+    try:
+        user_ids = np.asarray(user_ids, dtype=np.int64)
+        _check_user_ids(user_features, user_ids)
+
+        # One (batch x components) @ (components x items) product for the whole batch
+        with stage_timer('score'):
+            scores = np.dot(user_features[user_ids], item_features)
+            mask_excluded_items(scores, user_ids, seen, blocked)
+        with stage_timer('sort'):
+            top = select_top_k(scores, k)
+            if seen is not None or blocked is not None:
+                top[np.take_along_axis(scores, top, axis=-1) == EXCLUDED_SCORE] = -1
+            return top
+    except IndexError as e:
+        logging.error(f"User ID is out of bounds: {e}")
+        raise
+    except Exception as e:
+        logging.error(f"An error occurred while generating batched recommendations: {e}")
+        raise
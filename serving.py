@@ -0,0 +1,260 @@
+import os
+import time
+import queue
+import logging
+import threading
+from concurrent.futures import Future
+import numpy as np
+from scoring import get_top_k, get_top_k_batch
+from model_artifact import load_model_artifact
+from ann_index import ivf_index_from_artifact, search_ivf_index
+from quantization import quantized_index_from_artifact, quantized_top_k, quantized_top_k_batch
+from recommendation_cache import RecommendationCache
+
+# Initialize logging
+logging.basicConfig(level=logging.INFO, format='%(asctime)s - %(levelname)s - %(message)s')
+
+# Number of recommendations returned when the request does not specify k
+DEFAULT_TOP_K = int(os.getenv('TOP_K', 10))
+
+# IVF lists probed per request when the artifact has an ANN index (0 keeps exact scoring)
+DEFAULT_N_PROBE = int(os.getenv('ANN_N_PROBE', 0))
+
+# Drop items the user already interacted with (from the interactions stored with the model)
+EXCLUDE_SEEN_ITEMS = os.getenv('EXCLUDE_SEEN_ITEMS', 'True') == 'True'
+
+# Micro-batching: requests arriving within MICRO_BATCH_WAIT_MS are scored together, up to MICRO_BATCH_SIZE
+MICRO_BATCH_SIZE = int(os.getenv('MICRO_BATCH_SIZE', 64))
+MICRO_BATCH_WAIT_MS = float(os.getenv('MICRO_BATCH_WAIT_MS', 2.0))
+
+# Longest a request waits for its batch to be scored before it fails instead of hanging
+MICRO_BATCH_TIMEOUT = float(os.getenv('MICRO_BATCH_TIMEOUT', 5.0))
+
+# Process-wide model handle, loaded once under a lock
+_model_artifact = None
+_model_lock = threading.Lock()
+
+# Process-wide recommendation cache; in Lambda it survives across invocations of a warm container
+recommendation_cache = RecommendationCache()
+
+# Exclusion inputs of the served artifact, unpacked once per model version
+_exclusions = {}
+_exclusions_lock = threading.Lock()
+
+
+# Return the served model, opening the published artifact on first use (thread-safe, loads exactly once)
+def get_model_artifact():
+    global _model_artifact
+    artifact = _model_artifact
+    if artifact is None:
+        with _model_lock:
+            if _model_artifact is None:
+                artifact_dir = os.getenv('MODEL_ARTIFACT_DIR', 'model_artifacts')
+                logging.info(f"Loading model artifact from {artifact_dir}...")
+                _model_artifact = load_model_artifact(artifact_dir)
+                recommendation_cache.set_version(_model_artifact.version)
+                logging.info(f"Model version {_model_artifact.version} loaded.")
+            artifact = _model_artifact
+    return artifact
+
+
+# Replace the served model; requests already running keep the artifact they started with
+def set_model_artifact(artifact):
+    global _model_artifact
+    with _model_lock:
+        _model_artifact = artifact
+        recommendation_cache.set_version(artifact.version)
+    # Cached exclusions must not keep the replaced version's buffers alive
+    with _exclusions_lock:
+        for key in [key for key, (cached, _) in _exclusions.items() if cached is not artifact]:
+            del _exclusions[key]
+
+
+# Drop the served model, its cached recommendations and exclusions; the next request loads the published artifact
+def reset_model_artifact():
+    global _model_artifact
+    with _model_lock:
+        _model_artifact = None
+        recommendation_cache.set_version(None)
+    with _exclusions_lock:
+        _exclusions.clear()
+
+
+# The served model, or None while nothing has been loaded yet (never triggers a load)
+def active_model_artifact():
+    return _model_artifact
+
+
+# Return (seen, blocked) for an artifact: the CSR (indptr, indices) of each user's seen items and the boolean
+# blocklist mask, either None when unavailable or disabled
+def item_exclusions(artifact):
+    cached = _exclusions.get(id(artifact))
+    if cached is not None and cached[0] is artifact:
+        return cached[1]
+    seen = None
+    interactions = artifact.interactions
+    if EXCLUDE_SEEN_ITEMS and interactions is not None:
+        _, indices, indptr = interactions
+        seen = (indptr, indices)
+    exclusions = (seen, artifact.blocked_items)
+    with _exclusions_lock:
+        # Only the served versions are kept; a hot swap replaces the entry of the previous one
+        if len(_exclusions) >= 2:
+            _exclusions.clear()
+        _exclusions[id(artifact)] = (artifact, exclusions)
+    return exclusions
+
+
+# Validate a /recommend JSON payload; returns (user_id, k, n_probe) or raises ValueError with the client message
+def parse_recommend_request(payload):
+    if not isinstance(payload, dict) or 'user_id' not in payload:
+        raise ValueError('Invalid request format. Must provide user_id in JSON format.')
+    user_id = payload['user_id']
+    if not isinstance(user_id, int) or isinstance(user_id, bool) or user_id < 0:
+        raise ValueError('Invalid user_id. It must be a non-negative integer.')
+    k = payload.get('k', DEFAULT_TOP_K)
+    if not isinstance(k, int) or isinstance(k, bool) or k <= 0:
+        raise ValueError('Invalid k. It must be a positive integer.')
+    n_probe = payload.get('n_probe', DEFAULT_N_PROBE)
+    if not isinstance(n_probe, int) or isinstance(n_probe, bool) or n_probe < 0:
+        raise ValueError('Invalid n_probe. It must be a non-negative integer.')
+    return user_id, k, n_probe
+
+
+# Look up a user's precomputed top-k list; None when the table is missing, lacks the user or is too short
+def lookup_top_n(artifact, user_id, k):
+    offsets = artifact.arrays.get('top_n_offsets')
+    if offsets is None or user_id + 1 >= len(offsets):
+        return None
+    start, end = offsets[user_id], offsets[user_id + 1]
+    if end - start < k:
+        return None
+    return np.asarray(artifact.arrays['top_n_items'][start:start + k])
+
+
+# Recommend k items for a user: precomputed table first, then the ANN index or exact live scoring
+def recommend_for_user(artifact, user_id, k, n_probe=0):
+    if user_id >= artifact.n_users or user_id < 0:
+        raise IndexError(f"User ID {user_id} is out of range.")
+
+    recommendations = lookup_top_n(artifact, user_id, k)
+    if recommendations is not None:
+        return recommendations
+
+    seen, blocked = item_exclusions(artifact)
+    ann_index = ivf_index_from_artifact(artifact)
+    if ann_index is not None and n_probe > 0:
+        seen_items = None
+        if seen is not None and user_id + 1 < len(seen[0]):
+            seen_items = seen[1][seen[0][user_id]:seen[0][user_id + 1]]
+        return search_ivf_index(ann_index, artifact.user_features[user_id], k, n_probe, seen_items, blocked)
+    # Artifacts exported with int8 codes scan the codes and re-rank a short candidate list exactly
+    quantized = quantized_index_from_artifact(artifact)
+    if quantized is not None:
+        return quantized_top_k(quantized, artifact.user_features, artifact.item_features, user_id, k, seen, blocked)
+    return get_top_k(artifact.user_features, artifact.item_features, user_id, k, seen, blocked)
+
+
+
+# Cache key filters for a request; results differ between exact and approximate scoring
+def request_filters(n_probe):
+    return (('n_probe', n_probe),) if n_probe else ()
+
+
+# Recommend through the process-wide cache; `recommend` computes misses (e.g. a MicroBatcher's recommend)
+def cached_recommend(artifact, user_id, k, n_probe=0, recommend=recommend_for_user):
+    return recommendation_cache.get_or_compute(artifact.version, user_id, k,
+                                               lambda: recommend(artifact, user_id, k, n_probe),
+                                               request_filters(n_probe))
+
+
+# Collects concurrent exact-scoring requests for a few milliseconds and scores them in one matrix multiply
+class MicroBatcher:
+    def __init__(self, max_batch_size=MICRO_BATCH_SIZE, max_wait_ms=MICRO_BATCH_WAIT_MS, timeout=MICRO_BATCH_TIMEOUT):
+        self.max_batch_size = max_batch_size
+        self.max_wait = max_wait_ms / 1000.0
+        self.timeout = timeout
+        self._start_lock = threading.Lock()
+        self._pid = None
+
+    # Start the scoring thread on first use in each process; a pre-forking server imports the batcher in the
+    # parent, and threads (and queue locks held at fork time) do not carry over into the workers
+    def _ensure_started(self):
+        if self._pid == os.getpid():
+            return
+        with self._start_lock:
+            if self._pid != os.getpid():
+                self._queue = queue.Queue()
+                self._thread = threading.Thread(target=self._run, name='micro-batcher', daemon=True)
+                self._thread.start()
+                self._pid = os.getpid()
+
+    # Queue a request; the returned Future resolves to the user's top-k item indices
+    def submit(self, artifact, user_id, k):
+        self._ensure_started()
+        future = Future()
+        self._queue.put((artifact, user_id, k, future))
+        return future
+
+    # Answer a request like recommend_for_user, batching the requests that need live scoring
+    def recommend(self, artifact, user_id, k, n_probe=0):
+        if n_probe > 0 or lookup_top_n(artifact, user_id, k) is not None:
+            return recommend_for_user(artifact, user_id, k, n_probe)
+        return self.submit(artifact, user_id, k).result(timeout=self.timeout)
+
+    def _run(self):
+        while True:
+            batch = [self._queue.get()]
+            deadline = time.monotonic() + self.max_wait
+            while len(batch) < self.max_batch_size:
+                remaining = deadline - time.monotonic()
+                if remaining <= 0:
+                    break
+                try:
+                    batch.append(self._queue.get(timeout=remaining))
+                except queue.Empty:
+                    break
+            # The thread must outlive any single batch, or every later request in this worker would time out
+            try:
+                self._score(batch)
+            except Exception as e:
+                logging.error(f"An error occurred in the micro-batcher: {e}")
+
+    def _score(self, batch):
+        # Requests are grouped per model version, so a hot swap never mixes factors within one product
+        groups = {}
+        for request in batch:
+            # Skip requests cancelled while queued (timed out or client gone); the rest can no longer be cancelled
+            if not request[3].set_running_or_notify_cancel():
+                continue
+            groups.setdefault(id(request[0]), []).append(request)
+        for requests in groups.values():
+            artifact = requests[0][0]
+            valid = []
+            for request in requests:
+                _, user_id, _, future = request
+                if 0 <= user_id < artifact.n_users:
+                    valid.append(request)
+                else:
+                    future.set_exception(IndexError(f"User ID {user_id} is out of range."))
+            if not valid:
+                continue
+            try:
+                user_ids = [request[1] for request in valid]
+                seen, blocked = item_exclusions(artifact)
+                max_k = max(request[2] for request in valid)
+                quantized = quantized_index_from_artifact(artifact)
+                if quantized is not None:
+                    top = quantized_top_k_batch(quantized, artifact.user_features, artifact.item_features, user_ids,
+                                                max_k, seen, blocked)
+                else:
+                    top = get_top_k_batch(artifact.user_features, artifact.item_features, user_ids, max_k, seen,
+                                          blocked)
+                for row, (_, _, k, future) in zip(top, valid):
+                    # Rows are padded with -1 when exclusion leaves fewer items than the largest k
+                    future.set_result(row[row >= 0][:k])
+            except Exception as e:
+                logging.error(f"An error occurred while scoring a micro-batch: {e}")
+                for _, _, _, future in valid:
+                    if not future.done():
+                        future.set_exception(e)